@@ -0,0 +1,43 @@
+"""
+Memory held by a cohort's course names, read back from saved states.
+
+Every student takes the same handful of courses, as in a real cohort. Each
+student's record is decoded from the binary state format (as preloading does),
+and the decoded states are measured with tracemalloc, along with how many
+distinct name strings the courses hold. With the course catalog, every course
+with a name shares one copy of it.
+
+Usage:
+    python benchmarks/bench_catalog.py [student_count ...]
+"""
+import sys
+import time
+import tracemalloc
+
+from common import load_app
+
+COURSE_NAMES = ["cisc108", "math241", "phys207", "engl110", "chem103", "hist101", "econ151", "psyc100"]
+
+def main():
+    student_counts = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000]
+    app = load_app()
+    print(f"{len(COURSE_NAMES)} shared courses per student")
+    print(f"{'students':>9}{'KB held':>12}{'bytes/student':>15}{'name strings':>14}{'decode (ms)':>13}")
+    for student_count in student_counts:
+        encoded = []
+        for number in range(student_count):
+            state = app.State(f"student{number}", 0.0, 3.5, False,
+                              [app.Course(name, 3, 80.0 + number % 20, [80.0, 90.0]) for name in COURSE_NAMES], {})
+            encoded.append(app.encode_state(state))
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        states = [app.decode_state(data) for data in encoded]
+        elapsed = time.perf_counter() - start
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        names = len({id(course.course_name) for state in states for course in state.courses})
+        print(f"{student_count:>9}{held / 1000:>12,.0f}{held / student_count:>15,.0f}{names:>14,}{elapsed * 1000:>13.1f}")
+
+if __name__ == "__main__":
+    main()
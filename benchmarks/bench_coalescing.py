@@ -0,0 +1,49 @@
+"""
+Write throughput of bursty score posts, applied one request at a time vs. coalesced.
+
+Each burst is many small score posts for a few courses of one student, as the
+JSON API receives them. "per request" applies each post as its own batch (the
+behavior before write coalescing); "coalesced" buffers them and applies the
+burst as one batch, averaging each course and updating the GPA once.
+
+Usage:
+    python benchmarks/bench_coalescing.py [burst_size] [scores_per_course ...]
+"""
+import sys
+import time
+
+from common import load_app, make_state
+
+def timed(apply, state) -> float:
+    start = time.perf_counter()
+    apply(state)
+    return time.perf_counter() - start
+
+def main():
+    burst_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    history_sizes = [int(arg) for arg in sys.argv[2:]] or [10, 1_000, 10_000]
+    app = load_app()
+    requests = [[("add_score", f"course{i % 5}", str(50 + i % 50))] for i in range(burst_size)]
+
+    print(f"{'scores/course':>14}{'per request (scores/s)':>26}{'coalesced (scores/s)':>24}{'speedup':>10}")
+    for history_size in history_sizes:
+        def per_request(state):
+            for operations in requests:
+                app.apply_batch(state, operations)
+
+        def coalesced(state):
+            app.SAVED_STATES[state.student_name] = state
+            for operations in requests:
+                app.buffer_scores(state, operations)
+            app.flush_writes(state.student_name)
+
+        # a fresh state per run, built outside the timing
+        per_request_time, coalesced_time = (
+            min(timed(apply, make_state(app, 20, scores_per_course=history_size)) for _ in range(3))
+            for apply in (per_request, coalesced))
+        print(f"{history_size:>14}{burst_size / per_request_time:>26,.0f}{burst_size / coalesced_time:>24,.0f}"
+              f"{per_request_time / coalesced_time:>9.1f}x")
+    app.SAVED_STATES.clear()
+
+if __name__ == "__main__":
+    main()
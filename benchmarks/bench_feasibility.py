@@ -0,0 +1,51 @@
+"""
+Time to check target-GPA feasibility for a cohort across many course loads.
+
+"per student" works each student and scenario out on its own, view_progress
+style: total the student's courses, then try grades from the bottom of the
+scale until the target is reached. "sweep" is sweep_target_feasibility, which
+reads each student's totals once and handles a scenario in one pass over them.
+Both must agree on the minimum grade for every student and scenario.
+
+Usage:
+    python benchmarks/bench_feasibility.py [scenario_count] [student_count ...]
+"""
+import random
+import sys
+
+from common import best_time, load_app, make_state
+
+def check_per_student(app, states, remaining_credits) -> list[list]:
+    grades = []
+    for credits in remaining_credits:
+        row = []
+        for state in states:
+            points, taken = app.get_GPA_totals(state.courses)
+            row.append(next((grade for grade in range(101) if (points + app.get_grade_points(grade) * credits)
+                             >= state.target_GPA * (taken + credits) - 1e-6), None))
+        grades.append(row)
+    return grades
+
+def main():
+    scenario_count = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    student_counts = [int(arg) for arg in sys.argv[2:]] or [1_000, 5_000]
+    app = load_app()
+    remaining_credits = [3 * (number + 1) for number in range(scenario_count)]
+    print(f"{scenario_count} scenarios (3 to {remaining_credits[-1]} remaining credits), 8 courses per student")
+    print(f"{'students':>9}{'per student (s)':>18}{'sweep (s)':>12}{'speedup':>10}{'agree':>8}")
+    for student_count in student_counts:
+        rng = random.Random(0)
+        states = []
+        for number in range(student_count):
+            state = make_state(app, 8, scores_per_course=0, seed=number)
+            state.target_GPA = rng.choice([2.0, 2.5, 3.0, 3.5, 3.8])
+            states.append(state)
+        per_student_time = best_time(lambda: check_per_student(app, states, remaining_credits), repeat=1)
+        sweep_time = best_time(lambda: app.sweep_target_feasibility(states, remaining_credits), repeat=3)
+        agree = check_per_student(app, states, remaining_credits) == \
+            app.sweep_target_feasibility(states, remaining_credits).minimum_grades
+        print(f"{student_count:>9}{per_student_time:>18.3f}{sweep_time:>12.3f}{per_student_time / sweep_time:>9.1f}x"
+              f"{str(agree):>8}")
+
+if __name__ == "__main__":
+    main()
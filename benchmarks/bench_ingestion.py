@@ -0,0 +1,93 @@
+"""
+Interactive latency on the JSON API while bulk clients post test scores.
+
+Starts the API server, lets a few bulk clients post scores as fast as they
+can (backing off when told to retry later), and meanwhile times an
+interactive client reading a student's progress stats. Runs once with the
+rate limit effectively off and once with the default limits. The bulk clients
+all connect from 127.0.0.1, so they share one client's limit.
+
+Usage:
+    python benchmarks/bench_ingestion.py [seconds] [bulk_clients] [scores_per_request]
+"""
+import http.client
+import json
+import statistics
+import sys
+import threading
+import time
+
+from common import load_app
+
+def post(connection, path: str, data: dict) -> tuple:
+    connection.request("POST", path, body=json.dumps(data).encode())
+    response = connection.getresponse()
+    response.read()
+    return (response.status, response.getheader("Retry-After"))
+
+def run(app, port: int, seconds: float, bulk_clients: int, scores_per_request: int) -> dict:
+    """
+    Runs the bulk clients and the interactive reader against one server.
+
+    Returns:
+        dict: Interactive latency percentiles (ms) and how the bulk requests were answered.
+    """
+    stop = threading.Event()
+    statuses: dict[int, int] = {}
+
+    def bulk():
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        body = {"scores": [{"course_name": f"c{i % 20}", "score": 50 + i % 50} for i in range(scores_per_request)]}
+        while not stop.is_set():
+            status, retry_after = post(connection, "/api/students/Bench/scores", body)
+            statuses[status] = statuses.get(status, 0) + 1
+            if retry_after:
+                stop.wait(int(retry_after))
+
+    threads = [threading.Thread(target=bulk) for _ in range(bulk_clients)]
+    for thread in threads:
+        thread.start()
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    latencies = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        connection.request("GET", "/api/students/Bench")
+        connection.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return {"p50": statistics.median(latencies) * 1000, "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+            "statuses": dict(sorted(statuses.items()))}
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    bulk_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    scores_per_request = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    app = load_app()
+    server = app.start_api_server(0)
+    port = server.server_address[1]
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    post(connection, "/api/students", {"student_name": "Bench", "current_GPA": 3, "target_GPA": 3.5})
+    post(connection, "/api/students/Bench/batch",
+         {"operations": [["add_course", f"c{i}", 3, 80] for i in range(20)]})
+    # the server keeps the connection open, so a buffered score and a read can share it
+    assert post(connection, "/api/students/Bench/scores", {"course_name": "c0", "score": 80})[0] == 202
+    connection.request("GET", "/api/students/Bench/gpa")
+    response = connection.getresponse()
+    assert (response.status, json.loads(response.read())["GPA"]) == (200, 3.0)
+
+    limits = (app.RATE_LIMIT_PER_SECOND, app.RATE_LIMIT_BURST)
+    print(f"{'rate limit':<14}{'p50 (ms)':>10}{'p99 (ms)':>10}  bulk responses")
+    for label, (rate, burst) in [("off", (1e9, 1e9)), ("default", limits)]:
+        app.RATE_LIMIT_PER_SECOND, app.RATE_LIMIT_BURST = rate, burst
+        app.RATE_LIMITS.clear()
+        result = run(app, port, seconds, bulk_clients, scores_per_request)
+        print(f"{label:<14}{result['p50']:>10.2f}{result['p99']:>10.2f}  {result['statuses']}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Memory held by a long-running process as students keep adding scores, with and without retention.
+
+Each round posts a batch of scores to every student's courses, as a busy
+JSON API would, then runs the periodic memory check (whose report
+/debug/memory serves). Without a policy, memory grows with every round;
+with MAX_SCORES_PER_COURSE, long
+histories are archived to disk, but the undo steps for scores added after
+that are kept, so memory still grows; with fewer undo levels
+(MAX_UNDO_LEVELS), memory levels off. Grades are unchanged. The last setting adds a ceiling,
+which releases the largest students to disk.
+
+Usage:
+    python benchmarks/bench_memory.py [rounds] [student_count]
+"""
+import sys
+import tempfile
+import time
+
+from common import load_app
+
+COURSES = 5
+SCORES_PER_ROUND = 100
+
+def run(app, rounds: int, student_count: int, max_scores: int, undo_levels: int, ceiling_bytes: int) -> tuple:
+    """
+    Runs the rounds with the given policies.
+
+    Returns:
+        tuple: (tracked bytes after each round, seconds per score, GPAs of the students at the end)
+    """
+    # like the API, hold the lock the memory accounting thread takes
+    with tempfile.TemporaryDirectory() as state_dir, app.API_LOCK:
+        app.STATE_DIR, app.MAX_SCORES_PER_COURSE, app.MEMORY_CEILING_BYTES = state_dir, max_scores, ceiling_bytes
+        app.MAX_UNDO_LEVELS = undo_levels
+        app.SAVED_STATES.clear()
+        app.MEMORY_RECORDS.clear()
+        names = [f"student {chr(97 + number % 26)}{chr(97 + number // 26)}" for number in range(student_count)]
+        for name in names:
+            state = app.State("", 0.0, 4.0, True, [], {})
+            app.start_app(state, name, "3.0", "3.5")
+            app.apply_batch(state, [("add_course", f"c{course}", "3", "80") for course in range(COURSES)])
+        tracked = []
+        elapsed = 0.0
+        for round_number in range(rounds):
+            operations = [("add_score", f"c{number % COURSES}", str(50 + (number * 7 + round_number) % 50))
+                          for number in range(SCORES_PER_ROUND)]
+            start = time.perf_counter()
+            for name in names:
+                app.apply_batch(app.load_saved_state(name), operations)
+            elapsed += time.perf_counter() - start
+            tracked.append(app.check_memory()["tracked_bytes"])
+        GPAs = [app.load_saved_state(name).current_GPA for name in names]
+        app.SAVED_STATES.clear()
+        app.MEMORY_RECORDS.clear()
+        app.STATE_DIR, app.MAX_SCORES_PER_COURSE, app.MEMORY_CEILING_BYTES = "", 0, 0
+        app.MAX_UNDO_LEVELS = 500
+    return (tracked, elapsed / (rounds * student_count * SCORES_PER_ROUND), GPAs)
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    student_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    app = load_app()
+    print(f"{student_count} students, {COURSES} courses each, {SCORES_PER_ROUND} scores per student per round")
+    print(f"{'policy':>28}{'after 1 round (KB)':>20}{'after ' + str(rounds) + ' (KB)':>16}{'us/score':>10}{'same GPAs':>11}")
+    baseline_GPAs = None
+    for label, max_scores, undo_levels, ceiling_bytes in [("none", 0, 500, 0), ("max 50 scores per course", 50, 500, 0),
+                                                          ("+ 5 undo levels", 50, 5, 0), ("+ 1 MB ceiling", 50, 5, 1_000_000)]:
+        tracked, per_score, GPAs = run(app, rounds, student_count, max_scores, undo_levels, ceiling_bytes)
+        baseline_GPAs = baseline_GPAs or GPAs
+        print(f"{label:>28}{tracked[0] / 1000:>20,.0f}{tracked[-1] / 1000:>16,.0f}{per_score * 1e6:>10.1f}"
+              f"{str(GPAs == baseline_GPAs):>11}")
+
+if __name__ == "__main__":
+    main()
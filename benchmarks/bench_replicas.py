@@ -0,0 +1,91 @@
+"""
+Read throughput and staleness of the JSON API with read replicas (`--replicas M`).
+
+For each replica count, starts one writer behind the router, creates students,
+and has several client processes read progress stats for a few seconds. Then
+measures how long a change takes to show up in reads (at most about the
+staleness bound, ANALYZER_REPLICA_STALENESS, when replicas answer).
+
+Read scaling is bounded by the machine's cores.
+
+Usage:
+    python benchmarks/bench_replicas.py [seconds] [replica_count ...]
+"""
+import http.client
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+
+from bench_sharding import request, start_router, student_name, student_path
+
+STUDENT_COUNT = 64
+CLIENT_COUNT = 8
+
+def run_reader(port: int, client: int, seconds: float) -> int:
+    """
+    Reads progress stats for the client's share of the students until time runs out.
+
+    Returns:
+        int: How many reads were answered.
+    """
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    students = [student_path(number) for number in range(client, STUDENT_COUNT, CLIENT_COUNT)]
+    done = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        status, _ = request(connection, "GET", students[done % len(students)])
+        done += status == 200
+    return done
+
+def measure_staleness(connection, tries: int = 10) -> float:
+    """
+    Changes a grade and times how long until a read shows it, worst of several tries.
+
+    Returns:
+        float: Seconds.
+    """
+    worst = 0.0
+    for attempt in range(tries):
+        grade = 60 + attempt
+        request(connection, "PUT", student_path(0) + "/courses/art", {"grade": grade})
+        start = time.perf_counter()
+        while request(connection, "GET", student_path(0) + "/courses")[1]["courses"][-1]["grade"] != grade:
+            time.sleep(0.005)
+        worst = max(worst, time.perf_counter() - start)
+    return worst
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    replica_counts = [int(arg) for arg in sys.argv[2:]] or [0, 1, 3]
+    staleness = float(os.environ.get("ANALYZER_REPLICA_STALENESS", "1.0"))
+    print(f"{os.cpu_count()} cores, {STUDENT_COUNT} students, {CLIENT_COUNT} reader processes, "
+          f"staleness bound {staleness} s")
+    print(f"{'replicas':>9}{'reads/s':>12}{'speedup':>10}{'worst read lag (ms)':>22}")
+    baseline = None
+    for replica_count in replica_counts:
+        with tempfile.TemporaryDirectory() as state_dir:
+            router, port, connection = start_router(1, state_dir, ["--replicas", str(replica_count)])
+            try:
+                for number in range(STUDENT_COUNT):
+                    request(connection, "POST", "/api/students",
+                            {"student_name": student_name(number), "current_GPA": 3, "target_GPA": 3.5})
+                    request(connection, "POST", student_path(number) + "/batch",
+                            {"operations": [["add_course", f"c{course}", 3, 80] for course in range(10)]
+                             + [["add_score", f"c{course}", 90] for course in range(10)] + [["add_course", "art", 1, 50]]})
+                # let the first snapshot reach the replicas
+                time.sleep(staleness)
+                with multiprocessing.Pool(CLIENT_COUNT) as pool:
+                    answered = sum(pool.starmap(run_reader, [(port, client, seconds) for client in range(CLIENT_COUNT)]))
+                throughput = answered / seconds
+                baseline = baseline or throughput
+                lag = measure_staleness(connection)
+                print(f"{replica_count:>9}{throughput:>12.1f}{throughput / baseline:>9.2f}x{lag * 1000:>22.1f}")
+            finally:
+                router.send_signal(signal.SIGINT)
+                router.wait()
+
+if __name__ == "__main__":
+    main()
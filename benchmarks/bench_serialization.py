@@ -0,0 +1,52 @@
+"""
+Encode/decode speed and size of the binary State format vs. pickle and JSON.
+
+JSON has no dataclass support, so its encoder writes the same record fields as
+the binary format (courses as lists, plus all_test_scores) and its decoder
+rebuilds the State from them.
+
+Usage:
+    python benchmarks/bench_serialization.py [course_count ...]
+"""
+import json
+import pickle
+import sys
+
+from common import best_time, load_app, make_state
+
+def to_json(app, state) -> bytes:
+    return json.dumps({
+        "student_name": state.student_name, "current_GPA": state.current_GPA, "target_GPA": state.target_GPA,
+        "is_failing": state.is_failing, "terms": state.terms,
+        "courses": [[c.course_name, c.credits, c.current_grade, c.test_scores, c.term] for c in state.courses],
+        "all_test_scores": state.all_test_scores,
+    }).encode("utf-8")
+
+def from_json(app, data: bytes):
+    record = json.loads(data)
+    courses = [app.Course(name, credits, grade, scores, term) for name, credits, grade, scores, term in record["courses"]]
+    return app.State(record["student_name"], record["current_GPA"], record["target_GPA"], record["is_failing"],
+                     courses, record["all_test_scores"], record["terms"])
+
+def main():
+    course_counts = [int(arg) for arg in sys.argv[1:]] or [10, 1_000, 100_000]
+    app = load_app()
+    formats = [
+        ("binary", app.encode_state, app.decode_state),
+        ("pickle", lambda state: pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+        ("json", lambda state: to_json(app, state), lambda data: from_json(app, data)),
+    ]
+    print(f"{'courses':>8}  {'format':<8}{'size (KB)':>12}{'encode (ms)':>14}{'decode (ms)':>14}")
+    for course_count in course_counts:
+        state = make_state(app, course_count, scores_per_course=10)
+        repeat = 3 if course_count >= 100_000 else 5
+        number = 1 if course_count >= 1_000 else 100
+        for name, encode, decode in formats:
+            data = encode(state)
+            assert decode(data) == state
+            encode_time = best_time(lambda: encode(state), repeat, number)
+            decode_time = best_time(lambda: decode(data), repeat, number)
+            print(f"{course_count:>8}  {name:<8}{len(data) / 1024:>12.1f}{encode_time * 1000:>14.3f}{decode_time * 1000:>14.3f}")
+
+if __name__ == "__main__":
+    main()
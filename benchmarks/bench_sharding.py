@@ -0,0 +1,113 @@
+"""
+Throughput of the sharded JSON API (`main.py --production --shards N`) by worker count.
+
+For each worker count, starts the router and its workers, creates students
+through the router, and has several client processes post batches of scores
+for their own students for a few seconds. Then adds a worker and checks that
+every student's data survived the rebalance, and how many students moved.
+
+Scaling is bounded by the machine's cores: on a single core, more workers
+cannot help, which the report makes visible.
+
+Usage:
+    python benchmarks/bench_sharding.py [seconds] [worker_count ...]
+"""
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+from common import REPO_ROOT, load_app
+
+STUDENT_COUNT = 64
+CLIENT_COUNT = 8
+SCORES_PER_BATCH = 20
+
+def request(connection, method: str, path: str, data: dict = None) -> tuple:
+    connection.request(method, path, body=json.dumps(data).encode() if data is not None else None)
+    response = connection.getresponse()
+    return (response.status, json.loads(response.read()))
+
+def student_name(number: int) -> str:
+    # names are letters and spaces only
+    return f"student {chr(97 + number % 26)}{chr(97 + number // 26)}"
+
+def student_path(number: int) -> str:
+    return "/api/students/" + urllib.parse.quote(student_name(number))
+
+def run_client(port: int, client: int, seconds: float) -> int:
+    """
+    Posts score batches for the client's share of the students until time runs out.
+
+    Returns:
+        int: How many batches were applied.
+    """
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    operations = [["add_score", f"c{number % 10}", 50 + number % 50] for number in range(SCORES_PER_BATCH)]
+    students = [student_path(number) for number in range(client, STUDENT_COUNT, CLIENT_COUNT)]
+    done = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        status, _ = request(connection, "POST", students[done % len(students)] + "/batch", {"operations": operations})
+        done += status == 200
+    return done
+
+def start_router(worker_count: int, state_dir: str, extra_arguments: list[str] = []) -> tuple:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    environment = dict(os.environ, DRAFTER_SKIP="1", ANALYZER_API_PORT=str(port), ANALYZER_STATE_DIR=state_dir)
+    router = subprocess.Popen([sys.executable, "main.py", "--production", "--shards", str(worker_count)] + extra_arguments,
+                              cwd=REPO_ROOT, env=environment)
+    while True:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+            request(connection, "GET", "/api/ingestion")
+            return (router, port, connection)
+        except OSError:
+            time.sleep(0.1)
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    worker_counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+    app = load_app()
+    print(f"{os.cpu_count()} cores, {STUDENT_COUNT} students, {CLIENT_COUNT} client processes, "
+          f"{SCORES_PER_BATCH} scores per batch")
+    print(f"{'workers':>8}{'batches/s':>12}{'speedup':>10}{'moved on +1 worker':>22}{'data intact':>14}")
+    baseline = None
+    for worker_count in worker_counts:
+        with tempfile.TemporaryDirectory() as state_dir:
+            router, port, connection = start_router(worker_count, state_dir)
+            try:
+                for number in range(STUDENT_COUNT):
+                    request(connection, "POST", "/api/students",
+                            {"student_name": student_name(number), "current_GPA": 3, "target_GPA": 3.5})
+                    request(connection, "POST", student_path(number) + "/batch",
+                            {"operations": [["add_course", f"c{course}", 3, 80] for course in range(10)]})
+                with multiprocessing.Pool(CLIENT_COUNT) as pool:
+                    applied = sum(pool.starmap(run_client, [(port, client, seconds) for client in range(CLIENT_COUNT)]))
+                throughput = applied / seconds
+                baseline = baseline or throughput
+
+                before = [request(connection, "GET", student_path(number) + "/courses")[1] for number in range(STUDENT_COUNT)]
+                request(connection, "PUT", "/api/shards", {"count": worker_count + 1})
+                after = [request(connection, "GET", student_path(number) + "/courses")[1] for number in range(STUDENT_COUNT)]
+                names = [student_name(number) for number in range(STUDENT_COUNT)]
+                old_ring = app.make_ring([f"shard{number}" for number in range(worker_count)])
+                new_ring = app.make_ring([f"shard{number}" for number in range(worker_count + 1)])
+                moved = sum(app.find_shard(old_ring, name) != app.find_shard(new_ring, name) for name in names)
+                print(f"{worker_count:>8}{throughput:>12.1f}{throughput / baseline:>9.2f}x"
+                      f"{f'{moved}/{STUDENT_COUNT}':>22}{str(before == after):>14}")
+            finally:
+                router.send_signal(signal.SIGINT)
+                router.wait()
+
+if __name__ == "__main__":
+    main()
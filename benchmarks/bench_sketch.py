@@ -0,0 +1,74 @@
+"""
+Accuracy and memory of the approximate score sketches.
+
+Streams a skewed score dataset into one sketch per shard, merges the shards,
+and compares the merged sketch's percentiles, ranks, and histogram against the
+exact values from the sorted scores.
+
+Usage:
+    python benchmarks/bench_sketch.py [score_count] [shard_count] [k]
+"""
+import functools
+import random
+import sys
+import time
+
+from common import load_app
+
+def make_scores(count: int, seed: int = 0) -> list[float]:
+    """
+    Builds scores clustered in the 70s and 80s with a long low tail, rounded like typed scores.
+
+    Args:
+        count (int): How many scores to create.
+        seed (int): The random seed, so runs are repeatable.
+    Returns:
+        list[float]: The scores, in stream order.
+    """
+    rng = random.Random(seed)
+    return [round(min(100.0, max(0.0, 100 - rng.expovariate(1/18))), 1) for _ in range(count)]
+
+def main():
+    score_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    shard_count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    app = load_app()
+    scores = make_scores(score_count)
+
+    start = time.perf_counter()
+    shards = [app.ScoreSketch(k=k) for _ in range(shard_count)]
+    for i, score in enumerate(scores):
+        app.add_to_sketch(shards[i % shard_count], score)
+    merged = functools.reduce(app.merge_sketches, shards)
+    sketch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact = sorted(scores)
+    exact_seconds = time.perf_counter() - start
+
+    retained = sum(len(level) for level in merged.levels)
+    print(f"{score_count} scores in {shard_count} shards, k={k}")
+    print(f"sketch: {retained} retained items in {len(merged.levels)} levels "
+          f"(exact keeps {score_count}); ingest+merge {sketch_seconds:.2f}s, exact sort {exact_seconds:.2f}s")
+    print(f"count/sum/min/max exact: {merged.count == score_count and merged.minimum == exact[0] and merged.maximum == exact[-1]}"
+          f", mean error {abs(merged.total/merged.count - sum(scores)/score_count):.2e}")
+
+    print()
+    print(f"{'percentile':<12}{'exact':>10}{'sketch':>10}{'rank error':>12}")
+    worst = 0.0
+    for percent in [1, 5, 10, 25, 50, 75, 90, 95, 99]:
+        estimate = app.get_sketch_percentile(merged, percent)
+        # how far off the estimate is, measured in rank (the usual quantile-sketch error)
+        rank_error = abs(app.get_score_rank(exact, estimate) - percent)
+        worst = max(worst, rank_error)
+        print(f"{percent:<12}{app.get_percentile(exact, percent):>10}{estimate:>10}{rank_error:>11.2f}%")
+    print(f"worst rank error: {worst:.2f}%")
+
+    print()
+    print(f"{'bin':<12}{'exact':>10}{'sketch':>10}")
+    for name, exact_count, sketch_count in zip(["F", "D", "C", "B", "A"], app.get_histogram(exact),
+                                               app.get_sketch_histogram(merged)):
+        print(f"{name:<12}{exact_count:>10}{sketch_count:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Startup cost of the default and production start modes.
+
+Times `python main.py` (self-tests included) against `python main.py --production`
+in fresh processes with the server start skipped, breaks production startup
+down by module with `python -X importtime`, and times preloading saved states.
+
+Usage:
+    python benchmarks/bench_startup.py [saved_state_count]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import REPO_ROOT, load_app, make_state
+
+def run_main(arguments: list[str], environment: dict) -> tuple:
+    """
+    Runs main.py in a fresh interpreter with the server start skipped.
+
+    Args:
+        arguments (list[str]): Extra interpreter and script arguments.
+        environment (dict): The environment for the process.
+    Returns:
+        tuple: (wall time in seconds, the process's stderr)
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + arguments, cwd=REPO_ROOT, env=environment,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    return (time.perf_counter() - start, result.stderr)
+
+def parse_importtime(report: str) -> list[tuple]:
+    """
+    Reads `-X importtime` output into (module, self us, cumulative us, depth) rows.
+
+    Args:
+        report (str): The stderr of a `-X importtime` run.
+    Returns:
+        list[tuple]: One row per imported module.
+    """
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_time), int(cumulative), depth))
+    return rows
+
+def main():
+    state_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000
+    environment = dict(os.environ, DRAFTER_SKIP="1")
+
+    print("startup to server start, best of 5 runs (ms)")
+    for label, arguments in [("default (self-tests)", ["main.py"]), ("--production", ["main.py", "--production"])]:
+        best = min(run_main(arguments, environment)[0] for _ in range(5))
+        print(f"{label:<24}{best * 1000:>10.1f}")
+
+    _, report = run_main(["-X", "importtime", "main.py", "--production"], environment)
+    rows = parse_importtime(report)
+    packages: dict[str, int] = {}
+    for name, self_time, _, _ in rows:
+        packages[name.split(".")[0]] = packages.get(name.split(".")[0], 0) + self_time
+    print()
+    print("production import time by top-level package (self time, ms)")
+    for package, total in sorted(packages.items(), key=lambda item: -item[1])[:12]:
+        print(f"{package:<24}{total / 1000:>10.1f}")
+    print(f"{'total':<24}{sum(packages.values()) / 1000:>10.1f}")
+    print()
+    print("slowest top-level imports (cumulative, ms)")
+    for name, _, cumulative, _ in sorted((row for row in rows if row[3] == 0), key=lambda row: -row[2])[:8]:
+        print(f"{name:<24}{cumulative / 1000:>10.1f}")
+    # main.py only imports these inside load_compressors()
+    eager = [name for name in ["gzip", "brotli"] if name in packages]
+    print(f"compression modules imported at startup: {', '.join(eager) or 'none (deferred until first use)'}")
+
+    app = load_app()
+    with tempfile.TemporaryDirectory() as state_dir:
+        app.STATE_DIR = state_dir
+        for i in range(state_count):
+            state = make_state(app, 20, scores_per_course=10, seed=i)
+            state.student_name = f"student {i}"
+            app.save_state(state)
+        app.SAVED_STATES.clear()
+        start = time.perf_counter()
+        app.preload_states().join()
+        preload_seconds = time.perf_counter() - start
+        app.STATE_DIR = ""
+    print()
+    print(f"preloading {len(app.SAVED_STATES)} saved states (20 courses each) in the background: "
+          f"{preload_seconds * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Microbenchmark for the validate-once Course flags.
+
+Times the GPA read paths in main.py, which trust the valid_grade/valid_credits
+flags set when a grade or credits are written, against the validating helpers
+main.py used before (kept below, unchanged), which re-ran the
+None/isinstance/isfinite/int() checks on every read. Both must compute the
+same totals.
+
+Usage:
+    python benchmarks/bench_validation.py [course_count]
+"""
+import math
+import sys
+
+from common import best_time, load_app, make_state
+
+def validating_contribution(app, course) -> tuple:
+    """
+    The course's (grade points * credits, credits), checking the grade and credits on every read.
+    """
+    if course.current_grade is None or not isinstance(course.current_grade, (int, float)) or not math.isfinite(course.current_grade):
+        return (0.0, 0)
+    if course.credits is None:
+        return (0.0, 0)
+    try:
+        c = int(course.credits)
+    except (TypeError, ValueError):
+        return (0.0, 0)
+    if c < 0:
+        return (0.0, 0)
+    return (app.get_grade_points(course.current_grade) * c, c)
+
+def validating_GPA_totals(app, courses) -> tuple:
+    """
+    The (total grade points, total credits) of the courses, checking every course.
+    """
+    total_grade_points = 0
+    total_credits = 0
+    for course in courses:
+        points, c = validating_contribution(app, course)
+        total_grade_points += points
+        total_credits += c
+    return (total_grade_points, total_credits)
+
+def validating_update_GPA(app, state):
+    """
+    Sets the state's GPA and failing status from validating_GPA_totals.
+    """
+    if not state.courses:
+        return
+    total_grade_points, total_credits = validating_GPA_totals(app, state.courses)
+    state.current_GPA = 0.0 if total_credits == 0 else round(total_grade_points/total_credits, 2)
+    state.is_failing = state.current_GPA < 2.0
+
+def main():
+    course_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    app = load_app()
+    state = make_state(app, course_count, scores_per_course=0)
+    assert validating_GPA_totals(app, state.courses) == app.get_GPA_totals(state.courses)
+
+    print(f"{course_count} courses, best of 5 runs (ms)")
+    print(f"{'read path':<22}{'validating':>12}{'flags':>12}{'speedup':>9}")
+    cases = [
+        ("GPA totals", lambda: validating_GPA_totals(app, state.courses), lambda: app.get_GPA_totals(state.courses)),
+        ("update_GPA", lambda: validating_update_GPA(app, state), lambda: app.update_GPA(state)),
+    ]
+    for name, validating, flags in cases:
+        before = best_time(validating)
+        after = best_time(flags)
+        print(f"{name:<22}{before * 1000:>12.3f}{after * 1000:>12.3f}{before / after:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
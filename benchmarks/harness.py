@@ -0,0 +1,245 @@
+"""
+Differential test and benchmark harness for the analytics core.
+
+Generates random sequences of append_course / append_score / change_grade /
+delete_course calls, runs them through main.py and through a small reference
+model written from scratch below, and checks after each step (or every few
+steps for long runs) that:
+
+- the GPA and failing status match the reference computation,
+- all_test_scores holds exactly the scores in the Course.test_scores histories,
+- the highest/lowest course grade and test score match.
+
+It also times every operation type. --save writes the results to a JSON
+baseline; --check re-runs the baseline's sequences and fails if the behavior
+changed (the digest of the GPA after every step) or an operation got slower.
+Timings are compared relative to the reference model's, timed step by step
+alongside the app's (pure Python the app's changes never touch), so a
+baseline saved on one machine holds on another.
+
+Usage:
+    python benchmarks/harness.py [--sizes 1,10,100,1000,10000,100000] [--seed 0] [--save | --check]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+from common import REPO_ROOT, load_app
+
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines", "harness.json")
+OPERATIONS = ["append_course", "append_score", "change_grade", "delete_course"]
+# live courses are capped so long runs model a transcript rather than an ever-growing list
+MAX_COURSES = 200
+# an operation must be this much slower than its baseline, relative to the reference model, before --check fails
+SLOWDOWN_LIMIT = 1.5
+
+def make_operations(size: int, seed: int) -> list[tuple]:
+    """
+    Generates a random but repeatable operation sequence, with the form values as strings.
+
+    Args:
+        size (int): How many operations.
+        seed (int): The random seed.
+    Returns:
+        list[tuple]: Operations like ("append_score", "c12", "87.5").
+    """
+    rng = random.Random(seed)
+    names = []
+    operations = []
+    for _ in range(size):
+        kind = rng.choices(OPERATIONS, weights=[3, 8, 2, 1])[0] if names else "append_course"
+        if kind == "append_course" and len(names) >= MAX_COURSES:
+            kind = "append_score"
+        if kind == "append_course":
+            # occasionally reuse a name: the app allows duplicate course names
+            name = rng.choice(names) if names and rng.random() < 0.05 else f"c{len(operations)}"
+            names.append(name)
+            operations.append((kind, name, str(rng.randint(1, 5)), str(rng.randint(40, 100))))
+        elif kind == "append_score":
+            operations.append((kind, rng.choice(names), str(round(rng.uniform(0, 100), 1))))
+        elif kind == "change_grade":
+            operations.append((kind, rng.choice(names), str(rng.randint(40, 100))))
+        else:
+            name = rng.choice(names)
+            names = [other for other in names if other != name]
+            operations.append((kind, name))
+    return operations
+
+class Reference:
+    """
+    The expected behavior, kept deliberately naive: everything is recomputed from plain lists.
+    """
+    def __init__(self):
+        # [name, credits, grade, scores]
+        self.courses = []
+        self.all_test_scores = {}
+        self.GPA = 0.0
+        self.is_failing = True
+
+    def apply(self, kind: str, name: str, *values: str):
+        matching = [course for course in self.courses if course[0] == name]
+        if kind == "append_course":
+            self.courses.append([name, int(values[0]), float(values[1]), []])
+        elif kind == "append_score":
+            for course in matching:
+                course[3].append(float(values[0]))
+                self.all_test_scores.setdefault(name, []).append(float(values[0]))
+                course[2] = round(sum(course[3]) / len(course[3]), 2)
+        elif kind == "change_grade":
+            # grades computed from test scores cannot be overwritten
+            if not any(course[3] for course in matching):
+                for course in matching:
+                    course[2] = float(values[0])
+        else:
+            self.courses = [course for course in self.courses if course[0] != name]
+            self.all_test_scores.pop(name, None)
+        if self.courses:
+            points = sum(self.grade_points(grade) * credits for _, credits, grade, _ in self.courses)
+            credits = sum(credits for _, credits, _, _ in self.courses)
+            self.GPA = round(points / credits, 2)
+            self.is_failing = self.GPA < 2.0
+
+    @staticmethod
+    def grade_points(grade: float) -> float:
+        for cutoff, points in [(90, 4.0), (80, 3.0), (70, 2.0), (60, 1.0)]:
+            if grade >= cutoff:
+                return points
+        return 0.0
+
+def check_invariants(app, state, reference: Reference) -> list[str]:
+    """
+    Compares the app's state against the reference model.
+
+    Args:
+        app (module): The loaded main module.
+        state (State): The app's state.
+        reference (Reference): The reference model after the same operations.
+    Returns:
+        list[str]: A description of each broken invariant (empty if all hold).
+    """
+    problems = []
+    if (state.current_GPA, state.is_failing) != (reference.GPA, reference.is_failing):
+        problems.append(f"GPA {state.current_GPA}/{state.is_failing} != reference {reference.GPA}/{reference.is_failing}")
+    histories = {}
+    for course in state.courses:
+        if course.test_scores:
+            histories.setdefault(course.course_name, []).extend(course.test_scores)
+    if {name: sorted(scores) for name, scores in state.all_test_scores.items()} != \
+            {name: sorted(scores) for name, scores in histories.items()}:
+        problems.append("all_test_scores does not match the course histories")
+    if state.all_test_scores != reference.all_test_scores:
+        problems.append("all_test_scores does not match the reference")
+    grades = [course[2] for course in reference.courses]
+    high_course, low_course = app.get_derived(state, "course_extremes")
+    if (high_course and high_course.current_grade, low_course and low_course.current_grade) != \
+            ((max(grades), min(grades)) if grades else (None, None)):
+        problems.append("highest/lowest course does not match")
+    scores = [score for history in reference.all_test_scores.values() for score in history]
+    (highest, _), (lowest, _) = app.get_derived(state, "score_extremes")
+    if (highest, lowest) != ((f"{max(scores)}%", f"{min(scores)}%") if scores else (None, None)):
+        problems.append("highest/lowest test score does not match")
+    return problems
+
+def run(app, size: int, seed: int) -> dict:
+    """
+    Runs one operation sequence through the app and the reference, checking as it goes.
+
+    Args:
+        app (module): The loaded main module.
+        size (int): How many operations.
+        seed (int): The random seed.
+    Returns:
+        dict: The run's digest, final summary, per-operation timings, the reference model's mean
+        time per step, and any problems.
+    """
+    operations = make_operations(size, seed)
+    state = app.State("harness", 0.0, 3.5, True, [], {})
+    reference = Reference()
+    routes = {kind: getattr(app, kind) for kind in OPERATIONS}
+    # checking is O(state size), so long runs check about 200 times
+    check_every = max(1, size // 200)
+    timings = {kind: [0.0, 0] for kind in OPERATIONS}
+    reference_time = 0.0
+    digest = hashlib.sha256()
+    problems = []
+    for step, (kind, *values) in enumerate(operations, start=1):
+        start = time.perf_counter()
+        routes[kind](state, *values)
+        timings[kind][0] += time.perf_counter() - start
+        timings[kind][1] += 1
+        start = time.perf_counter()
+        reference.apply(kind, *values)
+        reference_time += time.perf_counter() - start
+        digest.update(f"{state.current_GPA};".encode())
+        if step % check_every == 0 or step == size:
+            problems.extend(f"step {step} ({kind} {values}): {problem}"
+                            for problem in check_invariants(app, state, reference))
+            if problems:
+                break
+    return {
+        "seed": seed,
+        "digest": digest.hexdigest(),
+        "final": {"GPA": state.current_GPA, "courses": len(state.courses),
+                  "scores": sum(len(scores) for scores in state.all_test_scores.values())},
+        "mean_us": {kind: round(total / count * 1e6, 2) for kind, (total, count) in timings.items() if count},
+        "reference_us": round(reference_time / step * 1e6, 2),
+        "problems": problems[:5],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1,10,100,1000,10000")
+    parser.add_argument("--seed", type=int, default=0)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    mode.add_argument("--check", action="store_true", help="compare against the saved baseline")
+    arguments = parser.parse_args()
+    app = load_app()
+
+    baseline = {}
+    if arguments.check:
+        with open(BASELINE_PATH) as file:
+            baseline = json.load(file)
+    sizes = [int(size) for size in baseline] if arguments.check else \
+        [int(size) for size in arguments.sizes.split(",")]
+
+    results = {}
+    failed = False
+    print(f"{'size':>8}  {'invariants':<12}" + "".join(f"{kind + ' (us)':>22}" for kind in OPERATIONS))
+    for size in sizes:
+        seed = baseline[str(size)]["seed"] if arguments.check else arguments.seed
+        result = run(app, size, seed)
+        results[str(size)] = result
+        status = "ok" if not result["problems"] else "FAILED"
+        print(f"{size:>8}  {status:<12}" + "".join(f"{result['mean_us'].get(kind, '-'):>22}" for kind in OPERATIONS))
+        for problem in result["problems"]:
+            print(f"    {problem}")
+        failed = failed or bool(result["problems"])
+        if arguments.check:
+            expected = baseline[str(size)]
+            if result["digest"] != expected["digest"] or result["final"] != expected["final"]:
+                print(f"    behavior changed: {result['final']} != baseline {expected['final']}")
+                failed = True
+            # the baseline's timings, scaled to how fast this machine ran the reference model
+            scale = result["reference_us"] / expected["reference_us"]
+            for kind, mean in result["mean_us"].items():
+                # tiny runs are too noisy to judge
+                if size >= 1000 and mean > SLOWDOWN_LIMIT * expected["mean_us"][kind] * scale:
+                    print(f"    {kind} slowed down: {mean} us vs. baseline {expected['mean_us'][kind] * scale:.2f} us "
+                          f"(scaled by reference {result['reference_us']} / {expected['reference_us']} us)")
+                    failed = True
+
+    if arguments.save:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+        print(f"saved baseline to {os.path.relpath(BASELINE_PATH, REPO_ROOT)}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,181 @@
-from dataclasses import dataclass
-from bakery import assert_equal
+from dataclasses import dataclass, field
 from drafter import *
+import array
+import bisect
+import collections
+import functools
+import hashlib
+import heapq
+import hmac
+import json
 import math
+import os
+import secrets
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+import weakref
 
-# styling
-add_website_css("""
-body {
-    background-color: #f5f5f5;
-    font-family: Arial, sans-serif;
-}
-h1 {
-    background-color: #2c3e50;
-    color: white;
-    padding: 20px;
-    text-align: center;
-    border-radius: 10px;
-    margin: 10px 0;
-}
-button {
-    background-color: #3498db;
-    color: white;
-    padding: 10px 20px;
-    margin: 5px;
-    border-radius: 5px;
-    font-weight: bold;
-    border: none;
-    cursor: pointer;
-}
-button:hover {
-    opacity: 0.8;
-}
-input, select {
-    padding: 8px;
-    margin: 5px 0;
-    border: 1px solid #ccc;
-    border-radius: 4px;
-    font-size: 14px;
-}
-""")
+# styling: served as a static file so browsers can cache it (with an ETag) instead of
+# receiving it inline with every page
+add_website_css_file("style.css")
+
+@dataclass
+class ScoreCategory:
+    weight: float
+    drop_lowest: bool = False
+    # running totals, so a new score updates the category average in O(1)
+    total: float = 0.0
+    count: int = 0
+    # min-heap of the category's scores, for dropping the lowest one
+    lowest: list[float] = field(default_factory=list)
+
+@dataclass
+class ScoreSketch:
+    # items kept in the top level before half of them are promoted to a new level; each level
+    # below keeps 2/3 as many as the one above it
+    k: int = 200
+    # exact summary statistics
+    count: int = 0
+    total: float = 0.0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+    # levels[h] holds sampled scores that each stand for 2**h scores
+    levels: list[list[float]] = field(default_factory=lambda: [[]])
+    compactions: int = 0
+
+def parse_grade(text: str) -> float:
+    """
+    Parses a grade or test score typed into a form.
+
+    Args:
+        text (str): The text to parse.
+    Returns:
+        float: The finite number, or None if the text is not a finite number.
+    """
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(value):
+        return None
+    return value
+
+def parse_whole_number(text: str) -> int:
+    """
+    Parses a whole number (such as a number of credits) typed into a form.
+
+    Args:
+        text (str): The text to parse.
+    Returns:
+        int: The number, or None if the text is not a whole number.
+    """
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+# course catalog
+# students share course names (thousands take "cisc108"), so each distinct name is stored once, in an
+# entry every Course with the name holds. An entry is dropped once nothing holds it, and ids are never reused.
+@dataclass(eq=False)
+class CatalogEntry:
+    course_id: int
+    course_name: str
+    # canonical credits, set with set_catalog_credits (None until then)
+    credits: int = None
+
+    # copies of a course share its entry
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+@dataclass
+class CourseCatalog:
+    # name -> entry, and id -> entry, for entries still held
+    by_name: weakref.WeakValueDictionary = field(default_factory=weakref.WeakValueDictionary)
+    by_id: weakref.WeakValueDictionary = field(default_factory=weakref.WeakValueDictionary)
+    # entries with canonical credits, kept even while no course holds them
+    pinned: dict[int, CatalogEntry] = field(default_factory=dict)
+    next_id: int = 0
+
+COURSE_CATALOG = CourseCatalog()
+# held only while adding a name, so API threads never give two names one id
+CATALOG_LOCK = threading.Lock()
+
+def get_catalog_entry(course_name: str) -> CatalogEntry:
+    """
+    Finds a course name's catalog entry, adding the name if it is new. The entry stays in the
+    catalog only as long as something holds it.
+
+    Args:
+        course_name (str): The course name.
+    Returns:
+        CatalogEntry: The entry.
+    """
+    entry = COURSE_CATALOG.by_name.get(course_name)
+    if entry is None:
+        with CATALOG_LOCK:
+            entry = COURSE_CATALOG.by_name.get(course_name)
+            if entry is None:
+                entry = CatalogEntry(COURSE_CATALOG.next_id, course_name)
+                COURSE_CATALOG.next_id += 1
+                COURSE_CATALOG.by_name[course_name] = entry
+                COURSE_CATALOG.by_id[entry.course_id] = entry
+    return entry
+
+def get_course_id(course_name: str) -> int:
+    """
+    Finds a course name's id in the catalog, adding the name if it is new.
+
+    Args:
+        course_name (str): The course name.
+    Returns:
+        int: The course's id.
+    """
+    return get_catalog_entry(course_name).course_id
+
+def get_catalog_credits(course_name: str) -> int:
+    """
+    Looks up a course's canonical credits, as set with set_catalog_credits.
+
+    Args:
+        course_name (str): The course name.
+    Returns:
+        int: The credits, or None if they were never set.
+    """
+    entry = COURSE_CATALOG.by_name.get(course_name)
+    return None if entry is None else entry.credits
+
+def set_catalog_credits(course_name: str, credits: int):
+    """
+    Sets a course's canonical credits (what the course is worth in the catalog, whatever each student
+    entered), or clears them. Each student's own credits still count toward their GPA.
+
+    Args:
+        course_name (str): The course name.
+        credits (int): Whole credits from 0 to MAX_CREDITS, or None to clear them.
+    Returns:
+        None
+    """
+    if credits is not None and (not isinstance(credits, int) or isinstance(credits, bool)
+                                or not 0 <= credits <= MAX_CREDITS):
+        raise ValueError(f"Credits must be a whole number from 0 to {MAX_CREDITS}.")
+    entry = get_catalog_entry(course_name) if credits is not None else COURSE_CATALOG.by_name.get(course_name)
+    if entry is None:
+        return
+    entry.credits = credits
+    if credits is None:
+        COURSE_CATALOG.pinned.pop(entry.course_id, None)
+    else:
+        COURSE_CATALOG.pinned[entry.course_id] = entry
+
+# the most credits a course can carry; more is treated as a typo (and would not fit the binary format)
+MAX_CREDITS = 100
 
 @dataclass
 class Course:
@@ -45,6 +183,101 @@ class Course:
     credits: int
     current_grade: float
     test_scores: list[float]
+    # "" means the course is not tagged with a term (the term in progress)
+    term: str = ""
+    # weighted score categories (e.g. exams, quizzes, homework); empty means a plain average
+    categories: dict[str, ScoreCategory] = field(default_factory=dict)
+    # in approximate mode, new scores go into this sketch instead of test_scores
+    sketch: ScoreSketch = None
+    # validated once when the grade or credits are written, so reads can trust the flags
+    valid_grade: bool = field(init=False, compare=False, repr=False)
+    valid_credits: bool = field(init=False, compare=False, repr=False)
+    # the name's COURSE_CATALOG entry, set with the name (None for a name that is not a string)
+    catalog_entry: CatalogEntry = field(init=False, compare=False, repr=False)
+
+    @property
+    def course_id(self) -> int:
+        return None if self.catalog_entry is None else self.catalog_entry.course_id
+
+    def __setattr__(self, name, value):
+        if name == "course_name":
+            # keep the catalog's copy of the name, shared by every course with it
+            entry = get_catalog_entry(value) if isinstance(value, str) else None
+            if entry is not None:
+                value = entry.course_name
+            object.__setattr__(self, "catalog_entry", entry)
+        elif name == "current_grade":
+            # normalize ints to floats and flag missing or non-finite grades
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+            if valid:
+                value = float(value)
+            object.__setattr__(self, "valid_grade", valid)
+        elif name == "credits":
+            # normalize numeric strings to ints and flag unusable credits
+            if not isinstance(value, int) or isinstance(value, bool):
+                value = parse_whole_number(value) if isinstance(value, (str, float)) else None
+            object.__setattr__(self, "valid_credits", value is not None and 0 <= value <= MAX_CREDITS)
+        object.__setattr__(self, name, value)
+
+@dataclass
+class Suggestions:
+    ready: bool = False
+    # by id(course), so courses that share a name keep their own
+    course_features: dict[int, dict] = field(default_factory=dict)
+    course_results: dict[int, dict[str, str]] = field(default_factory=dict)
+    state_features: dict = field(default_factory=dict)
+    state_results: dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class TermLedger:
+    ready: bool = False
+    order: list[str] = field(default_factory=list)
+    position: dict[str, int] = field(default_factory=dict)
+    points: list[float] = field(default_factory=list)
+    credits: list[int] = field(default_factory=list)
+    prefix_points: list[float] = field(default_factory=list)
+    prefix_credits: list[int] = field(default_factory=list)
+    # prefix sums are up to date for every position up to and including this one
+    clean_through: int = -1
+
+@dataclass
+class ScoreIndex:
+    ready: bool = False
+    # every test score kept sorted, per course and across all courses
+    by_course: dict[str, list[float]] = field(default_factory=dict)
+    all_scores: list[float] = field(default_factory=list)
+
+@dataclass
+class DerivedValues:
+    # derived fields that must be recomputed before their next read (all of them at first)
+    dirty: set[str] = field(default_factory=lambda: set(DERIVED_FIELDS))
+    values: dict[str, object] = field(default_factory=dict)
+    # during a batch: courses changed (id -> (course, contribution before the batch)) and removed
+    deferred: bool = False
+    pending_changes: dict[int, tuple] = field(default_factory=dict)
+    pending_removals: list[tuple] = field(default_factory=list)
+    # during a batch: courses whose average must be recomputed from their test scores (id -> course)
+    pending_grades: dict[int, Course] = field(default_factory=dict)
+
+@dataclass
+class Edit:
+    # the route call that made the change, so it can be redone
+    route: str
+    arguments: tuple
+    # only what the change touched, so undoing it never needs a copy of the whole State
+    inverse: dict
+
+# undo levels kept per student; in a long-running server each level of a large batch holds all its inverses
+MAX_UNDO_LEVELS = int(os.environ.get("ANALYZER_MAX_UNDO_LEVELS", "500"))
+
+@dataclass
+class EditHistory:
+    done: collections.deque = field(default_factory=lambda: collections.deque(maxlen=MAX_UNDO_LEVELS))
+    undone: list[Edit] = field(default_factory=list)
+    # set while a redo re-runs a route, so the redo list is kept
+    replaying: bool = False
+    # changes recorded so far (done only keeps the last MAX_UNDO_LEVELS)
+    edit_count: int = 0
 
 @dataclass
 class State:
@@ -54,8 +287,134 @@ class State:
     is_failing: bool
     courses: list[Course]
     all_test_scores: dict[str, list[float]]
+    # term names in chronological order
+    terms: list[str] = field(default_factory=list)
+    # keep bounded-memory score sketches instead of full score histories
+    approximate_scores: bool = False
+    # the k of every course's sketch in approximate mode
+    sketch_k: int = 200
+    # derived caches are not part of the student's record
+    suggestions: Suggestions = field(default_factory=Suggestions, compare=False, repr=False)
+    term_ledger: TermLedger = field(default_factory=TermLedger, compare=False, repr=False)
+    score_index: ScoreIndex = field(default_factory=ScoreIndex, compare=False, repr=False)
+    derived: DerivedValues = field(default_factory=DerivedValues, compare=False, repr=False)
+    history: EditHistory = field(default_factory=EditHistory, compare=False, repr=False)
+    # how far below target the last GPA update left the student, in ALERT_DRIFT_STEPs (None before the first)
+    alert_level: int = field(default=None, compare=False, repr=False)
+
+# payload accounting
+PAYLOAD_BUDGET_BYTES = 16_000
+COMPRESSION_THRESHOLD_BYTES = 1_024
+MAX_LISTED_SCORES = 20
+
+@dataclass
+class PayloadStats:
+    requests: int = 0
+    total_bytes: int = 0
+    max_bytes: int = 0
+    over_budget: int = 0
+
+PAYLOAD_STATS: dict[str, PayloadStats] = {}
+
+def get_payload_size(page: Page) -> int:
+    """
+    Approximates how many bytes a page sends by measuring the text of each content item.
+
+    Args:
+        page (Page): The page returned by a route.
+    Returns:
+        int: The approximate size of the page's content in bytes.
+    """
+    if isinstance(page.content, list):
+        return sum(len(str(item).encode("utf-8")) for item in page.content)
+    return len(str(page.content).encode("utf-8"))
+
+def track_payload(route_function):
+    """
+    Wraps a route so the size of every page it returns is recorded in PAYLOAD_STATS.
+
+    Args:
+        route_function: The route function to measure.
+    Returns:
+        The wrapped route function.
+    """
+    @functools.wraps(route_function)
+    def measured_route(*args, **kwargs):
+        page = route_function(*args, **kwargs)
+        if isinstance(page, Page):
+            size = get_payload_size(page)
+            stats = PAYLOAD_STATS.setdefault(route_function.__name__, PayloadStats())
+            stats.requests += 1
+            stats.total_bytes += size
+            stats.max_bytes = max(stats.max_bytes, size)
+            if size > PAYLOAD_BUDGET_BYTES:
+                stats.over_budget += 1
+        return page
+    return measured_route
+
+# the students in SAVED_STATES are shared by the UI routes, the JSON API, and background threads, which
+# all hold this lock to read or change them (reentrant, since API requests call routes)
+API_LOCK = threading.RLock()
+
+def hold_api_lock(route_function):
+    """
+    Wraps a route so it runs with API_LOCK held, like a JSON API request, so UI and API changes
+    to the same student (and the derived values they read) never interleave. Scores the API has
+    buffered for the student are applied before the route runs.
+
+    Args:
+        route_function: The route function to wrap.
+    Returns:
+        The wrapped route function.
+    """
+    @functools.wraps(route_function)
+    def locked_route(state: State, *args, **kwargs):
+        with API_LOCK:
+            # scores the API buffered for this student are applied first, so the page shows every accepted score
+            if state.student_name:
+                flush_writes(state.student_name)
+            return route_function(state, *args, **kwargs)
+    return locked_route
+
+@functools.cache
+def load_compressors() -> tuple:
+    """
+    Imports the compression modules the first time they are needed instead of at startup.
+
+    Returns:
+        tuple: (the gzip module, the brotli module or None if it is not installed)
+    """
+    import gzip
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    return (gzip, brotli)
+
+def compress_payload(body: bytes, accept_encoding: str = "gzip") -> tuple:
+    """
+    Compresses a large response body with the best encoding the client accepts.
+    Small bodies are returned unchanged since compressing them saves almost nothing.
+
+    Args:
+        body (bytes): The response body.
+        accept_encoding (str): The client's Accept-Encoding header.
+    Returns:
+        tuple: (the possibly compressed body, the Content-Encoding used or None)
+    """
+    if len(body) < COMPRESSION_THRESHOLD_BYTES:
+        return (body, None)
+    gzip, brotli = load_compressors()
+    accepted = [encoding.split(";")[0].strip() for encoding in accept_encoding.split(",")]
+    if brotli is not None and "br" in accepted:
+        return (brotli.compress(body), "br")
+    if "gzip" in accepted:
+        return (gzip.compress(body, compresslevel=6), "gzip")
+    return (body, None)
 
 @route
+@hold_api_lock
+@track_payload
 def index(state: State) -> Page:
     """
     Home page showing welcome message, current GPA, and navigation buttons.
@@ -79,10 +438,19 @@ def index(state: State) -> Page:
             Button("Remove Course", "/remove_course"),
             Button("View Courses", "/view_courses"),
             Button("Add Test Score", "/add_test_score"),
-            Button("View Progress", "/view_progress")]
+            Button("View Progress", "/view_progress"),
+            Button("What If?", "/what_if"),
+            Button("Study Suggestions", "/view_suggestions"),
+            Button("Term History", "/view_terms"),
+            Button("Score Distribution", "/view_distribution"),
+            Button("Batch Edit", "/batch_edit"),
+            Button("Undo", "/undo"),
+            Button("Redo", "/redo")]
     )
 
 @route
+@hold_api_lock
+@track_payload
 def add_course(state: State) -> Page:
     """
     Page to add a new course with input fields for course name, credits, and current grade.
@@ -98,13 +466,16 @@ def add_course(state: State) -> Page:
             "Name of Course:", TextBox(name="course_name"),
             "Number of Credits:", TextBox(name="credits", default_value=3),
             "Current Grade:", TextBox(name="current_grade", default_value=100.0),
+            "Term (leave blank for the current term):", TextBox(name="term"),
             Button(text="Add Course", url="/append_course"),
             Button(text="Cancel", url="/index")
         ]
     )
 
 @route
-def append_course(state: State, course_name: str, credits: str, current_grade: str) -> Page:
+@hold_api_lock
+@track_payload
+def append_course(state: State, course_name: str, credits: str, current_grade: str, term: str = "") -> Page:
     """
     Appends a new course to the state after validating inputs.
 
@@ -113,17 +484,14 @@ def append_course(state: State, course_name: str, credits: str, current_grade: s
         course_name (str): The name of the course to be added.
         credits (str): The number of credits for the course.
         current_grade (str): The current grade for the course.
+        term (str): The term the course was taken in ("" for the current term).
     Returns:
         Page: The updated home page after adding the course or an error message if inputs are invalid.
     """
     # check for valid inputs
-    try:
-        course_credits = int(credits)
-        course_grade = float(current_grade)
-        # ensure numeric grade is finite
-        if not math.isfinite(course_grade):
-            raise ValueError()
-    except:
+    course_credits = parse_whole_number(credits)
+    course_grade = parse_grade(current_grade)
+    if course_credits is None or course_grade is None:
         return Page(
             state,
             content=["Invalid input(s). Please try again.",
@@ -131,21 +499,22 @@ def append_course(state: State, course_name: str, credits: str, current_grade: s
              Button("Go to Home", "/index")]
         )
 
-    # Reject non-positive credits to avoid zero-division later
-    if course_credits <= 0:
+    # Reject non-positive credits to avoid zero-division later, and implausibly large ones
+    if not 0 < course_credits <= MAX_CREDITS:
         return Page(
             state,
-            content=["Credits must be a positive integer.",
+            content=[f"Credits must be a whole number from 1 to {MAX_CREDITS}.",
              Button("Add Course", "/add_course"),
              Button("Go to Home", "/index")]
         )
 
-    new_course = Course(course_name, course_credits, course_grade, [])
-    state.courses.append(new_course)
-    update_GPA(state)
+    inverse = insert_course(state, course_name, course_credits, course_grade, term)
+    record_edit(state, "append_course", (course_name, credits, current_grade, term), inverse)
     return index(state)
 
 @route
+@hold_api_lock
+@track_payload
 def remove_course(state: State) -> Page:
     """
     Page to remove an existing course by specifying its name.
@@ -165,6 +534,8 @@ def remove_course(state: State) -> Page:
     )
 
 @route
+@hold_api_lock
+@track_payload
 def delete_course(state: State, course_name: str) -> Page:
     """
     Deletes a course from the state based on the provided course name.
@@ -175,12 +546,14 @@ def delete_course(state: State, course_name: str) -> Page:
     Returns:
         Page: The updated home page after removing the course.
     """
-    # remove all matching courses (safe to build a new list instead of removing in-place)
-    state.courses = [c for c in state.courses if c.course_name != course_name]
-    update_GPA(state)
+    inverse = remove_courses(state, course_name)
+    if inverse is not None:
+        record_edit(state, "delete_course", (course_name,), inverse)
     return index(state)
 
 @route
+@hold_api_lock
+@track_payload
 def view_courses(state: State) -> Page:
     """
     Page to view all added courses along with their details.
@@ -197,6 +570,9 @@ def view_courses(state: State) -> Page:
              Button("Add Course", "/add_course"),
              Button("Go to Home", "/index")]
         )
+    # long course lists are shown a page at a time
+    if len(state.courses) > MAX_FULL_COURSE_LIST:
+        return browse_courses(state)
     
     course_names: list[str] = []
     course_credits: list[int] = []
@@ -207,7 +583,11 @@ def view_courses(state: State) -> Page:
         course_names.append(f"{course.course_name}: {get_letter_grade(course)}")
         course_credits.append(course.credits)
         course_grades.append(course.current_grade)
-        course_test_scores.append(f"{course.course_name} scores: {course.test_scores}")
+        # long score histories are summarized instead of sent in full
+        if len(course.test_scores) > MAX_LISTED_SCORES:
+            course_test_scores.append(f"{course.course_name} scores: {summarize_scores(course.test_scores)}")
+        else:
+            course_test_scores.append(f"{course.course_name} scores: {course.test_scores}")
             
     return Page(
         state,
@@ -228,8 +608,8 @@ def get_letter_grade(course: Course) -> str:
     Returns:
         str: The letter grade corresponding to the numeric grade.
     """
-    # Be defensive: handle missing or non-finite grades
-    if course.current_grade is None or not isinstance(course.current_grade, (int, float)) or not math.isfinite(course.current_grade):
+    # missing or non-finite grades were flagged when they were set
+    if not course.valid_grade:
         return "N/A"
 
     # Use the numeric grade for mapping
@@ -247,6 +627,8 @@ def get_letter_grade(course: Course) -> str:
     return "N/A"
 
 @route
+@hold_api_lock
+@track_payload
 def update_grade(state: State) -> Page:
     """
     Page to update the grade of an existing course.
@@ -256,7 +638,7 @@ def update_grade(state: State) -> Page:
     Returns:
         Page: The page with input fields to update a course's grade.
     """
-    courses_names: list[str] = [course.course_name for course in state.courses]
+    courses_names: list[str] = get_derived(state, "course_names")
     return Page(
         state,
         content=[
@@ -268,6 +650,8 @@ def update_grade(state: State) -> Page:
     )
 
 @route
+@hold_api_lock
+@track_payload
 def change_grade(state: State, updated_course: str, new_grade: str):
     """
     Updates the grade of a specified course after validating the input.
@@ -280,11 +664,8 @@ def change_grade(state: State, updated_course: str, new_grade: str):
         Page: The updated home page after changing the course grade or an error message if input is
     """
     # check valid input
-    try:
-        float_grade = float(new_grade)
-        if not math.isfinite(float_grade):
-            raise ValueError()
-    except:
+    float_grade = parse_grade(new_grade)
+    if float_grade is None:
         return Page(
             state,
             content=["Invalid grade input. Please try again.",
@@ -292,12 +673,22 @@ def change_grade(state: State, updated_course: str, new_grade: str):
              Button("Go to Home", "/index")]
         )
     for course in state.courses:
-        if course.course_name == updated_course:
-            course.current_grade = float_grade
-            update_GPA(state)
+        if course.course_name == updated_course and has_recorded_scores(course):
+            # the grade is derived from the scores; overwriting it would leave the two out of sync
+            return Page(
+                state,
+                content=[f"The grade for {updated_course} is computed from its test scores. Please add a test score instead.",
+                 Button("Add Test Score", "/add_test_score"),
+                 Button("Go to Home", "/index")]
+            )
+    inverse = set_grade(state, updated_course, float_grade)
+    if inverse is not None:
+        record_edit(state, "change_grade", (updated_course, new_grade), inverse)
     return index(state)
 
 @route
+@hold_api_lock
+@track_payload
 def add_test_score(state: State) -> Page:
     """
     Page to add a test score for an existing course.
@@ -314,19 +705,23 @@ def add_test_score(state: State) -> Page:
              Button("Add Course", "/add_course"),
              Button("Go to Home", "/index")]
         )
-    courses_names: list[str] = [course.course_name for course in state.courses]
+    courses_names: list[str] = get_derived(state, "course_names")
     return Page(
         state,
         content=[
             "Which course is this test score for?", SelectBox(name="course_for_score", options=courses_names),
             "What is the test score?", TextBox(name="test_score"),
+            "Score category (only for courses with categories):", TextBox(name="score_category"),
             Button(text="Add Test Score", url="/append_score"),
+            Button(text="Add Score Category", url="/add_category"),
             Button(text="Cancel", url="/index")
         ]
     )
 
 @route
-def append_score(state: State, course_for_score: str, test_score: str):
+@hold_api_lock
+@track_payload
+def append_score(state: State, course_for_score: str, test_score: str, score_category: str = ""):
     """
     Appends a test score to the specified course after validating the input.
 
@@ -334,33 +729,32 @@ def append_score(state: State, course_for_score: str, test_score: str):
         state (State): The current state of the application.
         course_for_score (str): The name of the course to which the test score will be added.
         test_score (str): The test score to be added.
+        score_category (str): The score category, for courses graded by weighted categories.
     Returns:
         Page: The updated home page after adding the test score or an error message if input is
     """
     # check valid input
-    try:
-        float_score = float(test_score)
-        if not math.isfinite(float_score):
-            raise ValueError()
-    except:
+    float_score = parse_grade(test_score)
+    if float_score is None:
         return Page(
             state,
             content=["Invalid test score input. Please try again.",
              Button("Add Test Score", "/add_test_score"),
              Button("Go to Home", "/index")]
         )
-    
+    score_category = score_category.strip()
     for course in state.courses:
-        if course.course_name == course_for_score:
-            course.test_scores.append(float_score)
-            if course.course_name not in state.all_test_scores:
-                state.all_test_scores[course.course_name] = [float_score]
-            else:
-                state.all_test_scores[course.course_name].append(float_score)
-            # update course grade and GPA
-            # defensive: ensure len > 0 (it will be > 0 because we just appended)
-            course.current_grade = round(sum(course.test_scores)/len(course.test_scores), 2)
-            update_GPA(state)
+        if course.course_name == course_for_score and (score_category or course.categories) and score_category not in course.categories:
+            return Page(
+                state,
+                content=[f"'{score_category}' is not a score category of {course_for_score}.",
+                 Button("Add Test Score", "/add_test_score"),
+                 Button("Go to Home", "/index")]
+            )
+    
+    inverse = insert_score(state, course_for_score, float_score, score_category)
+    if inverse is not None:
+        record_edit(state, "append_score", (course_for_score, test_score, score_category), inverse)
     
     return index(state)
 
@@ -373,48 +767,274 @@ def update_GPA(state: State):
     Returns:
         None
     """
-    if not state.courses:
+    if state.derived.deferred:
+        # recomputed once by finish_updates
         return
-    total_grade_points = 0
-    total_credits = 0
-    for course in state.courses:
-        # defensive: skip courses with missing or non-finite grade or credits
-        if course.current_grade is None or not isinstance(course.current_grade, (int, float)) or not math.isfinite(course.current_grade):
-            continue
-        if course.credits is None:
-            continue
+    was_failing = state.is_failing
+    if state.courses:
+        total_grade_points, total_credits = get_GPA_totals(state.courses)
 
-        if course.current_grade >= 90:
-            course_grade_points = 4.0
-        elif course.current_grade >= 80:
-            course_grade_points = 3.0
-        elif course.current_grade >= 70:
-            course_grade_points = 2.0
-        elif course.current_grade >= 60:
-            course_grade_points = 1.0
+        # Avoid division by zero: if there are no valid credits, set GPA to 0.0
+        if total_credits == 0:
+            state.current_GPA = 0.0
         else:
-            course_grade_points = 0.0
-        # defensive: ensure credits are numeric and non-negative
-        try:
-            c = int(course.credits)
-        except:
-            continue
-        if c < 0:
-            continue
+            state.current_GPA = round(total_grade_points/total_credits, 2)
+        state.is_failing = state.current_GPA < 2.0
+    mark_changed(state, "grades")
+    mark_changed(state, "GPA")
+    update_cohort(state)
+    check_alerts(state, was_failing)
+
+def get_grade_points(grade: float) -> float:
+    """
+    Converts a numeric course grade to grade points on the 4.0 scale.
+
+    Args:
+        grade (float): The numeric course grade.
+    Returns:
+        float: The grade points earned for the grade.
+    """
+    if grade >= 90:
+        return 4.0
+    elif grade >= 80:
+        return 3.0
+    elif grade >= 70:
+        return 2.0
+    elif grade >= 60:
+        return 1.0
+    return 0.0
+
+def get_course_contribution(course: Course) -> tuple:
+    """
+    Computes how much a single course adds to the GPA totals.
+
+    Args:
+        course (Course): The course to measure.
+    Returns:
+        tuple: (grade points * credits, credits), or (0.0, 0) if the course has an unusable grade or credits.
+    """
+    # skip courses whose grade or credits were flagged as unusable when they were set
+    if not course.valid_grade or not course.valid_credits:
+        return (0.0, 0)
+    return (get_grade_points(course.current_grade) * course.credits, course.credits)
+
+def get_GPA_totals(courses: list[Course]) -> tuple:
+    """
+    Sums the credit-weighted grade points and credits over a list of courses.
 
-        total_grade_points += course_grade_points * c
+    Args:
+        courses (list[Course]): The courses to total.
+    Returns:
+        tuple: (total grade points, total credits)
+    """
+    total_grade_points = 0
+    total_credits = 0
+    for course in courses:
+        points, c = get_course_contribution(course)
+        total_grade_points += points
         total_credits += c
+    return (total_grade_points, total_credits)
 
-    # Avoid division by zero: if there are no valid credits, set GPA to 0.0
-    if total_credits == 0:
-        state.current_GPA = 0.0
-        state.is_failing = state.current_GPA < 2.0
+def note_course_change(state: State, course: Course, old_contribution: tuple):
+    """
+    Updates the derived data kept alongside the state after a course is added or its grade changes.
+
+    Args:
+        state (State): The current state of the application.
+        course (Course): The course that was added or changed.
+        old_contribution (tuple): What the course added to the GPA totals before the change ((0.0, 0) if new).
+    Returns:
+        None
+    """
+    if state.derived.deferred:
+        # keep the contribution from before the batch; the batch's net change is applied once
+        state.derived.pending_changes.setdefault(id(course), (course, old_contribution))
+        return
+    new_points, new_credits = get_course_contribution(course)
+    add_to_term(state, course.term, new_points - old_contribution[0], new_credits - old_contribution[1])
+    refresh_suggestions(state, course)
+
+def note_course_removal(state: State, course: Course):
+    """
+    Updates the derived data kept alongside the state after a course is removed.
+
+    Args:
+        state (State): The current state of the application.
+        course (Course): The course that was removed.
+    Returns:
+        None
+    """
+    if state.derived.deferred:
+        # a course changed earlier in the batch leaves with the contribution it had before the batch
+        _, old_contribution = state.derived.pending_changes.pop(id(course), (course, get_course_contribution(course)))
+        state.derived.pending_removals.append((course, old_contribution))
         return
+    points, c = get_course_contribution(course)
+    add_to_term(state, course.term, -points, -c)
+    forget_course_suggestions(state, course)
+
+def defer_updates(state: State):
+    """
+    Starts a batch of changes: until finish_updates, update_GPA and the course change hooks only
+    note what changed, so the GPA and derived data are recomputed once for the whole batch.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        None
+    """
+    state.derived.deferred = True
+
+def finish_updates(state: State):
+    """
+    Ends a batch of changes, updating the GPA once and each changed course's derived data once.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        None
+    """
+    derived = state.derived
+    derived.deferred = False
+    pending_changes, derived.pending_changes = derived.pending_changes, {}
+    pending_removals, derived.pending_removals = derived.pending_removals, []
+    pending_grades, derived.pending_grades = derived.pending_grades, {}
+    for course in pending_grades.values():
+        course.current_grade = round(sum(course.test_scores)/len(course.test_scores), 2)
+    update_GPA(state)
+    for course, (points, c) in pending_removals:
+        add_to_term(state, course.term, -points, -c)
+        forget_course_suggestions(state, course)
+    for course, old_contribution in pending_changes.values():
+        note_course_change(state, course, old_contribution)
+
+# course mutations shared by the routes and batch edits; each returns what it replaced, for undo
+def insert_course(state: State, course_name: str, course_credits: int, course_grade: float, term: str) -> dict:
+    """
+    Adds a course whose inputs were already validated.
+
+    Args:
+        state (State): The current state of the application.
+        course_name (str): The name of the course.
+        course_credits (int): The number of credits (positive).
+        course_grade (float): The current grade.
+        term (str): The term the course was taken in ("" for the current term).
+    Returns:
+        dict: The inverse for undo.
+    """
+    new_course = Course(course_name, course_credits, course_grade, [], term.strip())
+    if state.approximate_scores:
+        new_course.sketch = ScoreSketch(k=state.sketch_k)
+    state.courses.append(new_course)
+    new_term = bool(new_course.term) and new_course.term not in state.terms
+    if new_term:
+        bisect.insort(state.terms, new_course.term, key=get_term_key)
+    update_GPA(state)
+    note_course_change(state, new_course, (0.0, 0))
+    return {"new_term": new_term}
+
+def remove_courses(state: State, course_name: str) -> dict:
+    """
+    Removes every course with a name, along with its test scores.
+
+    Args:
+        state (State): The current state of the application.
+        course_name (str): The name of the course to remove.
+    Returns:
+        dict: The inverse for undo, or None if no course has that name.
+    """
+    # remove all matching courses (safe to build a new list instead of removing in-place)
+    removed = [(position, c) for position, c in enumerate(state.courses) if c.course_name == course_name]
+    if not removed:
+        return None
+    state.courses = [c for c in state.courses if c.course_name != course_name]
+    removed_scores = state.all_test_scores.pop(course_name, None)
+    if removed_scores is not None:
+        state.score_index.ready = False
+        mark_changed(state, "scores")
+    update_GPA(state)
+    for _, course in removed:
+        note_course_removal(state, course)
+    return {"removed": removed, "scores": removed_scores}
+
+def set_grade(state: State, course_name: str, grade: float) -> dict:
+    """
+    Sets the grade of every course with a name.
+
+    Args:
+        state (State): The current state of the application.
+        course_name (str): The name of the course.
+        grade (float): The new, already validated grade.
+    Returns:
+        dict: The inverse for undo, or None if no course has that name.
+    """
+    changed = []
+    for position, course in enumerate(state.courses):
+        if course.course_name == course_name:
+            changed.append((position, course.current_grade))
+            old_contribution = get_course_contribution(course)
+            course.current_grade = grade
+            update_GPA(state)
+            note_course_change(state, course, old_contribution)
+    return {"changed": changed} if changed else None
+
+def insert_score(state: State, course_name: str, score: float, score_category: str) -> dict:
+    """
+    Adds a test score to every course with a name and updates their grades.
 
-    state.current_GPA = round(total_grade_points/total_credits, 2)
-    state.is_failing = state.current_GPA < 2.0
+    Args:
+        state (State): The current state of the application.
+        course_name (str): The name of the course.
+        score (float): The new, already validated test score.
+        score_category (str): The score's category ("" for courses without categories).
+    Returns:
+        dict: The inverse for undo, or None if no course has that name.
+    """
+    changed = []
+    for position, course in enumerate(state.courses):
+        if course.course_name == course_name:
+            if course.sketch is None:
+                old_sketch = None
+            elif len(course.sketch.levels[0]) < get_level_capacity(course.sketch, 0):
+                # no compaction is due, so undo only needs the exact statistics back
+                old_sketch = (course.sketch.count, course.sketch.total, course.sketch.minimum, course.sketch.maximum)
+            else:
+                # a compaction cannot be taken back, so undo restores a copy (bounded in size)
+                old_sketch = copy_sketch(course.sketch)
+            changed.append((position, course.current_grade, course.course_name not in state.all_test_scores,
+                            old_sketch))
+            if course.sketch is not None:
+                # approximate mode: the score is summarized, not stored
+                add_to_sketch(course.sketch, score)
+            else:
+                course.test_scores.append(score)
+                if course.course_name not in state.all_test_scores:
+                    state.all_test_scores[course.course_name] = [score]
+                else:
+                    state.all_test_scores[course.course_name].append(score)
+                add_to_score_index(state, course.course_name, score)
+                mark_changed(state, "scores")
+            # update course grade and GPA
+            # defensive: ensure len > 0 (it will be > 0 because we just appended)
+            old_contribution = get_course_contribution(course)
+            if course.categories:
+                course.current_grade = add_category_score(course, score_category, score)
+            elif course.sketch is not None:
+                course.current_grade = round(course.sketch.total/course.sketch.count, 2)
+            elif state.derived.deferred:
+                # a batch averages each course once, in finish_updates, however many scores it adds
+                state.derived.pending_grades[id(course)] = course
+            else:
+                course.current_grade = round(sum(course.test_scores)/len(course.test_scores), 2)
+            update_GPA(state)
+            note_course_change(state, course, old_contribution)
+    if not changed:
+        return None
+    return {"score": score, "category": score_category, "changed": changed}
 
 @route
+@hold_api_lock
+@track_payload
 def view_progress(state: State) -> Page:
     """
     Page to view overall progress including GPA, pass/fail status
@@ -429,21 +1049,8 @@ def view_progress(state: State) -> Page:
     else:
         pass_status = "passing. Good job!"
 
-    # highest course grade
-    high_course = None
-    for course in state.courses:
-        if course.current_grade is None or not isinstance(course.current_grade, (int, float)) or not math.isfinite(course.current_grade):
-            continue
-        if high_course is None or course.current_grade > high_course.current_grade:
-            high_course = course
-
-    # lowest course grade
-    low_course = None
-    for course in state.courses:
-        if course.current_grade is None or not isinstance(course.current_grade, (int, float)) or not math.isfinite(course.current_grade):
-            continue
-        if low_course is None or course.current_grade < low_course.current_grade:
-            low_course = course
+    high_course, low_course = get_derived(state, "course_extremes")
+    highest_score, lowest_score = get_derived(state, "score_extremes")
 
     # format safe strings for display
     if high_course is None:
@@ -460,7 +1067,7 @@ def view_progress(state: State) -> Page:
         low_name = low_course.course_name
         low_grade_str = f"{low_course.current_grade}"
 
-    points_away = round((state.target_GPA - state.current_GPA), 1)
+    points_away = get_derived(state, "points_to_target")
     return Page(
         state,
         content=[f"Your GPA is {state.current_GPA}.",
@@ -468,9 +1075,10 @@ def view_progress(state: State) -> Page:
             f"You are {points_away} points away from your target GPA ({state.target_GPA}).",
             f"Your course with the highest grade: {high_name} ({high_grade_str}%)",
             f"Your course with the lowest grade: {low_name} ({low_grade_str}%)",
-            f"Highest test score: {get_highest_score(state)}",
-            f"Lowest test score: {get_lowest_score(state)}",
-            Button("Go to Home", "/index")]
+            f"Highest test score: {highest_score}",
+            f"Lowest test score: {lowest_score}"]
+            + get_cohort_standing(state)
+            + [Button("Go to Home", "/index")]
     )
 
 def get_highest_score(state: State) -> tuple:
@@ -482,8 +1090,6 @@ def get_highest_score(state: State) -> tuple:
     Returns:
         tuple: A tuple containing the highest test score as a string with '%' and the course name
     """
-    if not state.all_test_scores:
-        return (None, None)
     highest_score = -math.inf
     course_of_highest = "N/A" if not state.courses else state.courses[0].course_name
     for course_name, test_scores in state.all_test_scores.items():
@@ -496,92 +1102,3764 @@ def get_highest_score(state: State) -> tuple:
             if test_score > highest_score:
                 highest_score = test_score
                 course_of_highest = course_name
+    # archived and approximate-mode scores are left only in their course's sketch, which keeps the exact maximum
+    for course in state.courses:
+        if course.sketch is not None and course.sketch.count and course.sketch.maximum > highest_score:
+            highest_score = course.sketch.maximum
+            course_of_highest = course.course_name
     if highest_score == -math.inf:
         return (None, None)
     return (f'{highest_score}%', course_of_highest)
 
-def get_lowest_score(state: State) -> tuple:
+def get_lowest_score(state: State) -> tuple:
+    """
+    Retrieves the lowest test score and its corresponding course.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        tuple: A tuple containing the lowest test score as a string with '%' and the course name
+    """
+    lowest_score = math.inf
+    course_of_lowest = "N/A" if not state.courses else state.courses[0].course_name
+    for course_name, test_scores in state.all_test_scores.items():
+        for test_score in test_scores:
+            try:
+                if not math.isfinite(test_score):
+                    continue
+            except:
+                continue
+            if test_score < lowest_score:
+                lowest_score = test_score
+                course_of_lowest = course_name
+    # archived and approximate-mode scores are left only in their course's sketch, which keeps the exact minimum
+    for course in state.courses:
+        if course.sketch is not None and course.sketch.count and course.sketch.minimum < lowest_score:
+            lowest_score = course.sketch.minimum
+            course_of_lowest = course.course_name
+    if lowest_score == math.inf:
+        return (None, None)
+    return (f'{lowest_score}%', course_of_lowest)
+
+# Web-based setup for GitHub Pages / static hosting
+@route
+@hold_api_lock
+@track_payload
+def setup(state: State) -> Page:
+    """
+    Setup page to collect student name, current GPA, and target GPA via web form.
+    """
+    return Page(
+        state,
+        content=[
+            "What's your name?", TextBox(name="students_name", default_value=""),
+            "Current GPA:", TextBox(name="students_GPA", default_value="0.0"),
+            "Target GPA:", TextBox(name="students_target_GPA", default_value="4.0"),
+            Button(text="Start", url="/start_app"),
+        ],
+    )
+
+
+def is_valid_student_name(student_name: str) -> bool:
+    """
+    Checks a student name: letters and spaces only, so it is also safe as a file name.
+
+    Args:
+        student_name (str): The name to check.
+    Returns:
+        bool: True if the name is valid.
+    """
+    return bool(student_name) and student_name.replace(" ", "").isalpha()
+
+@route
+@hold_api_lock
+@track_payload
+def start_app(state: State, students_name: str, students_GPA: str, students_target_GPA: str) -> Page:
+    """
+    Handler for the setup form. Validates inputs and initializes the app state.
+    """
+    # validate name (allow spaces in names)
+    if not is_valid_student_name(students_name):
+        return Page(
+            state,
+            content=[
+                "Please enter a valid name (letters and spaces only).",
+                Button("Back", "/setup"),
+            ],
+        )
+
+    # validate GPAs
+    try:
+        curr = float(students_GPA)
+        targ = float(students_target_GPA)
+        if not (0.0 <= curr <= 4.0 and 0.0 <= targ <= 4.0):
+            raise ValueError()
+    except ValueError:
+        return Page(
+            state,
+            content=[
+                "Please enter valid GPAs between 0.0 and 4.0.",
+                Button("Back", "/setup"),
+            ],
+        )
+
+    saved_state = load_saved_state(students_name)
+    if saved_state is not None:
+        return index(saved_state)
+
+    # initialize state and go to index
+    record_edit(state, "start_app", (students_name, students_GPA, students_target_GPA),
+                {"student": (state.student_name, state.current_GPA, state.target_GPA, state.is_failing)})
+    state.student_name = students_name
+    state.current_GPA = curr
+    state.target_GPA = targ
+    state.is_failing = curr < 2.0
+    mark_changed(state, "GPA")
+    return index(state)
+
+# derived fields
+# what each kind of change makes stale; a derived field listed here as a key also
+# passes the change on to the fields that depend on it
+DERIVED_DEPENDENTS = {
+    "grades": ["course_extremes", "course_names"],
+    "scores": ["score_extremes"],
+    "GPA": ["points_to_target"],
+}
+
+def get_course_extremes(state: State) -> tuple:
+    """
+    Finds the courses with the highest and lowest valid grades.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        tuple: (highest course, lowest course), each None if no course has a valid grade.
+    """
+    high_course = None
+    low_course = None
+    for course in state.courses:
+        if not course.valid_grade:
+            continue
+        if high_course is None or course.current_grade > high_course.current_grade:
+            high_course = course
+        if low_course is None or course.current_grade < low_course.current_grade:
+            low_course = course
+    return (high_course, low_course)
+
+DERIVED_FIELDS = {
+    "course_extremes": get_course_extremes,
+    # the course choices on the update grade, test score, category, and distribution pages
+    "course_names": lambda state: [course.course_name for course in state.courses],
+    "score_extremes": lambda state: (get_highest_score(state), get_lowest_score(state)),
+    "points_to_target": lambda state: round(state.target_GPA - state.current_GPA, 1),
+}
+
+def mark_changed(state: State, change: str):
+    """
+    Marks every derived field that depends on a change as dirty. Nothing is recomputed until it is read.
+
+    Args:
+        state (State): The current state of the application.
+        change (str): What changed: "grades", "scores", "GPA", or a derived field's name.
+    Returns:
+        None
+    """
+    pending = list(DERIVED_DEPENDENTS.get(change, []))
+    while pending:
+        name = pending.pop()
+        if name not in state.derived.dirty:
+            state.derived.dirty.add(name)
+            pending.extend(DERIVED_DEPENDENTS.get(name, []))
+
+def get_derived(state: State, name: str):
+    """
+    Reads a derived field, recomputing it first only if something it depends on changed.
+
+    Args:
+        state (State): The current state of the application.
+        name (str): The derived field's name (a key of DERIVED_FIELDS).
+    Returns:
+        The field's current value.
+    """
+    derived = state.derived
+    if name in derived.dirty:
+        derived.values[name] = DERIVED_FIELDS[name](state)
+        derived.dirty.discard(name)
+    return derived.values[name]
+
+def has_recorded_scores(course: Course) -> bool:
+    """
+    Checks whether a course's grade is computed from recorded test scores.
+
+    Args:
+        course (Course): The course to check.
+    Returns:
+        bool: True if the course has scores in its history, categories, or sketch.
+    """
+    return (bool(course.test_scores) or any(category.count for category in course.categories.values())
+            or (course.sketch is not None and course.sketch.count > 0))
+
+# what-if simulation
+@dataclass
+class WhatIf:
+    base: State
+    base_points: float
+    base_credits: int
+    contributions: dict[str, tuple]
+    overrides: dict[str, list[Course]]
+    delta_points: float
+    delta_credits: int
+
+def make_what_if(state: State) -> WhatIf:
+    """
+    Creates a copy-on-write what-if view over the state. The state itself is never modified.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        WhatIf: A view with no overrides whose GPA matches the state's courses.
+    """
+    contributions: dict[str, tuple] = {}
+    for course in state.courses:
+        points, c = get_course_contribution(course)
+        old_points, old_credits = contributions.get(course.course_name, (0.0, 0))
+        contributions[course.course_name] = (old_points + points, old_credits + c)
+    base_points = sum(points for points, _ in contributions.values())
+    base_credits = sum(c for _, c in contributions.values())
+    return WhatIf(state, base_points, base_credits, contributions, {}, 0.0, 0)
+
+def _set_what_if_override(view: WhatIf, course_name: str, new_courses: list[Course]):
+    """
+    Replaces every course named course_name in the view, adjusting the GPA deltas.
+
+    Args:
+        view (WhatIf): The what-if view to change.
+        course_name (str): The name of the course being overridden.
+        new_courses (list[Course]): The hypothetical courses with that name (empty to drop it).
+    Returns:
+        None
+    """
+    if course_name in view.overrides:
+        old_points, old_credits = get_GPA_totals(view.overrides[course_name])
+    else:
+        old_points, old_credits = view.contributions.get(course_name, (0.0, 0))
+    new_points, new_credits = get_GPA_totals(new_courses)
+    view.overrides[course_name] = new_courses
+    view.delta_points += new_points - old_points
+    view.delta_credits += new_credits - old_credits
+
+def what_if_set_grade(view: WhatIf, course_name: str, grade: float, credits: int = 3):
+    """
+    Pretends the named course has the given grade. Unknown courses are added with the given credits.
+
+    Args:
+        view (WhatIf): The what-if view to change.
+        course_name (str): The course to change or add.
+        grade (float): The hypothetical grade.
+        credits (int): The credits to use if the course does not exist yet.
+    Returns:
+        None
+    """
+    existing = view.overrides.get(course_name)
+    if existing is None:
+        existing = [c for c in view.base.courses if c.course_name == course_name]
+    if existing:
+        # copy on write: only the overridden courses are duplicated
+        new_courses = [Course(c.course_name, c.credits, grade, c.test_scores) for c in existing]
+    else:
+        new_courses = [Course(course_name, credits, grade, [])]
+    _set_what_if_override(view, course_name, new_courses)
+
+def what_if_drop_course(view: WhatIf, course_name: str):
+    """
+    Pretends the named course was dropped.
+
+    Args:
+        view (WhatIf): The what-if view to change.
+        course_name (str): The course to drop.
+    Returns:
+        None
+    """
+    _set_what_if_override(view, course_name, [])
+
+def what_if_GPA(view: WhatIf) -> float:
+    """
+    Computes the GPA of the view from the base totals plus the override deltas.
+
+    Args:
+        view (WhatIf): The what-if view.
+    Returns:
+        float: The hypothetical GPA, rounded like update_GPA.
+    """
+    if not view.base.courses and not view.overrides:
+        return view.base.current_GPA
+    total_credits = view.base_credits + view.delta_credits
+    if total_credits == 0:
+        return 0.0
+    return round((view.base_points + view.delta_points)/total_credits, 2)
+
+def what_if_courses(view: WhatIf) -> list[Course]:
+    """
+    Builds the list of courses as they would look with the overrides applied.
+
+    Args:
+        view (WhatIf): The what-if view.
+    Returns:
+        list[Course]: The base courses with overridden ones replaced (new courses at the end).
+    """
+    courses: list[Course] = []
+    replaced: set[str] = set()
+    for course in view.base.courses:
+        if course.course_name not in view.overrides:
+            courses.append(course)
+        elif course.course_name not in replaced:
+            courses.extend(view.overrides[course.course_name])
+            replaced.add(course.course_name)
+    for course_name, new_courses in view.overrides.items():
+        if course_name not in replaced:
+            courses.extend(new_courses)
+    return courses
+
+def sweep_what_if_grades(state: State, course_name: str, grades: list[float], credits: int = 3) -> list[float]:
+    """
+    Computes the GPA for each hypothetical grade in one course. Each scenario is O(1)
+    because only the course's contribution changes.
+
+    Args:
+        state (State): The current state of the application.
+        course_name (str): The course whose grade is varied.
+        grades (list[float]): The grades to try.
+        credits (int): The credits to use if the course does not exist yet.
+    Returns:
+        list[float]: The GPA for each grade, in the same order.
+    """
+    view = make_what_if(state)
+    old_points, old_credits = view.contributions.get(course_name, (0.0, 0))
+    if course_name in view.contributions:
+        sweep_credits = old_credits
+    else:
+        sweep_credits = credits
+    total_credits = view.base_credits - old_credits + sweep_credits
+    other_points = view.base_points - old_points
+    results: list[float] = []
+    for grade in grades:
+        if total_credits == 0:
+            results.append(0.0)
+        else:
+            results.append(round((other_points + get_grade_points(grade) * sweep_credits)/total_credits, 2))
+    return results
+
+@route
+@hold_api_lock
+@track_payload
+def what_if(state: State) -> Page:
+    """
+    Page to try a hypothetical grade in a course without changing any real grades.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        Page: The page with input fields for the hypothetical course and grade.
+    """
+    return Page(
+        state,
+        content=[
+            "Which course? (new course names are added hypothetically)", TextBox(name="what_if_course"),
+            "What if your grade was:", TextBox(name="what_if_grade", default_value=90.0),
+            "Credits (for new courses):", TextBox(name="what_if_credits", default_value=3),
+            Button(text="Simulate", url="/run_what_if"),
+            Button(text="Cancel", url="/index")
+        ]
+    )
+
+@route
+@hold_api_lock
+@track_payload
+def run_what_if(state: State, what_if_course: str, what_if_grade: str, what_if_credits: str) -> Page:
+    """
+    Shows the GPA the student would have with the hypothetical grade. The state is not modified.
+
+    Args:
+        state (State): The current state of the application.
+        what_if_course (str): The name of the course to simulate.
+        what_if_grade (str): The hypothetical grade.
+        what_if_credits (str): The credits to use if the course is new.
+    Returns:
+        Page: The page with the simulated GPA or an error message if inputs are invalid.
+    """
+    # check valid input
+    float_grade = parse_grade(what_if_grade)
+    int_credits = parse_whole_number(what_if_credits)
+    if float_grade is None or int_credits is None or not 0 < int_credits <= MAX_CREDITS:
+        return Page(
+            state,
+            content=["Invalid what-if input. Please try again.",
+             Button("What If?", "/what_if"),
+             Button("Go to Home", "/index")]
+        )
+
+    view = make_what_if(state)
+    what_if_set_grade(view, what_if_course, float_grade, int_credits)
+    letter_gpas = sweep_what_if_grades(state, what_if_course, [95.0, 85.0, 75.0, 65.0, 50.0], int_credits)
+    return Page(
+        state,
+        content=[f"If you get {float_grade} in {what_if_course}, your GPA would be {what_if_GPA(view)} (currently {state.current_GPA}).",
+            f"GPA with an A/B/C/D/F in {what_if_course}: {letter_gpas}",
+            Button("Try Another", "/what_if"),
+            Button("Go to Home", "/index")]
+    )
+
+# study suggestions
+@dataclass
+class SuggestionRule:
+    name: str
+    features: tuple
+    check: object
+
+def get_score_trend(course: Course) -> str:
+    """
+    Compares the latest test score against the average of the (up to) three before it. A course in
+    approximate mode keeps no score order, so it has no trend.
+
+    Args:
+        course (Course): The course whose test scores are checked.
+    Returns:
+        str: "up", "down", "flat", or "N/A" if there are fewer than two scores.
+    """
+    if len(course.test_scores) < 2:
+        return "N/A"
+    previous = course.test_scores[-4:-1]
+    change = course.test_scores[-1] - sum(previous)/len(previous)
+    if change > 2:
+        return "up"
+    elif change < -2:
+        return "down"
+    return "flat"
+
+def get_course_features(course: Course) -> dict:
+    """
+    Collects the course statistics that suggestion rules depend on.
+
+    Args:
+        course (Course): The course to describe.
+    Returns:
+        dict: The course's grade band, score trend, and credits.
+    """
+    return {
+        "grade_band": get_letter_grade(course),
+        "trend": get_score_trend(course),
+        "credits": course.credits,
+    }
+
+def get_state_features(state: State) -> dict:
+    """
+    Collects the student-wide statistics that suggestion rules depend on.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        dict: The distance from the current GPA to the target GPA.
+    """
+    return {"gpa_gap": round(state.target_GPA - state.current_GPA, 1)}
+
+COURSE_RULES: list[SuggestionRule] = [
+    SuggestionRule("struggling", ("grade_band",),
+        lambda name, f: f"You have a {f['grade_band']} in {name}. Visit office hours and review your weakest topics."
+            if f["grade_band"] in ("D", "F") else None),
+    SuggestionRule("declining", ("trend",),
+        lambda name, f: f"Your test scores in {name} are trending down. Review recent material before the next test."
+            if f["trend"] == "down" else None),
+    SuggestionRule("improving", ("trend",),
+        lambda name, f: f"Your test scores in {name} are improving. Keep up your current study routine!"
+            if f["trend"] == "up" else None),
+    SuggestionRule("heavy_course", ("grade_band", "credits"),
+        lambda name, f: f"{name} is worth {f['credits']} credits, so raising its grade moves your GPA the most."
+            if f["credits"] >= 4 and f["grade_band"] in ("C", "D", "F") else None),
+]
+
+STATE_RULES: list[SuggestionRule] = [
+    SuggestionRule("below_target", ("gpa_gap",),
+        lambda f: f"You are {f['gpa_gap']} points below your target GPA. Focus on your lowest grades first."
+            if f["gpa_gap"] > 0 else None),
+]
+
+def index_rules(rules: list[SuggestionRule]) -> dict[str, list[SuggestionRule]]:
+    """
+    Groups rules by the features they read, so a changed feature only re-runs its own rules.
+
+    Args:
+        rules (list[SuggestionRule]): The rules to index.
+    Returns:
+        dict[str, list[SuggestionRule]]: The rules that depend on each feature.
+    """
+    rules_by_feature: dict[str, list[SuggestionRule]] = {}
+    for rule in rules:
+        for feature in rule.features:
+            rules_by_feature.setdefault(feature, []).append(rule)
+    return rules_by_feature
+
+COURSE_RULES_BY_FEATURE = index_rules(COURSE_RULES)
+STATE_RULES_BY_FEATURE = index_rules(STATE_RULES)
+
+def _rules_for_changes(rules_by_feature: dict, old_features: dict, new_features: dict) -> list[SuggestionRule]:
+    """
+    Finds the rules affected by the features that changed, without duplicates.
+
+    Args:
+        rules_by_feature (dict): The rule index to look in.
+        old_features (dict): The features from the last evaluation (empty if never evaluated).
+        new_features (dict): The features now.
+    Returns:
+        list[SuggestionRule]: The rules to re-evaluate.
+    """
+    affected: dict[str, SuggestionRule] = {}
+    for feature, value in new_features.items():
+        if feature not in old_features or old_features[feature] != value:
+            for rule in rules_by_feature.get(feature, []):
+                affected[rule.name] = rule
+    return list(affected.values())
+
+def _apply_rules(results: dict[str, str], rules: list[SuggestionRule], message_for):
+    """
+    Re-evaluates rules and stores (or clears) their messages.
+
+    Args:
+        results (dict[str, str]): The messages to update, keyed by rule name.
+        rules (list[SuggestionRule]): The rules to re-evaluate.
+        message_for: A function that runs a rule and returns its message or None.
+    Returns:
+        None
+    """
+    for rule in rules:
+        message = message_for(rule)
+        if message is None:
+            results.pop(rule.name, None)
+        else:
+            results[rule.name] = message
+
+def refresh_suggestions(state: State, course: Course = None):
+    """
+    Re-evaluates only the suggestion rules whose features changed for one course
+    and for the student's GPA gap. Builds everything the first time.
+
+    Args:
+        state (State): The current state of the application.
+        course (Course): The course that was just added or changed, if any.
+    Returns:
+        None
+    """
+    cache = state.suggestions
+    if not cache.ready:
+        rebuild_suggestions(state)
+        return
+    if course is not None:
+        new_features = get_course_features(course)
+        old_features = cache.course_features.get(id(course), {})
+        rules = _rules_for_changes(COURSE_RULES_BY_FEATURE, old_features, new_features)
+        results = cache.course_results.setdefault(id(course), {})
+        _apply_rules(results, rules, lambda rule: rule.check(course.course_name, new_features))
+        cache.course_features[id(course)] = new_features
+    new_state_features = get_state_features(state)
+    rules = _rules_for_changes(STATE_RULES_BY_FEATURE, cache.state_features, new_state_features)
+    _apply_rules(cache.state_results, rules, lambda rule: rule.check(new_state_features))
+    cache.state_features = new_state_features
+
+def forget_course_suggestions(state: State, course: Course):
+    """
+    Drops the suggestions for a removed course and refreshes the GPA-based ones.
+
+    Args:
+        state (State): The current state of the application.
+        course (Course): The removed course.
+    Returns:
+        None
+    """
+    state.suggestions.course_features.pop(id(course), None)
+    state.suggestions.course_results.pop(id(course), None)
+    refresh_suggestions(state)
+
+def rebuild_suggestions(state: State):
+    """
+    Evaluates every rule for every course from scratch.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        None
+    """
+    state.suggestions = Suggestions(ready=True)
+    for course in state.courses:
+        refresh_suggestions(state, course)
+    if not state.courses:
+        refresh_suggestions(state)
+
+def get_suggestions(state: State) -> list[str]:
+    """
+    Lists the current study suggestions, student-wide ones first, then per course.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        list[str]: The suggestion messages.
+    """
+    if not state.suggestions.ready:
+        rebuild_suggestions(state)
+    cache = state.suggestions
+    suggestions: list[str] = [cache.state_results[rule.name] for rule in STATE_RULES if rule.name in cache.state_results]
+    # courses that share a name can give the same message; it is listed once
+    seen: set[str] = set(suggestions)
+    for course in state.courses:
+        results = cache.course_results.get(id(course), {})
+        for rule in COURSE_RULES:
+            if rule.name in results and results[rule.name] not in seen:
+                seen.add(results[rule.name])
+                suggestions.append(results[rule.name])
+    return suggestions
+
+@route
+@hold_api_lock
+@track_payload
+def view_suggestions(state: State) -> Page:
+    """
+    Page showing personalized study suggestions based on grades, score trends, credits, and the target GPA.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        Page: The page listing the study suggestions.
+    """
+    suggestions = get_suggestions(state)
+    if not suggestions:
+        suggestions = ["No suggestions right now. Keep it up!"]
+    return Page(
+        state,
+        content=["Study suggestions:"] + suggestions + [Button("Go to Home", "/index")]
+    )
+
+# paginated course list
+MAX_FULL_COURSE_LIST = 25
+MAX_PAGE_SIZE = 50
+SHOWN_SCORES = 5
+COURSE_SORT_KEYS = {
+    "added": None,
+    "name": lambda course: course.course_name,
+    "grade": lambda course: -course.current_grade if course.valid_grade else math.inf,
+    "credits": lambda course: -course.credits if course.valid_credits else math.inf,
+}
+
+def get_course_slice(courses: list[Course], offset: int, page_size: int, sort_by: str) -> list[Course]:
+    """
+    Picks out only the courses on the requested page without sorting the whole list.
+
+    Args:
+        courses (list[Course]): All of the student's courses.
+        offset (int): How many courses to skip.
+        page_size (int): How many courses to return.
+        sort_by (str): One of the COURSE_SORT_KEYS ("added" keeps the order they were added).
+    Returns:
+        list[Course]: The courses on the page.
+    """
+    key = COURSE_SORT_KEYS[sort_by]
+    if key is None:
+        return courses[offset:offset + page_size]
+    # a bounded heap only keeps offset + page_size courses instead of sorting all of them
+    return heapq.nsmallest(offset + page_size, courses, key=key)[offset:]
+
+def summarize_scores(test_scores: list[float], shown: int = SHOWN_SCORES) -> str:
+    """
+    Describes a score history by its most recent scores plus summary stats.
+
+    Args:
+        test_scores (list[float]): The course's test scores.
+        shown (int): How many of the most recent scores to list.
+    Returns:
+        str: A short description of the scores.
+    """
+    if not test_scores:
+        return "no test scores"
+    recent = test_scores[-shown:]
+    average = round(sum(test_scores)/len(test_scores), 2)
+    if len(test_scores) <= shown:
+        listed = f"scores {recent}"
+    else:
+        listed = f"last {shown} of {len(test_scores)} scores {recent}"
+    return f"{listed} (avg {average}, min {min(test_scores)}, max {max(test_scores)})"
+
+@route
+@hold_api_lock
+@track_payload
+def browse_courses(state: State, offset: str = "0", page_size: str = "10", sort_by: str = "added") -> Page:
+    """
+    Page to view courses a page at a time, with each score history shortened to a summary.
+
+    Args:
+        state (State): The current state of the application.
+        offset (str): How many courses to skip.
+        page_size (str): How many courses to show on the page.
+        sort_by (str): How to order the courses: "added", "name", "grade", or "credits".
+    Returns:
+        Page: The page showing the requested slice of courses.
+    """
+    # check valid input
+    int_offset = parse_whole_number(offset)
+    int_page_size = parse_whole_number(page_size)
+    if (int_offset is None or int_page_size is None or int_offset < 0
+            or not 0 < int_page_size <= MAX_PAGE_SIZE or sort_by not in COURSE_SORT_KEYS):
+        return Page(
+            state,
+            content=["Invalid page request. Please try again.",
+             Button("View Courses", "/browse_courses"),
+             Button("Go to Home", "/index")]
+        )
+
+    if not state.courses:
+        return view_courses(state)
+
+    # an offset past the end shows the last page
+    int_offset = min(int_offset, (len(state.courses) - 1) // int_page_size * int_page_size)
+    visible = get_course_slice(state.courses, int_offset, int_page_size, sort_by)
+    last_shown = int_offset + len(visible)
+    content: list = [f"Courses {int_offset + 1}-{last_shown} of {len(state.courses)} (sorted by {sort_by}):"]
+    for course in visible:
+        content.append(f"{course.course_name}: {get_letter_grade(course)} ({course.current_grade}%), "
+                       f"{course.credits} credits, {summarize_scores(course.test_scores)}")
+
+    if int_offset > 0:
+        content.append(Button("Previous", "/browse_courses", arguments=[
+            Argument("offset", str(max(0, int_offset - int_page_size))),
+            Argument("page_size", str(int_page_size)),
+            Argument("sort_by", sort_by)]))
+    if last_shown < len(state.courses):
+        content.append(Button("Next", "/browse_courses", arguments=[
+            Argument("offset", str(last_shown)),
+            Argument("page_size", str(int_page_size)),
+            Argument("sort_by", sort_by)]))
+    for key in COURSE_SORT_KEYS:
+        if key != sort_by:
+            content.append(Button(f"Sort by {key}", "/browse_courses", arguments=[
+                Argument("page_size", str(int_page_size)),
+                Argument("sort_by", key)]))
+    content.append(Button("Update a Grade", "/update_grade"))
+    content.append(Button("Go to Home", "/index"))
+    return Page(state, content=content)
+
+@route
+@hold_api_lock
+def view_payload_stats(state: State) -> Page:
+    """
+    Page listing how many bytes each route has sent, largest first.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        Page: The page showing per-route payload sizes.
+    """
+    lines: list[str] = []
+    for route_name, stats in sorted(PAYLOAD_STATS.items(), key=lambda item: -item[1].max_bytes):
+        average = stats.total_bytes // stats.requests
+        lines.append(f"{route_name}: {stats.requests} requests, avg {average} bytes, max {stats.max_bytes} bytes, "
+                     f"{stats.over_budget} over the {PAYLOAD_BUDGET_BYTES} byte budget")
+    if not lines:
+        lines = ["No pages have been served yet."]
+    return Page(state, content=["Payload sizes by route:"] + lines + [Button("Go to Home", "/index")])
+
+# term history
+# seasons in the order they fall within a year (winter session is in January)
+TERM_SEASONS = {"winter": 0, "spring": 1, "summer": 2, "fall": 3, "autumn": 3}
+
+def get_term_key(term: str) -> tuple:
+    """
+    Orders term names by date, so "Fall 2023" comes before "Spring 2025" whichever was added first.
+    Names without both a season and a year come after every dated term, alphabetically.
+
+    Args:
+        term (str): The term name, like "Fall 2024".
+    Returns:
+        tuple: The sort key.
+    """
+    words = term.lower().replace("-", " ").split()
+    years = [int(word) for word in words if len(word) == 4 and word.isdigit()]
+    seasons = [TERM_SEASONS[word] for word in words if word in TERM_SEASONS]
+    if years and seasons:
+        return (0, years[0], seasons[0], term)
+    return (1, 0, 0, term)
+
+def _term_position(state: State, term: str) -> int:
+    """
+    Finds where a term sits in the ledger, adding it in date order if it is new.
+    Untagged courses ("") always come last since they belong to the term in progress.
+
+    Args:
+        state (State): The current state of the application.
+        term (str): The term name.
+    Returns:
+        int: The term's position in the ledger.
+    """
+    ledger = state.term_ledger
+    if term in ledger.position:
+        return ledger.position[term]
+    if term and term not in state.terms:
+        bisect.insort(state.terms, term, key=get_term_key)
+    position = len(ledger.order)
+    if term:
+        # named terms are in date order, before the untagged term
+        named_count = position - ("" in ledger.position)
+        position = bisect.bisect(ledger.order, get_term_key(term), hi=named_count, key=get_term_key)
+    ledger.order.insert(position, term)
+    ledger.points.insert(position, 0.0)
+    ledger.credits.insert(position, 0)
+    for later, later_term in enumerate(ledger.order[position:], position):
+        ledger.position[later_term] = later
+    ledger.clean_through = min(ledger.clean_through, position - 1)
+    return position
+
+def add_to_term(state: State, term: str, points: float, credits: int):
+    """
+    Adds a change in grade points and credits to one term's totals. O(1): only the prefix
+    sums from that term onward are marked as needing an update.
+
+    Args:
+        state (State): The current state of the application.
+        term (str): The term whose totals changed.
+        points (float): The change in credit-weighted grade points.
+        credits (int): The change in credits.
+    Returns:
+        None
+    """
+    ledger = state.term_ledger
+    if not ledger.ready:
+        # the first query builds the whole ledger, which will include this change
+        return
+    position = _term_position(state, term)
+    ledger.points[position] += points
+    ledger.credits[position] += credits
+    ledger.clean_through = min(ledger.clean_through, position - 1)
+
+def rebuild_term_ledger(state: State):
+    """
+    Builds the per-term totals from every course, with terms in the order of state.terms.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        None
+    """
+    state.term_ledger = TermLedger(ready=True)
+    for term in list(state.terms):
+        _term_position(state, term)
+    for course in state.courses:
+        points, c = get_course_contribution(course)
+        add_to_term(state, course.term, points, c)
+
+def get_term_ledger(state: State) -> TermLedger:
+    """
+    Returns the term ledger with its prefix sums up to date, only redoing the terms after the
+    earliest one that changed.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        TermLedger: The up-to-date ledger.
+    """
+    if not state.term_ledger.ready:
+        rebuild_term_ledger(state)
+    ledger = state.term_ledger
+    del ledger.prefix_points[ledger.clean_through + 1:]
+    del ledger.prefix_credits[ledger.clean_through + 1:]
+    for position in range(ledger.clean_through + 1, len(ledger.order)):
+        previous_points = ledger.prefix_points[-1] if position > 0 else 0.0
+        previous_credits = ledger.prefix_credits[-1] if position > 0 else 0
+        ledger.prefix_points.append(previous_points + ledger.points[position])
+        ledger.prefix_credits.append(previous_credits + ledger.credits[position])
+    ledger.clean_through = len(ledger.order) - 1
+    return ledger
+
+def _GPA_from_totals(points: float, credits: int) -> float:
+    """
+    Divides grade points by credits the way update_GPA does.
+
+    Args:
+        points (float): Total credit-weighted grade points.
+        credits (int): Total credits.
+    Returns:
+        float: The GPA rounded to 2 places, or None if there are no credits.
+    """
+    if credits == 0:
+        return None
+    return round(points/credits, 2)
+
+def get_term_GPA(state: State, term: str) -> float:
+    """
+    Computes the GPA earned in a single term.
+
+    Args:
+        state (State): The current state of the application.
+        term (str): The term name ("" for untagged courses).
+    Returns:
+        float: The term GPA, or None if the term has no credits.
+    """
+    ledger = get_term_ledger(state)
+    if term not in ledger.position:
+        return None
+    position = ledger.position[term]
+    return _GPA_from_totals(ledger.points[position], ledger.credits[position])
+
+def get_cumulative_GPA(state: State, term: str) -> float:
+    """
+    Computes the cumulative GPA as of the end of a term, in O(1) once prefixes are current.
+
+    Args:
+        state (State): The current state of the application.
+        term (str): The term name ("" for the term in progress).
+    Returns:
+        float: The cumulative GPA, or None if there are no credits yet.
+    """
+    ledger = get_term_ledger(state)
+    if term not in ledger.position:
+        return None
+    position = ledger.position[term]
+    return _GPA_from_totals(ledger.prefix_points[position], ledger.prefix_credits[position])
+
+def get_GPA_timeline(state: State) -> list[tuple]:
+    """
+    Lists every term with its term GPA and cumulative GPA, oldest first.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        list[tuple]: (term, term GPA, cumulative GPA, term credits) for each term.
+    """
+    ledger = get_term_ledger(state)
+    return [(term,
+             _GPA_from_totals(ledger.points[i], ledger.credits[i]),
+             _GPA_from_totals(ledger.prefix_points[i], ledger.prefix_credits[i]),
+             ledger.credits[i])
+            for i, term in enumerate(ledger.order)]
+
+@route
+@hold_api_lock
+@track_payload
+def view_terms(state: State) -> Page:
+    """
+    Page showing the GPA for each term and the cumulative GPA after each term.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        Page: The page showing the GPA timeline.
+    """
+    lines: list[str] = []
+    for term, term_GPA, cumulative_GPA, credits in get_GPA_timeline(state):
+        if credits == 0:
+            continue
+        term_name = term if term else "Current term"
+        lines.append(f"{term_name}: term GPA {term_GPA} ({credits} credits), cumulative GPA {cumulative_GPA}")
+    if not lines:
+        lines = ["You have no graded courses yet."]
+    return Page(state, content=["GPA by term:"] + lines + [Button("Go to Home", "/index")])
+
+# weighted score categories
+def get_category_average(category: ScoreCategory) -> float:
+    """
+    Averages a category's scores from its running total, leaving out the lowest score
+    (the top of the heap) when the category drops it.
+
+    Args:
+        category (ScoreCategory): The score category.
+    Returns:
+        float: The category average, or None if it has no scores yet.
+    """
+    if category.count == 0:
+        return None
+    if category.drop_lowest and category.count > 1:
+        return (category.total - category.lowest[0])/(category.count - 1)
+    return category.total/category.count
+
+def get_weighted_grade(course: Course) -> float:
+    """
+    Combines the category averages by weight. Categories without scores are left out and
+    the remaining weights are rescaled.
+
+    Args:
+        course (Course): The course with score categories.
+    Returns:
+        float: The weighted course grade rounded to 2 places, or None if no category has scores.
+    """
+    weighted_sum = 0.0
+    used_weight = 0.0
+    for category in course.categories.values():
+        average = get_category_average(category)
+        if average is not None:
+            weighted_sum += category.weight * average
+            used_weight += category.weight
+    if used_weight == 0:
+        return None
+    return round(weighted_sum/used_weight, 2)
+
+def add_category_score(course: Course, category_name: str, score: float) -> float:
+    """
+    Adds a score to one of the course's categories in O(log n) (the heap push) and
+    returns the new weighted grade without revisiting earlier scores.
+
+    Args:
+        course (Course): The course with score categories.
+        category_name (str): The category the score belongs to.
+        score (float): The new score.
+    Returns:
+        float: The new weighted course grade.
+    """
+    category = course.categories[category_name]
+    category.total += score
+    category.count += 1
+    if category.drop_lowest:
+        heapq.heappush(category.lowest, score)
+    return get_weighted_grade(course)
+
+@route
+@hold_api_lock
+@track_payload
+def add_category(state: State) -> Page:
+    """
+    Page to add a weighted score category (like exams or homework) to a course.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        Page: The page with input fields for the new category.
+    """
+    if not state.courses:
+        return Page(
+            state,
+            content=["You currently have no courses added. Please add some to add score categories.",
+             Button("Add Course", "/add_course"),
+             Button("Go to Home", "/index")]
+        )
+    courses_names: list[str] = get_derived(state, "course_names")
+    return Page(
+        state,
+        content=[
+            "Which course is this category for?", SelectBox(name="category_course", options=courses_names),
+            "Category name:", TextBox(name="category_name"),
+            "Weight (percent of the grade):", TextBox(name="category_weight", default_value=25),
+            "Drop the lowest score?", SelectBox(name="drop_lowest", options=["no", "yes"]),
+            Button(text="Add Category", url="/append_category"),
+            Button(text="Cancel", url="/index")
+        ]
+    )
+
+@route
+@hold_api_lock
+@track_payload
+def append_category(state: State, category_course: str, category_name: str, category_weight: str, drop_lowest: str) -> Page:
+    """
+    Adds a weighted score category to a course after validating the inputs.
+
+    Args:
+        state (State): The current state of the application.
+        category_course (str): The name of the course.
+        category_name (str): The name of the new category.
+        category_weight (str): The category's weight.
+        drop_lowest (str): "yes" to drop the lowest score in the category.
+    Returns:
+        Page: The updated home page after adding the category or an error message if inputs are invalid.
+    """
+    weight = parse_grade(category_weight)
+    category_name = category_name.strip()
+    if weight is None or weight <= 0 or not category_name:
+        return Page(
+            state,
+            content=["Invalid category input. Please try again.",
+             Button("Add Score Category", "/add_category"),
+             Button("Go to Home", "/index")]
+        )
+    matching = [course for course in state.courses if course.course_name == category_course]
+    if not matching:
+        return Page(
+            state,
+            content=[f"{category_course} is not one of your courses.",
+             Button("Add Score Category", "/add_category"),
+             Button("Go to Home", "/index")]
+        )
+    if any(not course.categories and has_recorded_scores(course) for course in matching):
+        # a grade from the categories alone would leave out the scores already recorded
+        return Page(
+            state,
+            content=[f"{category_course} already has test scores without a category. "
+                     "Categories can only be added before a course's first test score.",
+             Button("Add Score Category", "/add_category"),
+             Button("Go to Home", "/index")]
+        )
+    changed = []
+    for position, course in enumerate(state.courses):
+        if course.course_name == category_course and category_name not in course.categories:
+            course.categories[category_name] = ScoreCategory(weight, drop_lowest == "yes")
+            changed.append(position)
+    if changed:
+        record_edit(state, "append_category", (category_course, category_name, category_weight, drop_lowest),
+                    {"changed": changed})
+    return index(state)
+
+# score distribution
+HISTOGRAM_EDGES = [60.0, 70.0, 80.0, 90.0]
+
+def rebuild_score_index(state: State):
+    """
+    Sorts every course's test scores (and all of them together) from state.all_test_scores.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        None
+    """
+    score_index = ScoreIndex(ready=True)
+    for course_name, test_scores in state.all_test_scores.items():
+        # scores were validated as finite when they were added
+        score_index.by_course[course_name] = sorted(test_scores)
+        score_index.all_scores.extend(score_index.by_course[course_name])
+    score_index.all_scores.sort()
+    state.score_index = score_index
+
+def add_to_score_index(state: State, course_name: str, score: float):
+    """
+    Inserts a new test score into the sorted course and overall score lists.
+
+    Args:
+        state (State): The current state of the application.
+        course_name (str): The course the score belongs to.
+        score (float): The new test score.
+    Returns:
+        None
+    """
+    if not state.score_index.ready:
+        # the first query builds the whole index, which will include this score
+        return
+    bisect.insort(state.score_index.by_course.setdefault(course_name, []), score)
+    bisect.insort(state.score_index.all_scores, score)
+
+def get_sorted_scores(state: State, course_name: str = None) -> list[float]:
+    """
+    Returns the sorted test scores for one course or for all courses, rebuilding the index
+    if it was never built or the course's scores no longer match state.all_test_scores.
+    Every edit keeps the index current, so a read of all courses is O(1); a direct change to
+    state.all_test_scores is noticed by the next read of that course.
+
+    Args:
+        state (State): The current state of the application.
+        course_name (str): The course to look at, or None for every score.
+    Returns:
+        list[float]: The scores in ascending order (do not modify).
+    """
+    if not state.score_index.ready:
+        rebuild_score_index(state)
+    score_index = state.score_index
+    if course_name is None:
+        return score_index.all_scores
+    if len(score_index.by_course.get(course_name, [])) != len(state.all_test_scores.get(course_name, [])):
+        rebuild_score_index(state)
+    return state.score_index.by_course.get(course_name, [])
+
+def get_percentile(sorted_scores: list[float], percent: float) -> float:
+    """
+    Finds a percentile of sorted scores, interpolating between neighbors.
+
+    Args:
+        sorted_scores (list[float]): Scores in ascending order.
+        percent (float): The percentile to find, from 0 to 100.
+    Returns:
+        float: The percentile rounded to 2 places, or None if there are no scores.
+    """
+    if not sorted_scores:
+        return None
+    position = (len(sorted_scores) - 1) * min(max(percent, 0.0), 100.0)/100
+    below = int(position)
+    above = min(below + 1, len(sorted_scores) - 1)
+    fraction = position - below
+    return round(sorted_scores[below] + (sorted_scores[above] - sorted_scores[below]) * fraction, 2)
+
+def get_score_rank(sorted_scores: list[float], score: float) -> float:
+    """
+    Finds the percentile rank of a score: the percent of scores at or below it.
+
+    Args:
+        sorted_scores (list[float]): Scores in ascending order.
+        score (float): The score to rank.
+    Returns:
+        float: The percentile rank rounded to 1 place, or None if there are no scores.
+    """
+    if not sorted_scores:
+        return None
+    return round(100 * bisect.bisect_right(sorted_scores, score)/len(sorted_scores), 1)
+
+def get_histogram(sorted_scores: list[float], edges: list[float] = HISTOGRAM_EDGES) -> list[int]:
+    """
+    Counts scores between bin edges with one binary search per edge.
+
+    Args:
+        sorted_scores (list[float]): Scores in ascending order.
+        edges (list[float]): Ascending bin edges; a score equal to an edge goes in the higher bin.
+    Returns:
+        list[int]: len(edges) + 1 counts, from below the first edge to at or above the last.
+    """
+    cuts = [0] + [bisect.bisect_left(sorted_scores, edge) for edge in edges] + [len(sorted_scores)]
+    return [cuts[i + 1] - cuts[i] for i in range(len(cuts) - 1)]
+
+@route
+@hold_api_lock
+@track_payload
+def view_distribution(state: State, distribution_course: str = "") -> Page:
+    """
+    Page showing the median, percentiles, and a letter-grade histogram of test scores.
+
+    Args:
+        state (State): The current state of the application.
+        distribution_course (str): The course to show, or "" for all courses.
+    Returns:
+        Page: The page showing the score distribution.
+    """
+    course_name = distribution_course if distribution_course else None
+    sorted_scores = get_sorted_scores(state, course_name)
+    scope = distribution_course if distribution_course else "all courses"
+    courses_names: list[str] = get_derived(state, "course_names")
+    chooser = ["Show another course:", SelectBox(name="distribution_course", options=[""] + courses_names),
+               Button("Show", "/view_distribution"), Button("Go to Home", "/index")]
+    if distribution_course:
+        sketch = next((course.sketch for course in state.courses if course.course_name == distribution_course
+                       and course.sketch is not None and course.sketch.count), None)
+    else:
+        sketch = get_all_scores_sketch(state)
+    if sketch is not None:
+        counts = get_sketch_histogram(sketch)
+        return Page(
+            state,
+            content=[f"Test scores for {scope} ({sketch.count} scores, approximate):",
+                     f"Mean: {round(sketch.total/sketch.count, 2)} (lowest {sketch.minimum}, highest {sketch.maximum})",
+                     f"Median: about {get_sketch_percentile(sketch, 50)}",
+                     f"25th/75th/90th percentiles: about {get_sketch_percentile(sketch, 25)}, "
+                     f"{get_sketch_percentile(sketch, 75)}, {get_sketch_percentile(sketch, 90)}",
+                     f"Histogram: F {counts[0]}, D {counts[1]}, C {counts[2]}, B {counts[3]}, A {counts[4]}"] + chooser
+        )
+    if not sorted_scores:
+        return Page(state, content=[f"No test scores yet for {scope}."] + chooser)
+    counts = get_histogram(sorted_scores)
+    return Page(
+        state,
+        content=[f"Test scores for {scope} ({len(sorted_scores)} scores):",
+                 f"Median: {get_percentile(sorted_scores, 50)}",
+                 f"25th/75th/90th percentiles: {get_percentile(sorted_scores, 25)}, "
+                 f"{get_percentile(sorted_scores, 75)}, {get_percentile(sorted_scores, 90)}",
+                 f"Histogram: F {counts[0]}, D {counts[1]}, C {counts[2]}, B {counts[3]}, A {counts[4]}"] + chooser
+    )
+
+# cohort comparison
+GPA_HISTOGRAM_BUCKETS = 9  # 0.0-0.49, 0.5-0.99, ..., 3.5-3.99, 4.0
+
+@dataclass
+class CohortStore:
+    # sorted GPAs of every student, and a histogram in half-point buckets
+    gpas: list[float] = field(default_factory=list)
+    gpa_histogram: list[int] = field(default_factory=lambda: [0] * GPA_HISTOGRAM_BUCKETS)
+    # sorted grades of every student in each course, by course id, and the courses' catalog entries
+    # (held here so a course keeps its id while none of its students are in memory)
+    course_grades: dict[int, list[float]] = field(default_factory=dict)
+    course_entries: dict[int, CatalogEntry] = field(default_factory=dict)
+    # what each student last contributed, so an update only touches what changed
+    student_gpa: dict[str, float] = field(default_factory=dict)
+    student_grades: dict[str, dict[int, float]] = field(default_factory=dict)
+
+# set by enable_cohort() in multi-student deployments; None keeps cohort tracking off
+COHORT: CohortStore = None
+
+def enable_cohort() -> CohortStore:
+    """
+    Turns on cohort tracking, so every update_GPA also updates the shared cohort aggregates.
+
+    Returns:
+        CohortStore: The (empty) cohort store.
+    """
+    global COHORT
+    COHORT = CohortStore()
+    return COHORT
+
+def _remove_sorted(values: list[float], value: float):
+    """
+    Removes one copy of a value from a sorted list using binary search.
+
+    Args:
+        values (list[float]): A list in ascending order.
+        value (float): The value to remove.
+    Returns:
+        None
+    """
+    position = bisect.bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        del values[position]
+
+def _gpa_bucket(gpa: float) -> int:
+    """
+    Finds the half-point histogram bucket for a GPA.
+
+    Args:
+        gpa (float): The GPA.
+    Returns:
+        int: The bucket index.
+    """
+    return min(max(int(gpa * 2), 0), GPA_HISTOGRAM_BUCKETS - 1)
+
+def update_cohort(state: State):
+    """
+    Brings the cohort aggregates up to date with one student's GPA and course grades. Only the
+    student's own courses are looked at; other students' states are never scanned.
+
+    Args:
+        state (State): The student's state, right after update_GPA.
+    Returns:
+        None
+    """
+    if COHORT is None or not state.student_name:
+        return
+    student = state.student_name
+    old_gpa = COHORT.student_gpa.get(student)
+    if old_gpa != state.current_GPA:
+        if old_gpa is not None:
+            _remove_sorted(COHORT.gpas, old_gpa)
+            COHORT.gpa_histogram[_gpa_bucket(old_gpa)] -= 1
+        bisect.insort(COHORT.gpas, state.current_GPA)
+        COHORT.gpa_histogram[_gpa_bucket(state.current_GPA)] += 1
+        COHORT.student_gpa[student] = state.current_GPA
+
+    graded = {course.course_id: course for course in state.courses if course.valid_grade}
+    new_grades = {course_id: course.current_grade for course_id, course in graded.items()}
+    old_grades = COHORT.student_grades.get(student, {})
+    for course_id, grade in old_grades.items():
+        if new_grades.get(course_id) != grade:
+            _remove_sorted(COHORT.course_grades[course_id], grade)
+            if not COHORT.course_grades[course_id]:
+                del COHORT.course_grades[course_id], COHORT.course_entries[course_id]
+    for course_id, grade in new_grades.items():
+        if old_grades.get(course_id) != grade:
+            bisect.insort(COHORT.course_grades.setdefault(course_id, []), grade)
+            COHORT.course_entries[course_id] = graded[course_id].catalog_entry
+    COHORT.student_grades[student] = new_grades
+
+def get_cohort_standing(state: State) -> list[str]:
+    """
+    Describes where the student stands in the cohort, read from the precomputed aggregates.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        list[str]: Lines for the progress page (empty when cohort tracking is off or the student is alone).
+    """
+    if COHORT is None or len(COHORT.gpas) < 2 or state.student_name not in COHORT.student_gpa:
+        return []
+    lines = [f"Your GPA is at the {get_score_rank(COHORT.gpas, state.current_GPA)} percentile of "
+             f"{len(COHORT.gpas)} students."]
+    for course_id, grade in COHORT.student_grades.get(state.student_name, {}).items():
+        grades = COHORT.course_grades[course_id]
+        if len(grades) > 1:
+            lines.append(f"{COHORT.course_entries[course_id].course_name}: {get_score_rank(grades, grade)} percentile of "
+                         f"{len(grades)} students.")
+    return lines
+
+# target feasibility
+@dataclass
+class FeasibilitySweep:
+    student_names: list[str]
+    remaining_credits: list[int]
+    # [scenario][student]: average grade points needed over the remaining credits (0.0 once the target is secured)
+    needed_points: list[array.array]
+    # [scenario][student]: the lowest grade that earns those points in every remaining course (None when out of reach)
+    minimum_grades: list[list]
+
+@functools.cache
+def get_grade_thresholds() -> tuple:
+    """
+    Reads the grading scale off get_grade_points: each grade-point value and the lowest whole grade that earns it.
+
+    Returns:
+        tuple: (the grade-point values in ascending order, the lowest grade for each)
+    """
+    thresholds: list[float] = []
+    grades: list[int] = []
+    for grade in range(101):
+        points = get_grade_points(grade)
+        if not thresholds or points > thresholds[-1]:
+            thresholds.append(points)
+            grades.append(grade)
+    return (thresholds, grades)
+
+def sweep_target_feasibility(states: list[State], remaining_credits: list[int]) -> FeasibilitySweep:
+    """
+    Works out, for every student and every remaining course load, the average grade points needed to reach
+    the target GPA and the lowest grade that earns them. Each student's totals are read once into columns,
+    so a scenario is one pass over the columns instead of a pass over every student's courses.
+
+    Args:
+        states (list[State]): The students to check.
+        remaining_credits (list[int]): The course loads to try, in credits still to take (each above 0).
+    Returns:
+        FeasibilitySweep: The needed grade points and minimum grades, by scenario and student.
+    """
+    thresholds, grades = get_grade_thresholds()
+    targets = array.array("d")
+    # grade points short of the target over the credits already taken (negative when ahead of it)
+    shortfalls = array.array("d")
+    for state in states:
+        total_grade_points, total_credits = get_GPA_totals(state.courses)
+        targets.append(state.target_GPA)
+        shortfalls.append(state.target_GPA * total_credits - total_grade_points)
+    needed_points: list[array.array] = []
+    minimum_grades: list[list] = []
+    for credits in remaining_credits:
+        # rounded so a need of exactly a scale step is not pushed past it by float error
+        needed = array.array("d", [max(round(shortfall/credits + target, 6), 0.0)
+                                   for shortfall, target in zip(shortfalls, targets)])
+        needed_points.append(needed)
+        minimum_grades.append([grades[bisect.bisect_left(thresholds, points)] if points <= thresholds[-1] else None
+                               for points in needed])
+    return FeasibilitySweep([state.student_name for state in states], list(remaining_credits), needed_points,
+                            minimum_grades)
+
+# approximate score statistics
+# each level keeps this share of the items the level above it keeps (KLL), so a sketch holds
+# about 3k items plus a few per level, however many scores it has seen
+SKETCH_LEVEL_RATIO = 2/3
+# no level is smaller than this (or k), so the bottom level is not compacted every few scores
+SKETCH_MIN_CAPACITY = 8
+
+def get_level_capacity(sketch: ScoreSketch, height: int) -> int:
+    """
+    Finds how many items a sketch level holds before it is compacted: k for the top level,
+    and 2/3 as many for each level below it (at least SKETCH_MIN_CAPACITY).
+
+    Args:
+        sketch (ScoreSketch): The sketch.
+        height (int): The level (0 is the bottom, where new scores go).
+    Returns:
+        int: The level's capacity.
+    """
+    return max(math.ceil(sketch.k * SKETCH_LEVEL_RATIO ** (len(sketch.levels) - 1 - height)),
+               min(sketch.k, SKETCH_MIN_CAPACITY))
+
+def add_to_sketch(sketch: ScoreSketch, score: float):
+    """
+    Adds a score to a sketch. Count, sum, min, and max stay exact; quantiles are approximate.
+
+    Args:
+        sketch (ScoreSketch): The sketch to add to.
+        score (float): The new score.
+    Returns:
+        None
+    """
+    sketch.count += 1
+    sketch.total += score
+    sketch.minimum = min(sketch.minimum, score)
+    sketch.maximum = max(sketch.maximum, score)
+    sketch.levels[0].append(score)
+    if len(sketch.levels[0]) > get_level_capacity(sketch, 0):
+        _compact_sketch(sketch)
+
+def _compact_sketch(sketch: ScoreSketch, every_level: bool = False):
+    """
+    Halves full levels (KLL-style): sorts each and promotes every other item to the level above,
+    where each item counts twice as much. Lower levels hold fewer items (get_level_capacity), so
+    memory stays about 3k items in all, however many levels there are.
+
+    Args:
+        sketch (ScoreSketch): The sketch to compact.
+        every_level (bool): Check every level, not just up to the first one that is not full
+            (after a merge, any level can be over).
+    Returns:
+        None
+    """
+    height = 0
+    while height < len(sketch.levels):
+        level = sketch.levels[height]
+        if len(level) <= get_level_capacity(sketch, height):
+            if not every_level:
+                # the levels above gained nothing
+                break
+        else:
+            # levels are replaced rather than changed in place, so copies of the sketch can share them
+            level = sorted(level)
+            # an odd item out stays behind, so the total weight always equals the count
+            paired = len(level) - len(level) % 2
+            # alternate which half is kept so the rounding errors cancel out
+            offset = sketch.compactions % 2
+            sketch.compactions += 1
+            if height + 1 == len(sketch.levels):
+                sketch.levels.append([])
+            sketch.levels[height + 1] = sketch.levels[height + 1] + level[offset:paired:2]
+            sketch.levels[height] = level[paired:]
+        height += 1
+
+def merge_sketches(first: ScoreSketch, second: ScoreSketch) -> ScoreSketch:
+    """
+    Combines sketches built on different shards into one sketch of all their scores.
+
+    Args:
+        first (ScoreSketch): A sketch.
+        second (ScoreSketch): Another sketch with the same k.
+    Returns:
+        ScoreSketch: A new sketch; the inputs are not changed.
+    """
+    merged = ScoreSketch(k=first.k, count=first.count + second.count, total=first.total + second.total,
+                         minimum=min(first.minimum, second.minimum), maximum=max(first.maximum, second.maximum),
+                         levels=[[] for _ in range(max(len(first.levels), len(second.levels)))],
+                         compactions=first.compactions + second.compactions)
+    for sketch in [first, second]:
+        for height, level in enumerate(sketch.levels):
+            merged.levels[height].extend(level)
+    _compact_sketch(merged, every_level=True)
+    return merged
+
+def get_sketch_items(sketch: ScoreSketch) -> tuple[list[float], list[int]]:
+    """
+    Lists the sketch's sampled scores in order with the running total of their weights.
+
+    Args:
+        sketch (ScoreSketch): The sketch.
+    Returns:
+        tuple[list[float], list[int]]: The sorted scores and, for each, how many scores are at or below it.
+    """
+    weighted = sorted((score, 2**height) for height, level in enumerate(sketch.levels) for score in level)
+    scores = [score for score, _ in weighted]
+    cumulative = []
+    running = 0
+    for _, weight in weighted:
+        running += weight
+        cumulative.append(running)
+    return (scores, cumulative)
+
+def get_sketch_percentile(sketch: ScoreSketch, percent: float) -> float:
+    """
+    Estimates a percentile from a sketch.
+
+    Args:
+        sketch (ScoreSketch): The sketch.
+        percent (float): The percentile to find, from 0 to 100.
+    Returns:
+        float: The estimated percentile rounded to 2 places, or None if the sketch is empty.
+    """
+    if not sketch.count:
+        return None
+    percent = min(max(percent, 0.0), 100.0)
+    if percent == 0.0:
+        return sketch.minimum
+    if percent == 100.0:
+        return sketch.maximum
+    scores, cumulative = get_sketch_items(sketch)
+    position = bisect.bisect_left(cumulative, sketch.count * percent/100)
+    return round(scores[min(position, len(scores) - 1)], 2)
+
+def get_sketch_rank(sketch: ScoreSketch, score: float) -> float:
+    """
+    Estimates the percent of scores at or below a score.
+
+    Args:
+        sketch (ScoreSketch): The sketch.
+        score (float): The score to rank.
+    Returns:
+        float: The estimated percentile rank rounded to 1 place, or None if the sketch is empty.
+    """
+    if not sketch.count:
+        return None
+    scores, cumulative = get_sketch_items(sketch)
+    position = bisect.bisect_right(scores, score)
+    return round(100 * (cumulative[position - 1] if position else 0)/sketch.count, 1)
+
+def get_sketch_histogram(sketch: ScoreSketch, edges: list[float] = HISTOGRAM_EDGES) -> list[int]:
+    """
+    Estimates how many scores fall between bin edges, like get_histogram.
+
+    Args:
+        sketch (ScoreSketch): The sketch.
+        edges (list[float]): Ascending bin edges; a score equal to an edge goes in the higher bin.
+    Returns:
+        list[int]: len(edges) + 1 estimated counts that add up to the sketch's count.
+    """
+    scores, cumulative = get_sketch_items(sketch)
+    cuts = [0]
+    for edge in edges:
+        position = bisect.bisect_left(scores, edge)
+        cuts.append(cumulative[position - 1] if position else 0)
+    cuts.append(sketch.count)
+    return [cuts[i + 1] - cuts[i] for i in range(len(cuts) - 1)]
+
+def enable_approximate_scores(state: State, k: int = 200):
+    """
+    Switches a student to approximate mode: every course keeps a sketch of its scores
+    instead of the full history. Scores already recorded seed the sketches and are kept.
+
+    Args:
+        state (State): The current state of the application.
+        k (int): Items kept in the top sketch level, also used for courses added later; larger is
+            more accurate and uses more memory.
+    Returns:
+        None
+    """
+    state.approximate_scores = True
+    state.sketch_k = k
+    for course in state.courses:
+        if course.sketch is None:
+            course.sketch = ScoreSketch(k=k)
+            for score in course.test_scores:
+                add_to_sketch(course.sketch, score)
+
+def get_all_scores_sketch(state: State) -> ScoreSketch:
+    """
+    Sketches every test score across courses, merging the sketches of courses that keep one
+    with the exact scores of the others.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        ScoreSketch: The combined sketch, or None if no course keeps a sketch with scores.
+    """
+    sketches = [course.sketch for course in state.courses if course.sketch is not None and course.sketch.count]
+    if not sketches:
+        return None
+    # a sketched course's sketch already holds any scores it had before
+    sketched_names = {course.course_name for course in state.courses if course.sketch is not None}
+    combined = ScoreSketch(k=state.sketch_k)
+    for course_name, test_scores in state.all_test_scores.items():
+        if course_name not in sketched_names:
+            for score in test_scores:
+                add_to_sketch(combined, score)
+    for sketch in sketches:
+        combined = merge_sketches(combined, sketch)
+    return combined
+
+def copy_sketch(sketch: ScoreSketch) -> ScoreSketch:
+    """
+    Copies a sketch, so the copy is unaffected by later scores. Only the bottom level is changed
+    in place (compaction replaces the others), so the copy shares the levels above it.
+
+    Args:
+        sketch (ScoreSketch): The sketch to copy.
+    Returns:
+        ScoreSketch: The copy.
+    """
+    return ScoreSketch(k=sketch.k, count=sketch.count, total=sketch.total, minimum=sketch.minimum,
+                       maximum=sketch.maximum, levels=[list(sketch.levels[0])] + sketch.levels[1:],
+                       compactions=sketch.compactions)
+
+# batch edits
+# operation -> (route it stands for, fields after the operation name, optional trailing fields)
+BATCH_OPERATIONS = {
+    "add_course": ("append_course", ["course", "credits", "grade"], ["term"]),
+    "add_score": ("append_score", ["course", "score"], ["category"]),
+    "change_grade": ("change_grade", ["course", "grade"], []),
+    "delete_course": ("delete_course", ["course"], []),
+}
+
+def parse_batch(text: str) -> list[tuple]:
+    """
+    Splits batch text into operations: one per line, with comma-separated fields.
+
+    Args:
+        text (str): Lines like "add_score, math241, 92".
+    Returns:
+        list[tuple]: One tuple of stripped fields per non-blank line.
+    """
+    return [tuple(part.strip() for part in line.split(",")) for line in text.splitlines() if line.strip()]
+
+def check_batch(state: State, operations: list[tuple]) -> tuple:
+    """
+    Validates a whole batch against the state as it will be when each operation runs,
+    so courses added earlier in the batch can be scored and deleted ones cannot.
+
+    Args:
+        state (State): The current state of the application.
+        operations (list[tuple]): Operations like ("add_score", "math241", "92").
+    Returns:
+        tuple: (the operations with parsed values, "") or ([], an error message for the first bad operation).
+    """
+    # course name -> [has recorded scores, has categories, category names every matching course has]
+    courses: dict[str, list] = {}
+    for course in state.courses:
+        scored, has_categories, categories = courses.get(course.course_name, [False, False, None])
+        courses[course.course_name] = [scored or has_recorded_scores(course), has_categories or bool(course.categories),
+                                       set(course.categories) if categories is None else categories & set(course.categories)]
+    parsed = []
+    for number, operation in enumerate(operations, start=1):
+        if not operation or operation[0] not in BATCH_OPERATIONS:
+            return ([], f"Line {number}: unknown operation. Use one of: {', '.join(BATCH_OPERATIONS)}.")
+        kind = operation[0]
+        _, fields, optional = BATCH_OPERATIONS[kind]
+        if not len(fields) <= len(operation) - 1 <= len(fields) + len(optional):
+            return ([], f"Line {number}: {kind} takes {', '.join(fields + optional)}.")
+        course_name = operation[1]
+        if kind == "add_course":
+            course_credits = parse_whole_number(operation[2])
+            course_grade = parse_grade(operation[3])
+            if (not course_name or course_credits is None or not 0 < course_credits <= MAX_CREDITS
+                    or course_grade is None):
+                return ([], f"Line {number}: invalid course input.")
+            term = operation[4] if len(operation) > 4 else ""
+            parsed.append((kind, course_name, course_credits, course_grade, term))
+            # a same-named course already there keeps its scores and categories; the new one has none
+            scored, has_categories, _ = courses.get(course_name, [False, False, None])
+            courses[course_name] = [scored, has_categories, set()]
+            continue
+        if course_name not in courses:
+            return ([], f"Line {number}: there is no course named {course_name}.")
+        scored, has_categories, categories = courses[course_name]
+        if kind == "add_score":
+            score = parse_grade(operation[2])
+            category = operation[3] if len(operation) > 3 else ""
+            if score is None:
+                return ([], f"Line {number}: invalid test score.")
+            if (category or has_categories) and category not in categories:
+                return ([], f"Line {number}: '{category}' is not a score category of {course_name}.")
+            parsed.append((kind, course_name, score, category))
+            courses[course_name][0] = True
+        elif kind == "change_grade":
+            grade = parse_grade(operation[2])
+            if grade is None:
+                return ([], f"Line {number}: invalid grade.")
+            if scored:
+                return ([], f"Line {number}: the grade for {course_name} is computed from its test scores.")
+            parsed.append((kind, course_name, grade))
+        else:
+            parsed.append((kind, course_name))
+            del courses[course_name]
+    return (parsed, "")
+
+def apply_batch(state: State, operations: list[tuple]) -> str:
+    """
+    Applies a list of edits all at once: either every operation is valid and all are applied,
+    or nothing changes. The GPA and derived data are recomputed once, and the batch is one undo step.
+
+    Args:
+        state (State): The current state of the application.
+        operations (list[tuple]): Operations with text fields, like the forms send:
+            ("add_course", name, credits, grade[, term]), ("add_score", course, score[, category]),
+            ("change_grade", course, grade), or ("delete_course", course).
+    Returns:
+        str: "" if the batch was applied, otherwise why it was rejected.
+    """
+    parsed, error = check_batch(state, operations)
+    if error:
+        return error
+    edits = []
+    defer_updates(state)
+    try:
+        for kind, course_name, *values in parsed:
+            if kind == "add_course":
+                inverse = insert_course(state, course_name, values[0], values[1], values[2])
+            elif kind == "add_score":
+                inverse = insert_score(state, course_name, values[0], values[1])
+            elif kind == "change_grade":
+                inverse = set_grade(state, course_name, values[0])
+            else:
+                inverse = remove_courses(state, course_name)
+            edits.append((BATCH_OPERATIONS[kind][0], inverse))
+    finally:
+        finish_updates(state)
+    if edits:
+        # an empty batch changes nothing, so it is not an undo step
+        record_edit(state, "apply_batch", (list(operations),), {"edits": edits})
+    return ""
+
+@route
+@hold_api_lock
+@track_payload
+def batch_edit(state: State) -> Page:
+    """
+    Page to enter many edits at once, one per line.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        Page: The page with the batch input.
+    """
+    return Page(
+        state,
+        content=[
+            "Enter one edit per line:",
+            "add_course, name, credits, grade, term (optional)",
+            "add_score, course, score, category (optional)",
+            "change_grade, course, grade",
+            "delete_course, course",
+            TextArea(name="batch_operations"),
+            Button(text="Apply Edits", url="/apply_batch_edits"),
+            Button(text="Cancel", url="/index")
+        ]
+    )
+
+@route
+@hold_api_lock
+@track_payload
+def apply_batch_edits(state: State, batch_operations: str) -> Page:
+    """
+    Applies the edits from the batch page, all or nothing.
+
+    Args:
+        state (State): The current state of the application.
+        batch_operations (str): The edits, one per line.
+    Returns:
+        Page: The updated home page, or an error message if any edit is invalid (nothing is applied).
+    """
+    error = apply_batch(state, parse_batch(batch_operations))
+    if error:
+        return Page(
+            state,
+            content=[f"{error} No edits were applied. Please try again.",
+             Button("Batch Edit", "/batch_edit"),
+             Button("Go to Home", "/index")]
+        )
+    return index(state)
+
+# undo/redo
+def record_edit(state: State, route: str, arguments: tuple, inverse: dict):
+    """
+    Remembers a successful change so it can be undone. A new change (not a redo) clears the redo list.
+
+    Args:
+        state (State): The current state of the application.
+        route (str): The name of the route that made the change.
+        arguments (tuple): The route's arguments after state, for redo.
+        inverse (dict): What the change replaced, for undo.
+    Returns:
+        None
+    """
+    state.history.done.append(Edit(route, arguments, inverse))
+    state.history.edit_count += 1
+    if not state.history.replaying:
+        state.history.undone.clear()
+    enforce_retention(state)
+    # every change passes through here, so this is where saved states are kept current
+    save_state(state)
+
+def _undo_append_course(state: State, inverse: dict):
+    """
+    Removes the course an append_course added, and its term if the course introduced it.
+
+    Args:
+        state (State): The current state of the application.
+        inverse (dict): The edit's recorded inverse.
+    Returns:
+        None
+    """
+    course = state.courses.pop()
+    note_course_removal(state, course)
+    if inverse["new_term"]:
+        state.terms.remove(course.term)
+        state.term_ledger.ready = False
+    update_GPA(state)
+
+def _undo_delete_course(state: State, inverse: dict):
+    """
+    Puts deleted courses back where they were, with their test scores.
+
+    Args:
+        state (State): The current state of the application.
+        inverse (dict): The edit's recorded inverse.
+    Returns:
+        None
+    """
+    for position, course in inverse["removed"]:
+        state.courses.insert(position, course)
+    if inverse["scores"] is not None:
+        state.all_test_scores[inverse["removed"][0][1].course_name] = inverse["scores"]
+        state.score_index.ready = False
+        mark_changed(state, "scores")
+    update_GPA(state)
+    for _, course in inverse["removed"]:
+        note_course_change(state, course, (0.0, 0))
+
+def _undo_change_grade(state: State, inverse: dict):
+    """
+    Restores the grades a change_grade replaced.
+
+    Args:
+        state (State): The current state of the application.
+        inverse (dict): The edit's recorded inverse.
+    Returns:
+        None
+    """
+    for position, old_grade in reversed(inverse["changed"]):
+        course = state.courses[position]
+        old_contribution = get_course_contribution(course)
+        course.current_grade = old_grade
+        update_GPA(state)
+        note_course_change(state, course, old_contribution)
+
+def _undo_append_score(state: State, inverse: dict):
+    """
+    Takes back a score from the course's history (or its sketch), its category totals, and its grade.
+
+    Args:
+        state (State): The current state of the application.
+        inverse (dict): The edit's recorded inverse.
+    Returns:
+        None
+    """
+    score = inverse["score"]
+    for position, old_grade, new_entry, old_sketch in reversed(inverse["changed"]):
+        course = state.courses[position]
+        if isinstance(old_sketch, ScoreSketch):
+            course.sketch = old_sketch
+        elif old_sketch is not None:
+            course.sketch.levels[0].pop()
+            course.sketch.count, course.sketch.total, course.sketch.minimum, course.sketch.maximum = old_sketch
+        else:
+            course.test_scores.pop()
+            state.all_test_scores[course.course_name].pop()
+            if new_entry:
+                del state.all_test_scores[course.course_name]
+            if state.score_index.ready:
+                _remove_sorted(state.score_index.by_course[course.course_name], score)
+                _remove_sorted(state.score_index.all_scores, score)
+            mark_changed(state, "scores")
+        if course.categories:
+            category = course.categories[inverse["category"]]
+            category.total -= score
+            category.count -= 1
+            if category.drop_lowest:
+                category.lowest.remove(score)
+                heapq.heapify(category.lowest)
+        old_contribution = get_course_contribution(course)
+        course.current_grade = old_grade
+        update_GPA(state)
+        note_course_change(state, course, old_contribution)
+
+def _undo_append_category(state: State, inverse: dict):
+    """
+    Removes the category an append_category added.
+
+    Args:
+        state (State): The current state of the application.
+        inverse (dict): The edit's recorded inverse.
+    Returns:
+        None
+    """
+    for position in inverse["changed"]:
+        course = state.courses[position]
+        # the category was added last
+        del course.categories[next(reversed(course.categories))]
+
+def _undo_start_app(state: State, inverse: dict):
+    """
+    Restores the student's name and GPAs from before start_app.
+
+    Args:
+        state (State): The current state of the application.
+        inverse (dict): The edit's recorded inverse.
+    Returns:
+        None
+    """
+    state.student_name, state.current_GPA, state.target_GPA, state.is_failing = inverse["student"]
+    mark_changed(state, "GPA")
+    update_cohort(state)
+
+def _undo_apply_batch(state: State, inverse: dict):
+    """
+    Reverses every edit of a batch, newest first, recomputing derived data once.
+
+    Args:
+        state (State): The current state of the application.
+        inverse (dict): The edit's recorded inverse.
+    Returns:
+        None
+    """
+    defer_updates(state)
+    try:
+        for route_name, edit_inverse in reversed(inverse["edits"]):
+            UNDOABLE_ROUTES[route_name][1](state, edit_inverse)
+    finally:
+        finish_updates(state)
+
+# route name -> (route, function that reverses it)
+UNDOABLE_ROUTES = {
+    "append_course": (append_course, _undo_append_course),
+    "delete_course": (delete_course, _undo_delete_course),
+    "change_grade": (change_grade, _undo_change_grade),
+    "append_score": (append_score, _undo_append_score),
+    "append_category": (append_category, _undo_append_category),
+    "start_app": (start_app, _undo_start_app),
+    "apply_batch": (apply_batch, _undo_apply_batch),
+}
+
+@route
+@hold_api_lock
+@track_payload
+def undo(state: State) -> Page:
+    """
+    Reverses the most recent change.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        Page: The home page, or a message if there is nothing to undo.
+    """
+    if not state.history.done:
+        return Page(state, content=["Nothing to undo.", Button("Go to Home", "/index")])
+    edit = state.history.done.pop()
+    UNDOABLE_ROUTES[edit.route][1](state, edit.inverse)
+    state.history.undone.append(edit)
+    save_state(state)
+    return index(state)
+
+@route
+@hold_api_lock
+@track_payload
+def redo(state: State) -> Page:
+    """
+    Re-applies the most recently undone change by running its route again.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        Page: The home page, or a message if there is nothing to redo.
+    """
+    if not state.history.undone:
+        return Page(state, content=["Nothing to redo.", Button("Go to Home", "/index")])
+    edit = state.history.undone.pop()
+    state.history.replaying = True
+    try:
+        UNDOABLE_ROUTES[edit.route][0](state, *edit.arguments)
+    finally:
+        state.history.replaying = False
+    return index(state)
+
+# binary serialization
+STATE_FORMAT_MAGIC = b"SPAS"
+STATE_FORMAT_VERSION = 2
+# stands in for credits that failed validation (None) in the packed credits array
+MISSING_CREDITS = -2**31
+
+@dataclass
+class BinaryReader:
+    data: bytes
+    offset: int = 0
+
+def _pack_array(typecode: str, values) -> bytes:
+    """
+    Packs numbers into little-endian bytes with the array module.
+
+    Args:
+        typecode (str): The array typecode ("d" for floats, "I"/"i" for 32-bit ints).
+        values: The numbers to pack.
+    Returns:
+        bytes: The packed numbers.
+    """
+    packed = array.array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+def _read(reader: BinaryReader, layout: str) -> tuple:
+    """
+    Reads fixed-size fields with struct and moves past them.
+
+    Args:
+        reader (BinaryReader): Where to read from.
+        layout (str): A struct format (little-endian, e.g. "<dd").
+    Returns:
+        tuple: The fields.
+    """
+    values = struct.unpack_from(layout, reader.data, reader.offset)
+    reader.offset += struct.calcsize(layout)
+    return values
+
+def _read_array(reader: BinaryReader, typecode: str, count: int) -> array.array:
+    """
+    Reads numbers packed by _pack_array and moves past them.
+
+    Args:
+        reader (BinaryReader): Where to read from.
+        typecode (str): The array typecode.
+        count (int): How many numbers to read.
+    Returns:
+        array.array: The numbers.
+    """
+    values = array.array(typecode)
+    end = reader.offset + count * values.itemsize
+    if end > len(reader.data):
+        raise ValueError("Truncated state data.")
+    values.frombytes(reader.data[reader.offset:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    reader.offset = end
+    return values
+
+def encode_state(state: State) -> bytes:
+    """
+    Encodes the student's record (not the caches or undo history) in a compact binary format:
+    a versioned header, a table of every distinct string, then packed arrays of course credits,
+    grades, and scores. Courses with categories or sketches get a short extra section.
+
+    Args:
+        state (State): The state to encode.
+    Returns:
+        bytes: The encoded state.
+    """
+    strings: dict[str, int] = {}
+    def string_id(text: str) -> int:
+        return strings.setdefault(text, len(strings))
+
+    courses = state.courses
+    mirrored = state.all_test_scores == {course.course_name: course.test_scores for course in courses if course.test_scores}
+    flags = state.is_failing | state.approximate_scores << 1 | mirrored << 2
+    string_id(state.student_name)
+    term_ids = [string_id(term) for term in state.terms]
+    name_ids = [string_id(course.course_name) for course in courses]
+    course_term_ids = [string_id(course.term) for course in courses]
+    # (credits outside the 32-bit range were never valid, so they are saved as missing)
+    credits = [course.credits if isinstance(course.credits, int) and MISSING_CREDITS < course.credits < 2**31
+               else MISSING_CREDITS for course in courses]
+    grades = [course.current_grade if course.valid_grade else math.nan for course in courses]
+
+    extras = []
+    extra_count = 0
+    for position, course in enumerate(courses):
+        if not course.categories and course.sketch is None:
+            continue
+        extra_count += 1
+        extras.append(struct.pack("<II", position, len(course.categories)))
+        for name, category in course.categories.items():
+            extras.append(struct.pack("<IdBdII", string_id(name), category.weight, category.drop_lowest,
+                                      category.total, category.count, len(category.lowest)))
+            extras.append(_pack_array("d", category.lowest))
+        sketch = course.sketch
+        extras.append(struct.pack("<B", sketch is not None))
+        if sketch is not None:
+            extras.append(struct.pack("<IQdddII", sketch.k, sketch.count, sketch.total, sketch.minimum,
+                                      sketch.maximum, sketch.compactions, len(sketch.levels)))
+            extras.append(_pack_array("I", [len(level) for level in sketch.levels]))
+            extras.append(_pack_array("d", [score for level in sketch.levels for score in level]))
+
+    score_sources = [course.test_scores for course in courses]
+    # all_test_scores is only written out when it is not just a copy of the course histories
+    unmirrored_scores = []
+    if not mirrored:
+        key_ids = [string_id(name) for name in state.all_test_scores]
+        unmirrored_scores = [struct.pack("<I", len(key_ids)), _pack_array("I", key_ids),
+                        _pack_array("I", [len(scores) for scores in state.all_test_scores.values()]),
+                        _pack_array("d", [score for scores in state.all_test_scores.values() for score in scores])]
+
+    encoded_strings = [text.encode("utf-8") for text in strings]
+    return b"".join([
+        struct.pack("<4sHBdd", STATE_FORMAT_MAGIC, STATE_FORMAT_VERSION, flags, state.current_GPA, state.target_GPA),
+        struct.pack("<I", len(encoded_strings)), _pack_array("I", [len(text) for text in encoded_strings]),
+        b"".join(encoded_strings),
+        struct.pack("<I", len(term_ids)), _pack_array("I", term_ids),
+        struct.pack("<I", len(courses)), _pack_array("I", name_ids), _pack_array("I", course_term_ids),
+        _pack_array("i", credits), _pack_array("d", grades),
+        _pack_array("I", [len(scores) for scores in score_sources]),
+        _pack_array("d", [score for scores in score_sources for score in scores]),
+        struct.pack("<I", extra_count), b"".join(extras),
+    ] + unmirrored_scores + ([struct.pack("<I", state.sketch_k)] if state.approximate_scores else []))
+
+def _decode_v1(reader: BinaryReader, flags: int, current_GPA: float, target_GPA: float) -> State:
+    """
+    Decodes the body of a version 1 state.
+
+    Args:
+        reader (BinaryReader): Positioned just after the header.
+        flags (int): The header flags.
+        current_GPA (float): The GPA from the header.
+        target_GPA (float): The target GPA from the header.
+    Returns:
+        State: The decoded state.
+    """
+    (string_count,) = _read(reader, "<I")
+    lengths = _read_array(reader, "I", string_count)
+    strings = []
+    for length in lengths:
+        strings.append(reader.data[reader.offset:reader.offset + length].decode("utf-8"))
+        reader.offset += length
+    (term_count,) = _read(reader, "<I")
+    # states saved before terms were kept in date order may list them as they were added
+    terms = sorted((strings[term_id] for term_id in _read_array(reader, "I", term_count)), key=get_term_key)
+    (course_count,) = _read(reader, "<I")
+    name_ids = _read_array(reader, "I", course_count)
+    course_term_ids = _read_array(reader, "I", course_count)
+    credits = _read_array(reader, "i", course_count)
+    grades = _read_array(reader, "d", course_count)
+    score_counts = _read_array(reader, "I", course_count)
+    scores = _read_array(reader, "d", sum(score_counts))
+
+    courses = []
+    start = 0
+    scores = scores.tolist()
+    # each distinct name is looked up in the catalog once
+    catalog_entries = {name_id: get_catalog_entry(strings[name_id]) for name_id in set(name_ids)}
+    for position in range(course_count):
+        end = start + score_counts[position]
+        # missing grades were written as NaN
+        grade = None if math.isnan(grades[position]) else grades[position]
+        course_credits = credits[position]
+        entry = catalog_entries[name_ids[position]]
+        valid_credits = 0 <= course_credits <= MAX_CREDITS
+        # the values were validated when they were first written, so skip Course.__setattr__
+        course = Course.__new__(Course)
+        course.__dict__.update(course_name=entry.course_name, catalog_entry=entry,
+                               credits=None if course_credits == MISSING_CREDITS else course_credits,
+                               current_grade=grade, test_scores=scores[start:end],
+                               term=strings[course_term_ids[position]], categories={}, sketch=None,
+                               valid_grade=grade is not None, valid_credits=valid_credits)
+        courses.append(course)
+        start = end
+
+    (extra_count,) = _read(reader, "<I")
+    for _ in range(extra_count):
+        position, category_count = _read(reader, "<II")
+        course = courses[position]
+        for _ in range(category_count):
+            name_id, weight, drop_lowest, total, count, lowest_count = _read(reader, "<IdBdII")
+            course.categories[strings[name_id]] = ScoreCategory(weight, bool(drop_lowest), total, count,
+                                                                _read_array(reader, "d", lowest_count).tolist())
+        (has_sketch,) = _read(reader, "<B")
+        if has_sketch:
+            k, count, total, minimum, maximum, compactions, level_count = _read(reader, "<IQdddII")
+            level_lengths = _read_array(reader, "I", level_count)
+            items = _read_array(reader, "d", sum(level_lengths)).tolist()
+            levels = []
+            for length in level_lengths:
+                levels.append(items[:length])
+                del items[:length]
+            course.sketch = ScoreSketch(k, count, total, minimum, maximum, levels, compactions)
+
+    if flags & 4:
+        all_test_scores = {course.course_name: list(course.test_scores) for course in courses if course.test_scores}
+    else:
+        (key_count,) = _read(reader, "<I")
+        key_ids = _read_array(reader, "I", key_count)
+        counts = _read_array(reader, "I", key_count)
+        all_scores = _read_array(reader, "d", sum(counts))
+        all_test_scores = {}
+        start = 0
+        for key_id, count in zip(key_ids, counts):
+            all_test_scores[get_catalog_entry(strings[key_id]).course_name] = all_scores[start:start + count].tolist()
+            start += count
+    return State(strings[0], current_GPA, target_GPA, bool(flags & 1), courses, all_test_scores, terms,
+                 bool(flags & 2))
+
+def _decode_v2(reader: BinaryReader, flags: int, current_GPA: float, target_GPA: float) -> State:
+    """
+    Decodes the body of a version 2 state: a version 1 body, then the sketch k of an approximate-mode student.
+
+    Args:
+        reader (BinaryReader): Positioned just after the header.
+        flags (int): The header flags.
+        current_GPA (float): The GPA from the header.
+        target_GPA (float): The target GPA from the header.
+    Returns:
+        State: The decoded state.
+    """
+    state = _decode_v1(reader, flags, current_GPA, target_GPA)
+    if state.approximate_scores:
+        (state.sketch_k,) = _read(reader, "<I")
+    return state
+
+# format version -> decoder; older versions keep their decoder so saved states can always be read
+STATE_DECODERS = {
+    1: _decode_v1,
+    2: _decode_v2,
+}
+
+def decode_state(data: bytes) -> State:
+    """
+    Decodes a state written by encode_state, with any format version up to the current one.
+
+    Args:
+        data (bytes): The encoded state.
+    Returns:
+        State: The decoded state (its caches are rebuilt on first use).
+    """
+    reader = BinaryReader(data)
+    try:
+        magic, version, flags, current_GPA, target_GPA = _read(reader, "<4sHBdd")
+    except struct.error:
+        raise ValueError("Truncated state data.")
+    if magic != STATE_FORMAT_MAGIC:
+        raise ValueError("Not an encoded state.")
+    if version not in STATE_DECODERS:
+        raise ValueError(f"State format version {version} is newer than this app supports ({STATE_FORMAT_VERSION}).")
+    try:
+        return STATE_DECODERS[version](reader, flags, current_GPA, target_GPA)
+    except (struct.error, IndexError, UnicodeDecodeError):
+        raise ValueError("Corrupt state data.")
+
+# saved states and warm start
+# where student records are saved (as encode_state files); "" turns saving off
+STATE_DIR = os.environ.get("ANALYZER_STATE_DIR", "")
+STATE_FILE_SUFFIX = ".state"
+# records read from STATE_DIR, by student name
+SAVED_STATES: dict[str, State] = {}
+
+def get_state_path(student_name: str) -> str:
+    """
+    Finds the file a student's record is saved in.
+
+    Args:
+        student_name (str): The student's name (letters and spaces, checked by start_app).
+    Returns:
+        str: The file path.
+    """
+    return os.path.join(STATE_DIR, student_name + STATE_FILE_SUFFIX)
+
+def save_state(state: State):
+    """
+    Saves the student's record to STATE_DIR, replacing the old file in one step so a crash
+    never leaves half a file, and marks it for the next snapshot to read replicas. Does nothing
+    if saving is off or no student has started yet.
+
+    Args:
+        state (State): The current state of the application.
+    Returns:
+        None
+    """
+    if not state.student_name:
+        return
+    if REPLICA_PORTS:
+        UNPUBLISHED.add(state.student_name)
+    if not STATE_DIR:
+        return
+    path = get_state_path(state.student_name)
+    with open(path + ".tmp", "wb") as file:
+        file.write(encode_state(state))
+    os.replace(path + ".tmp", path)
+    SAVED_STATES[state.student_name] = state
+
+def load_saved_state(student_name: str) -> State:
+    """
+    Finds a student's saved record, reading it now if the background preload has not reached it yet.
+
+    Args:
+        student_name (str): The student's name.
+    Returns:
+        State: The saved record, or None if there is none.
+    """
+    if student_name in SAVED_STATES:
+        return SAVED_STATES[student_name]
+    # a name that is not valid (say, "../x") never names a file
+    if not STATE_DIR or not is_valid_student_name(student_name):
+        return None
+    try:
+        with open(get_state_path(student_name), "rb") as file:
+            decoded = decode_state(file.read())
+    except (OSError, ValueError):
+        return None
+    # the preload thread and requests can read the same file at once; setdefault keeps whichever copy
+    # was stored first, so a copy a request has already loaded and changed is never replaced
+    return SAVED_STATES.setdefault(student_name, decoded)
+
+def preload_states() -> threading.Thread:
+    """
+    Starts reading every saved record in STATE_DIR on a background thread, so the server can
+    take requests right away; a student who arrives first is loaded on demand.
+
+    Returns:
+        threading.Thread: The preload thread (already started).
+    """
+    def preload():
+        names = [name for name in os.listdir(STATE_DIR) if name.endswith(STATE_FILE_SUFFIX)] if STATE_DIR else []
+        for name in names:
+            load_saved_state(name[:-len(STATE_FILE_SUFFIX)])
+
+    thread = threading.Thread(target=preload, name="preload_states", daemon=True)
+    thread.start()
+    return thread
+
+# alerts
+# advisors hear when a student starts or stops failing, or drifts another ALERT_DRIFT_STEP below the
+# target GPA. Each GPA update checks only its own student, and only changes raise alerts; a background
+# thread appends them to the outbox file in batches, so a request never waits on delivery.
+ALERT_DRIFT_STEP = 0.25
+# the outbox, as JSON lines; without one, alerts wait in PENDING_ALERTS for GET /api/alerts (take_alerts)
+ALERT_OUTBOX = os.environ.get("ANALYZER_ALERT_OUTBOX", "")
+ALERT_BATCH_SECONDS = 0.5
+# undelivered alerts past this many drop the oldest
+MAX_PENDING_ALERTS = 10_000
+
+@dataclass
+class Alert:
+    student_name: str
+    # "failing", "recovered", or "drift"
+    kind: str
+    GPA: float
+    target_GPA: float
+    # time.time() when it was raised
+    time: float
+
+PENDING_ALERTS: collections.deque = collections.deque(maxlen=MAX_PENDING_ALERTS)
+ALERTS_WAITING = threading.Event()
+
+def check_alerts(state: State, was_failing: bool):
+    """
+    Raises an alert for each transition a GPA update made: into or out of failing, or a step further
+    below the target GPA. The first update only sets where the student stands.
+
+    Args:
+        state (State): The state after the GPA update.
+        was_failing (bool): Whether the student was failing before it.
+    Returns:
+        None
+    """
+    gap = state.target_GPA - state.current_GPA
+    level = math.floor(round(gap / ALERT_DRIFT_STEP, 6)) if gap > 0 else 0
+    kinds = []
+    if state.is_failing != was_failing:
+        kinds.append("failing" if state.is_failing else "recovered")
+    if state.alert_level is not None and level > state.alert_level:
+        kinds.append("drift")
+    state.alert_level = level
+    for kind in kinds:
+        PENDING_ALERTS.append(Alert(state.student_name, kind, state.current_GPA, state.target_GPA, time.time()))
+    if kinds and ALERT_OUTBOX:
+        start_alert_delivery()
+        ALERTS_WAITING.set()
+
+def deliver_alerts() -> int:
+    """
+    Appends every pending alert to ALERT_OUTBOX in one write. If the write fails, the alerts stay pending.
+
+    Returns:
+        int: How many alerts were delivered.
+    """
+    alerts = take_alerts()
+    if not alerts:
+        return 0
+    try:
+        with open(ALERT_OUTBOX, "a") as file:
+            file.write("".join(json.dumps(vars(alert)) + "\n" for alert in alerts))
+    except OSError:
+        # alerts raised meanwhile are newer, so they go after these; past MAX_PENDING_ALERTS the oldest drop
+        with API_LOCK:
+            alerts.extend(PENDING_ALERTS)
+            PENDING_ALERTS.clear()
+            PENDING_ALERTS.extend(alerts)
+        raise
+    return len(alerts)
+
+def take_alerts() -> list[Alert]:
+    """
+    Takes every pending alert, oldest first.
+
+    Returns:
+        list[Alert]: The alerts, no longer pending.
+    """
+    alerts = []
+    while PENDING_ALERTS:
+        alerts.append(PENDING_ALERTS.popleft())
+    return alerts
+
+def run_alert_delivery():
+    """
+    Delivers alerts ALERT_BATCH_SECONDS after the first of a batch is raised, for as long as the app runs.
+
+    Returns:
+        None
+    """
+    while True:
+        ALERTS_WAITING.wait()
+        time.sleep(ALERT_BATCH_SECONDS)
+        ALERTS_WAITING.clear()
+        try:
+            deliver_alerts()
+        except OSError:
+            # try again with the next batch
+            ALERTS_WAITING.set()
+
+@functools.cache
+def start_alert_delivery() -> threading.Thread:
+    """
+    Starts the alert delivery thread (once, when the first alert is raised).
+
+    Returns:
+        threading.Thread: The delivery thread.
+    """
+    thread = threading.Thread(target=run_alert_delivery, name="alert_delivery", daemon=True)
+    thread.start()
+    return thread
+
+# JSON API
+# every change goes through apply_batch, so it is validated, undoable, and saved like a form post
+
+def get_progress_stats(state: State) -> dict:
+    """
+    Collects the numbers on the progress page as plain data.
+
+    Args:
+        state (State): The student's state.
+    Returns:
+        dict: The GPA, target, failing status, and highest/lowest course and test score.
+    """
+    high_course, low_course = get_derived(state, "course_extremes")
+    (highest_score, highest_score_course), (lowest_score, lowest_score_course) = get_derived(state, "score_extremes")
+    return {
+        "student_name": state.student_name,
+        "GPA": state.current_GPA,
+        "target_GPA": state.target_GPA,
+        "is_failing": state.is_failing,
+        "points_to_target": get_derived(state, "points_to_target"),
+        "highest_course": None if high_course is None else {"course_name": high_course.course_name,
+                                                            "grade": high_course.current_grade},
+        "lowest_course": None if low_course is None else {"course_name": low_course.course_name,
+                                                          "grade": low_course.current_grade},
+        # the progress page shows scores as "95.0%"; the API sends the number
+        "highest_score": None if highest_score is None else {"course_name": highest_score_course,
+                                                             "score": float(highest_score[:-1])},
+        "lowest_score": None if lowest_score is None else {"course_name": lowest_score_course,
+                                                           "score": float(lowest_score[:-1])},
+        "course_count": len(state.courses),
+    }
+
+def get_course_data(course: Course) -> dict:
+    """
+    Describes a course as plain data.
+
+    Args:
+        course (Course): The course.
+    Returns:
+        dict: The course's name, credits, grade, term, and test scores.
+    """
+    return {"course_name": course.course_name, "credits": course.credits, "grade": course.current_grade,
+            "term": course.term, "test_scores": course.test_scores}
+
+def _api_operation(body: dict, kind: str, fields: list[str]) -> tuple:
+    """
+    Builds a batch operation from fields of a JSON body, as the text a form would send.
+
+    Args:
+        body (dict): The parsed request body.
+        kind (str): The batch operation.
+        fields (list[str]): The body fields to use, in order; missing trailing fields are left off.
+    Returns:
+        tuple: The operation.
+    """
+    values = [body.get(name) for name in fields]
+    while values and values[-1] is None:
+        values.pop()
+    return (kind,) + tuple("" if value is None else str(value) for value in values)
+
+def handle_api_request(method: str, path: str, body: bytes = b"", client: str = "", now: float = None,
+                       from_router: bool = False) -> tuple:
+    """
+    Answers one JSON API request, with a 500 error if answering it fails unexpectedly.
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The request path.
+        body (bytes): The request body (JSON), if any.
+        client (str): Who sent the request, for rate limiting scores; "" is not limited.
+        now (float): The time.monotonic() time of the request (defaults to now).
+        from_router (bool): Whether the request carries the router's secret: only the router may release
+            students or set a replica's workers, and only its workers may send a replica snapshots.
+    Returns:
+        tuple: (HTTP status code, response data)
+    """
+    try:
+        return _answer_api_request(method, path, body, client, now, from_router)
+    except Exception as error:
+        # the client gets an answer instead of a dropped connection
+        sys.stderr.write(f"API error on {method} {path}: {error!r}\n")
+        return (500, {"error": "Internal server error."})
+
+def _answer_api_request(method: str, path: str, body: bytes, client: str, now: float, from_router: bool) -> tuple:
+    """
+    Answers one JSON API request. Paths (student and course names URL-encoded):
+    POST /api/students; GET /api/students/<name> (progress stats); GET /api/students/<name>/gpa;
+    GET and POST /api/students/<name>/courses; PUT and DELETE /api/students/<name>/courses/<course>;
+    POST /api/students/<name>/scores (one score or {"scores": [...]}); POST /api/students/<name>/batch;
+    GET /api/ingestion (the score queue); GET /api/alerts (takes the pending alerts, without an outbox).
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The request path.
+        body (bytes): The request body (JSON), if any.
+        client (str): Who sent the request, for rate limiting scores; "" is not limited.
+        now (float): The time.monotonic() time of the request (defaults to now).
+        from_router (bool): Whether the shard router sent the request.
+    Returns:
+        tuple: (HTTP status code, response data)
+    """
+    parts = [urllib.parse.unquote(part) for part in urllib.parse.urlsplit(path).path.strip("/").split("/")]
+    if parts == ["api", "ingestion"] and method == "GET":
+        return (200, {"queued": INGESTION.size, "limit": INGESTION_QUEUE_LIMIT, "dropped": INGESTION.dropped})
+    if parts == ["api", "alerts"] and method == "GET":
+        if ALERT_OUTBOX:
+            return (404, {"error": "Alerts are delivered to the alert outbox."})
+        return (200, {"alerts": [vars(alert) for alert in take_alerts()]})
+    if parts == ["debug", "memory"] and method == "GET":
+        if not MEMORY_REPORTS:
+            return (503, {"error": "Memory has not been checked yet."})
+        return (200, MEMORY_REPORTS[-1])
+    if REPLICA_MODE:
+        now = time.monotonic() if now is None else now
+        if parts == ["api", "snapshots"] and method == "POST":
+            # workers send snapshots with the secret the router gave them, so no one else can overwrite students
+            if not from_router:
+                return (403, {"error": "Only the shard workers can send snapshots."})
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+            return (200, {"students": receive_snapshot(query.get("writer", [""])[0], body, "final" in query, now)})
+        if parts == ["api", "writers"] and method == "PUT":
+            if not from_router:
+                return (403, {"error": "Only the shard router can set the workers."})
+            try:
+                writers = json.loads(body)["writers"]
+            except (ValueError, TypeError, KeyError):
+                writers = None
+            if not isinstance(writers, list) or not all(isinstance(writer, str) for writer in writers):
+                return (400, {"error": "writers must be a list of shard names."})
+            REPLICA_WRITERS.clear()
+            REPLICA_WRITERS.update(writers)
+            return (200, {"writers": sorted(REPLICA_WRITERS)})
+        if method != "GET":
+            return (405, {"error": "This is a read-only replica."})
+        if not is_replica_current(now):
+            return (503, {"error": "This replica is behind."})
+    if parts[:2] != ["api", "students"] and parts != ["api", "shards"]:
+        return (404, {"error": "Unknown path."})
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        return (400, {"error": "The request body is not valid JSON."})
+    if not isinstance(data, dict):
+        return (400, {"error": "The request body must be a JSON object."})
+    if parts == ["api", "shards"]:
+        if not (SHARD_NAME and from_router):
+            return (403, {"error": "Only the shard router can release students."})
+        if method != "POST":
+            return (405, {"error": "Use POST to release students."})
+        shards = data.get("shards")
+        if not isinstance(shards, list) or not all(isinstance(shard, str) for shard in shards):
+            return (400, {"error": "shards must be a list of shard names."})
+        # no shards would release every student, which only a stopping router means to do
+        if not shards and data.get("stopping") is not True:
+            return (400, {"error": "shards must not be empty unless the router is stopping."})
+        return (200, {"released": release_students(shards)})
+
+    if len(parts) == 2:
+        if method != "POST":
+            return (405, {"error": "Use POST to add a student."})
+        existing = load_saved_state(str(data.get("student_name", "")))
+        if existing is not None:
+            # a returning student keeps their record unchanged
+            flush_writes(existing.student_name)
+            return (200, get_progress_stats(existing))
+        page = start_app(State("", 0.0, 4.0, True, [], {}), str(data.get("student_name", "")),
+                         str(data.get("current_GPA", "")), str(data.get("target_GPA", "")))
+        if not page.state.student_name:
+            return (400, {"error": page.content[0]})
+        SAVED_STATES[page.state.student_name] = page.state
+        save_state(page.state)
+        return (201, get_progress_stats(page.state))
+
+    if not is_valid_student_name(parts[2]):
+        return (400, {"error": "Student names are letters and spaces only."})
+    state = load_saved_state(parts[2])
+    if state is None:
+        return (404, {"error": f"There is no student named {parts[2]}."})
+    resource = parts[3:]
+    if not (method == "POST" and resource == ["scores"]):
+        # reads and other changes see (and come after) every buffered score
+        flush_writes(state.student_name)
+    if method == "GET":
+        if not resource:
+            return (200, get_progress_stats(state))
+        if resource == ["gpa"]:
+            return (200, {"GPA": state.current_GPA, "is_failing": state.is_failing})
+        if resource == ["courses"]:
+            return (200, {"courses": [get_course_data(course) for course in state.courses]})
+        return (404, {"error": "Unknown path."})
+
+    if method == "POST" and resource == ["courses"]:
+        operations = [_api_operation(data, "add_course", ["course_name", "credits", "current_grade", "term"])]
+    elif method == "PUT" and len(resource) == 2 and resource[0] == "courses":
+        operations = [("change_grade", resource[1], str(data.get("grade", "")))]
+    elif method == "DELETE" and len(resource) == 2 and resource[0] == "courses":
+        operations = [("delete_course", resource[1])]
+    elif method == "POST" and resource == ["scores"]:
+        scores = data.get("scores", [data])
+        if not isinstance(scores, list) or not all(isinstance(score, dict) for score in scores):
+            return (400, {"error": "scores must be a list of objects."})
+        operations = [_api_operation(score, "add_score", ["course_name", "score", "category"]) for score in scores]
+        if client:
+            # while any of the client's scores are queued, later ones wait behind them, keeping its order;
+            # tokens pay only for scores applied now, so queued scores are never charged twice
+            if client in INGESTION.clients:
+                return defer_scores(state, operations, 0.0, client)
+            wait = take_tokens(client, len(operations), time.monotonic() if now is None else now)
+            if wait:
+                return defer_scores(state, operations, wait, client)
+        return buffer_scores(state, operations)
+    elif method == "POST" and resource == ["batch"]:
+        operations = data.get("operations")
+        if not isinstance(operations, list) or not all(isinstance(operation, list) for operation in operations):
+            return (400, {"error": "operations must be a list of lists."})
+        operations = [tuple(str(value) for value in operation) for operation in operations]
+    else:
+        return (404, {"error": "Unknown path."})
+    error = apply_batch(state, operations)
+    if error:
+        return (400, {"error": error})
+    return (200, get_progress_stats(state))
+
+# rate limiting and the score queue
+# each API client may post this many scores per second, in bursts of up to RATE_LIMIT_BURST
+RATE_LIMIT_PER_SECOND = 50.0
+RATE_LIMIT_BURST = 200.0
+# scores posted past a client's limit wait here (at most this many) and are applied in the background
+INGESTION_QUEUE_LIMIT = 5_000
+# queued scores are applied about this many at a time, so interactive requests get the lock in between,
+# and no faster than INGESTION_PER_SECOND overall, so bulk clients cannot crowd out interactive ones
+INGESTION_BATCH_SIZE = 100
+INGESTION_PER_SECOND = 1_000.0
+
+@dataclass
+class TokenBucket:
+    tokens: float
+    updated: float
+
+@dataclass
+class IngestionQueue:
+    # (client, student name, operations) per deferred request
+    requests: collections.deque = field(default_factory=collections.deque)
+    # scores waiting, across all requests
+    size: int = 0
+    # client -> how many of its requests are waiting
+    clients: dict[str, int] = field(default_factory=dict)
+    # queued or buffered scores that no longer applied by the time their turn came
+    dropped: int = 0
+    waiting: threading.Event = field(default_factory=threading.Event)
+
+# client -> bucket, least recently used first
+RATE_LIMITS: collections.OrderedDict[str, TokenBucket] = collections.OrderedDict()
+INGESTION = IngestionQueue()
+
+def take_tokens(client: str, cost: int, now: float) -> float:
+    """
+    Spends tokens from a client's bucket, which refills at RATE_LIMIT_PER_SECOND up to RATE_LIMIT_BURST.
+    Buckets left idle long enough to refill are dropped, since a new bucket would be the same.
+
+    Args:
+        client (str): The client.
+        cost (int): How many scores the request posts.
+        now (float): The time.monotonic() time of the request.
+    Returns:
+        float: 0.0 if the tokens were spent, otherwise how many seconds until there would be enough.
+    """
+    while RATE_LIMITS:
+        oldest = next(iter(RATE_LIMITS.values()))
+        if (now - oldest.updated) * RATE_LIMIT_PER_SECOND < RATE_LIMIT_BURST:
+            break
+        RATE_LIMITS.popitem(last=False)
+    bucket = RATE_LIMITS.setdefault(client, TokenBucket(RATE_LIMIT_BURST, now))
+    RATE_LIMITS.move_to_end(client)
+    bucket.tokens = min(RATE_LIMIT_BURST, bucket.tokens + (now - bucket.updated) * RATE_LIMIT_PER_SECOND)
+    bucket.updated = now
+    if bucket.tokens >= cost:
+        bucket.tokens -= cost
+        return 0.0
+    # a request bigger than a full bucket is never taken right away; it waits for the queue
+    return (min(cost, RATE_LIMIT_BURST) - bucket.tokens) / RATE_LIMIT_PER_SECOND
+
+def defer_scores(state: State, operations: list[tuple], wait: float, client: str) -> tuple:
+    """
+    Queues scores from a client that is over its rate limit (or has scores queued already), or refuses
+    them if the queue is full. The scores are checked now, so a bad request is still refused right away.
+
+    Args:
+        state (State): The student's state.
+        operations (list[tuple]): The add_score operations.
+        wait (float): Seconds until the client's bucket could take them.
+        client (str): The client.
+    Returns:
+        tuple: (HTTP status code, response data): 202 if queued, 429 with retry_after if not.
+    """
+    error = check_batch(state, operations)[1]
+    if error:
+        return (400, {"error": error})
+    if INGESTION.size + len(operations) > INGESTION_QUEUE_LIMIT:
+        return (429, {"error": "Too many scores are waiting. Please try again later.", "retry_after": max(1, math.ceil(wait))})
+    INGESTION.requests.append((client, state.student_name, operations))
+    INGESTION.size += len(operations)
+    INGESTION.clients[client] = INGESTION.clients.get(client, 0) + 1
+    INGESTION.waiting.set()
+    return (202, {"queued": len(operations), "queue_depth": INGESTION.size})
+
+def apply_coalesced(student_name: str, requests: list[list]) -> int:
+    """
+    Applies several requests' operations for a student as one batch, so each course is averaged
+    once and the GPA is updated once. If the combined batch fails (say, a course was removed while
+    the scores waited), each request is tried alone.
+
+    Args:
+        student_name (str): The student.
+        requests (list[list]): Each request's operations, oldest first.
+    Returns:
+        int: How many operations could not be applied.
+    """
+    state = load_saved_state(student_name)
+    if state is not None and not apply_batch(state, [operation for operations in requests for operation in operations]):
+        return 0
+    return sum(len(operations) for operations in requests if state is None or apply_batch(state, operations))
+
+def drain_ingestion_queue(limit: int = INGESTION_BATCH_SIZE) -> int:
+    """
+    Applies queued scores, oldest first, coalescing each student's requests into one batch (one GPA
+    update). Call with API_LOCK held.
+
+    Args:
+        limit (int): Stop taking requests once this many scores are taken.
+    Returns:
+        int: How many scores were taken off the queue.
+    """
+    batches: dict[str, list] = {}
+    taken = 0
+    while INGESTION.requests and taken < limit:
+        client, student_name, operations = INGESTION.requests.popleft()
+        INGESTION.size -= len(operations)
+        INGESTION.clients[client] -= 1
+        if not INGESTION.clients[client]:
+            del INGESTION.clients[client]
+        batches.setdefault(student_name, []).append(operations)
+        taken += len(operations)
+    for student_name, requests in batches.items():
+        INGESTION.dropped += apply_coalesced(student_name, requests)
+    return taken
+
+# write coalescing
+# scores posted within the rate limit are buffered this long, then applied as one batch per student
+WRITE_COALESCE_SECONDS = 0.005
+# student name -> each buffered request's operations, oldest first
+WRITE_BUFFERS: dict[str, list] = {}
+WRITES_WAITING = threading.Event()
+
+def buffer_scores(state: State, operations: list[tuple]) -> tuple:
+    """
+    Checks posted scores and buffers them for a few milliseconds, so a burst of posts is applied
+    as one batch. Anything else that touches the student flushes the buffer first.
+
+    Args:
+        state (State): The student's state.
+        operations (list[tuple]): The add_score operations.
+    Returns:
+        tuple: (HTTP status code, response data): 202 if buffered, 400 if a score is invalid.
+    """
+    # buffered requests only add scores, which never change whether another score is valid
+    error = check_batch(state, operations)[1]
+    if error:
+        return (400, {"error": error})
+    buffered = WRITE_BUFFERS.setdefault(state.student_name, [])
+    buffered.append(operations)
+    WRITES_WAITING.set()
+    return (202, {"accepted": len(operations), "buffered_requests": len(buffered)})
+
+def flush_writes(student_name: str):
+    """
+    Applies a student's buffered scores now. Call with API_LOCK held.
+
+    Args:
+        student_name (str): The student.
+    Returns:
+        None
+    """
+    requests = WRITE_BUFFERS.pop(student_name, None)
+    if requests:
+        INGESTION.dropped += apply_coalesced(student_name, requests)
+
+def run_write_flusher():
+    """
+    Applies buffered scores a few milliseconds after the first of a burst arrives.
+
+    Returns:
+        None
+    """
+    while True:
+        WRITES_WAITING.wait()
+        time.sleep(WRITE_COALESCE_SECONDS)
+        with API_LOCK:
+            WRITES_WAITING.clear()
+            for student_name in list(WRITE_BUFFERS):
+                flush_writes(student_name)
+
+def run_ingestion_worker():
+    """
+    Applies queued scores in the background, a few at a time, for as long as the server runs.
+
+    Returns:
+        None
+    """
+    while True:
+        INGESTION.waiting.wait()
+        with API_LOCK:
+            taken = drain_ingestion_queue()
+            if not INGESTION.requests:
+                INGESTION.waiting.clear()
+        time.sleep(taken / INGESTION_PER_SECOND)
+
+def is_from_router(headers) -> bool:
+    """
+    Checks whether an API request was sent by this worker's shard router, which proves it with ROUTER_SECRET.
+
+    Args:
+        headers: The request headers.
+    Returns:
+        bool: True if the router sent it.
+    """
+    return bool(ROUTER_SECRET) and hmac.compare_digest(headers.get("X-Router-Secret", ""), ROUTER_SECRET)
+
+def get_client(headers, address: str) -> str:
+    """
+    Names the client of an API request, for rate limiting: its address, or, for a request forwarded
+    by the shard router, the address the router saw.
+
+    Args:
+        headers: The request headers.
+        address (str): The address the request came from.
+    Returns:
+        str: The client.
+    """
+    if is_from_router(headers):
+        return headers.get("X-Client-Id") or address
+    return address
+
+@functools.cache
+def get_api_handler() -> type:
+    """
+    Builds the HTTP request handler, importing http.server only when the API is started.
+
+    Returns:
+        type: The handler class.
+    """
+    import http.server
+
+    class APIRequestHandler(http.server.BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps connections open between requests (every response sends Content-Length)
+        protocol_version = "HTTP/1.1"
+        # headers and body go out in separate writes; without this the body can wait ~40 ms for an ACK
+        disable_nagle_algorithm = True
+
+        def respond(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            client = get_client(self.headers, self.client_address[0])
+            # the memory report is the last check's, so reading it never waits on other requests
+            lock = API_LOCK if urllib.parse.urlsplit(self.path).path != "/debug/memory" else threading.Lock()
+            with lock:
+                status, data = handle_api_request(self.command, self.path, body, client,
+                                                  from_router=is_from_router(self.headers))
+            if SNAPSHOT_OUTBOX:
+                # say, a released student's last changes, which reach the replicas before the router hears back
+                send_snapshots()
+            payload, encoding = compress_payload(json.dumps(data).encode("utf-8"),
+                                                 self.headers.get("Accept-Encoding", ""))
+            headers = {"Content-Type": "application/json"}
+            if "retry_after" in data:
+                headers["Retry-After"] = str(data["retry_after"])
+            if encoding:
+                headers["Content-Encoding"] = encoding
+            self.send(status, headers, payload)
+
+        def send(self, status: int, headers: dict, payload: bytes):
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        # through self, so subclasses can answer differently
+        do_GET = do_POST = do_PUT = do_DELETE = lambda self: self.respond()
+
+        def log_message(self, format, *args):
+            pass
+
+    return APIRequestHandler
+
+def start_api_server(port: int, host: str = "127.0.0.1"):
+    """
+    Serves the JSON API on a background thread, next to the Drafter UI.
+
+    Args:
+        port (int): The port (0 picks a free one).
+        host (str): The address to listen on; local only by default.
+    Returns:
+        http.server.ThreadingHTTPServer: The running server (call shutdown() to stop it).
+    """
+    import http.server
+    server = http.server.ThreadingHTTPServer((host, port), get_api_handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="api_server", daemon=True).start()
+    start_ingestion_workers()
+    start_memory_accounting()
+    return server
+
+@functools.cache
+def start_ingestion_workers() -> tuple:
+    """
+    Starts the background threads that apply queued and buffered scores (once, however many servers start).
+
+    Returns:
+        tuple: The worker threads.
+    """
+    threads = (threading.Thread(target=run_ingestion_worker, name="ingestion_worker", daemon=True),
+               threading.Thread(target=run_write_flusher, name="write_flusher", daemon=True))
+    for thread in threads:
+        thread.start()
+    return threads
+
+# sharded deployment
+# one process can only use one core, so `--shards N` runs N worker processes, each serving the JSON API
+# for its share of the students, behind a router that picks the worker by hashing the student's name.
+# Workers share STATE_DIR: when shards are added or removed, a student moves by being saved and released
+# by the old worker and read back by the new one.
+# points per shard on the hash ring: more points, more even shares
+RING_POINTS_PER_SHARD = 100
+# this process's shard name, in a worker ("" otherwise)
+SHARD_NAME = ""
+# shared by the router and its workers, so workers trust only the router's X-Client-Id and shard changes
+ROUTER_SECRET = os.environ.get("ANALYZER_ROUTER_SECRET", "")
+
+@dataclass
+class HashRing:
+    # sorted hash points, and the shard that owns each point
+    points: list[int]
+    shards: list[str]
+
+@dataclass
+class ShardRouter:
+    # shard name -> worker port, and worker process
+    ports: dict[str, int]
+    processes: dict[str, object]
+    ring: HashRing
+    # forwarded requests in flight; resizing waits for them to finish and holds new ones back
+    active: int = 0
+    resizing: bool = False
+    gate: threading.Condition = field(default_factory=threading.Condition)
+    # each router thread keeps its own keep-alive connection to each worker
+    connections: threading.local = field(default_factory=threading.local)
+    # read replicas: their ports and processes, and a count of requests to take turns by
+    replica_ports: list[int] = field(default_factory=list)
+    replica_processes: list = field(default_factory=list)
+    reads: int = 0
+    # sent with every request to a worker (the workers get it as ANALYZER_ROUTER_SECRET)
+    secret: str = field(default_factory=lambda: secrets.token_hex(16))
+
+SHARD_ROUTER: ShardRouter = None
+
+def _ring_hash(key: str) -> int:
+    """
+    Hashes a key the same way in every process (Python's own hash() is salted per process).
+
+    Args:
+        key (str): The key.
+    Returns:
+        int: A 64-bit hash.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+def make_ring(shards: list[str]) -> HashRing:
+    """
+    Places each shard at RING_POINTS_PER_SHARD points of a hash ring. A student belongs to the shard
+    at the first point after the student's hash, so adding or removing one of N shards only moves
+    the students between that shard's points and their neighbors: about 1/N of them.
+
+    Args:
+        shards (list[str]): The shard names.
+    Returns:
+        HashRing: The ring.
+    """
+    placed = sorted((_ring_hash(f"{shard}#{point}"), shard) for shard in shards for point in range(RING_POINTS_PER_SHARD))
+    return HashRing([point for point, _ in placed], [shard for _, shard in placed])
+
+def find_shard(ring: HashRing, student_name: str) -> str:
+    """
+    Finds the shard a student belongs to.
+
+    Args:
+        ring (HashRing): The ring (with at least one shard).
+        student_name (str): The student's name.
+    Returns:
+        str: The shard name.
+    """
+    return ring.shards[bisect.bisect(ring.points, _ring_hash(student_name)) % len(ring.points)]
+
+def release_students(shards: list[str]) -> list[str]:
+    """
+    In a worker, hands over the students the new set of shards gives to other workers: their queued
+    and buffered scores are applied (and saved) here, then they are dropped from memory. Call with
+    API_LOCK held.
+
+    Args:
+        shards (list[str]): Every shard after the change.
+    Returns:
+        list[str]: The students released.
+    """
+    # queued scores are applied now, while this worker still owns their students
+    drain_ingestion_queue(INGESTION.size)
+    ring = make_ring(shards)
+    released = [name for name in SAVED_STATES if not shards or find_shard(ring, name) != SHARD_NAME]
+    for name in released:
+        flush_writes(name)
+    # replicas get the released students' last changes (and, if this worker is going away, stop waiting for it)
+    publish_snapshot(final=SHARD_NAME not in shards)
+    for name in released:
+        del SAVED_STATES[name]
+    return released
+
+def get_student_key(path: str, body: bytes) -> str:
+    """
+    Finds which student an API request is for, the way handle_api_request will.
+
+    Args:
+        path (str): The request path.
+        body (bytes): The request body.
+    Returns:
+        str: The student's name ("" if the request is not for one student).
+    """
+    parts = [urllib.parse.unquote(part) for part in urllib.parse.urlsplit(path).path.strip("/").split("/")]
+    if parts[:2] != ["api", "students"]:
+        return ""
+    if len(parts) > 2:
+        return parts[2]
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return ""
+    return str(data.get("student_name", "")) if isinstance(data, dict) else ""
+
+def _send_to_worker(router: ShardRouter, port: int, method: str, path: str, body: bytes, headers: dict) -> tuple:
+    """
+    Sends a request to a worker over this thread's connection to it, reconnecting once if it was closed.
+
+    Returns:
+        tuple: (status, response headers to pass on, payload)
+    """
+    import http.client
+    connections = router.connections.__dict__
+    for attempt in range(2):
+        if port not in connections:
+            connections[port] = http.client.HTTPConnection("127.0.0.1", port)
+        try:
+            connections[port].request(method, path, body=body, headers={**headers, "X-Router-Secret": router.secret})
+            response = connections[port].getresponse()
+            payload = response.read()
+        except (ConnectionError, http.client.HTTPException):
+            connections.pop(port).close()
+            if attempt:
+                raise
+            continue
+        return (response.status, {name: value for name, value in response.getheaders()
+                                  if name in ("Content-Type", "Content-Encoding", "Retry-After")}, payload)
+
+def forward_request(router: ShardRouter, method: str, path: str, body: bytes, headers: dict) -> tuple:
+    """
+    Answers an API request at the router: reads for a student go to the read replicas in turn (or to
+    the student's worker if the replica is behind), other requests for a student go to the student's
+    worker, the score queue is summed over all workers, the memory report lists each worker's, and
+    PUT /api/shards {"count": n} resizes.
+
+    Args:
+        router (ShardRouter): The router.
+        method (str): The HTTP method.
+        path (str): The request path.
+        body (bytes): The request body.
+        headers (dict): The request headers to pass on.
+    Returns:
+        tuple: (status, response headers, payload)
+    """
+    if urllib.parse.urlsplit(path).path.rstrip("/") == "/api/shards" and method != "PUT":
+        # workers trust what the router sends them, so it never passes on a client's POST /api/shards
+        return (405, {"Content-Type": "application/json"}, b'{"error": "Use PUT to resize."}')
+    if urllib.parse.urlsplit(path).path.rstrip("/") == "/api/shards" and method == "PUT":
+        try:
+            count = int(json.loads(body)["count"])
+        except (ValueError, TypeError, KeyError):
+            count = -1
+        if count < 1:
+            return (400, {"Content-Type": "application/json"}, b'{"error": "count must be a positive whole number."}')
+        resize_shards(router, count)
+        return (200, {"Content-Type": "application/json"}, json.dumps({"shards": list(router.ports)}).encode("utf-8"))
+    key = get_student_key(path, body)
+    with router.gate:
+        router.gate.wait_for(lambda: not router.resizing)
+        router.active += 1
+        ring = router.ring
+        router.reads += 1
+        replica = router.replica_ports[router.reads % len(router.replica_ports)] if router.replica_ports else None
+    try:
+        if not ring.points:
+            return (503, {"Content-Type": "application/json"}, b'{"error": "No shards are running."}')
+        if key and method == "GET" and replica is not None:
+            try:
+                response = _send_to_worker(router, replica, method, path, body, headers)
+                if response[0] != 503:
+                    return response
+            except OSError:
+                pass
+            # the replica is behind or down: the student's worker answers
+        if key or not path.startswith(("/api/ingestion", "/api/alerts", "/debug/memory")):
+            return _send_to_worker(router, router.ports[find_shard(ring, key)], method, path, body, headers)
+        headers = {name: value for name, value in headers.items() if name != "Accept-Encoding"}
+        responses = {shard: json.loads(_send_to_worker(router, router.ports[shard], method, path, body, headers)[2])
+                     for shard in router.ports}
+        if path.startswith("/debug/memory"):
+            # each worker keeps to its own ceiling
+            return (200, {"Content-Type": "application/json"}, json.dumps({"shards": responses}).encode("utf-8"))
+        if path.startswith("/api/alerts"):
+            if any("error" in response for response in responses.values()):
+                return (404, {"Content-Type": "application/json"}, b'{"error": "Alerts are delivered to the alert outbox."}')
+            alerts = sorted((alert for response in responses.values() for alert in response["alerts"]), key=lambda alert: alert["time"])
+            return (200, {"Content-Type": "application/json"}, json.dumps({"alerts": alerts}).encode("utf-8"))
+        totals: dict[str, int] = {}
+        for response in responses.values():
+            for name, value in response.items():
+                totals[name] = totals.get(name, 0) + value
+        return (200, {"Content-Type": "application/json"}, json.dumps(totals).encode("utf-8"))
+    finally:
+        with router.gate:
+            router.active -= 1
+            router.gate.notify_all()
+
+def start_worker_process(arguments: list[str]) -> tuple:
+    """
+    Starts a worker process (`main.py --api-worker <shard> <port>` or `main.py --api-replica <port>`)
+    and waits until it answers.
+
+    Args:
+        arguments (list[str]): The worker's arguments, without the port.
+    Returns:
+        tuple: (the process, its port)
+    """
+    import http.client
+    import socket
+    import subprocess
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + arguments + [str(port)])
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/api/ingestion")
+            connection.getresponse().read()
+            connection.close()
+            return (process, port)
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f"Worker {' '.join(arguments)} did not start.")
+            time.sleep(0.05)
+
+def resize_shards(router: ShardRouter, count: int):
+    """
+    Changes the number of workers to count (shards shard0 ... shard<count-1>). Requests wait while
+    the old workers release the students that move (about 1/N of them); the new owners read them
+    back from STATE_DIR on their next request.
+
+    Args:
+        router (ShardRouter): The router.
+        count (int): How many workers to run (0 stops them all).
+    Returns:
+        None
+    """
+    with router.gate:
+        router.gate.wait_for(lambda: not router.resizing)
+        router.resizing = True
+        router.gate.wait_for(lambda: router.active == 0)
+    try:
+        shards = [f"shard{number}" for number in range(count)]
+        for shard in list(router.ports):
+            try:
+                _send_to_worker(router, router.ports[shard], "POST", "/api/shards",
+                                json.dumps({"shards": shards, "stopping": not shards}).encode("utf-8"), {})
+            except OSError:
+                # a worker being removed that already exited (say, from the same Ctrl-C) saved every change
+                if shard in shards:
+                    raise
+            if shard not in shards:
+                router.processes.pop(shard).terminate()
+                router.connections.__dict__.pop(router.ports.pop(shard), None)
+        for shard in shards:
+            if shard not in router.ports:
+                router.processes[shard], router.ports[shard] = start_worker_process(["--api-worker", shard])
+        router.ring = make_ring(shards)
+        # replicas serve reads only while every one of these workers is current
+        for port in router.replica_ports:
+            try:
+                _send_to_worker(router, port, "PUT", "/api/writers", json.dumps({"writers": shards}).encode("utf-8"), {})
+            except OSError:
+                pass
+    finally:
+        with router.gate:
+            router.resizing = False
+            router.gate.notify_all()
+
+@functools.cache
+def get_router_handler() -> type:
+    """
+    Builds the router's HTTP request handler: the API handler, but forwarding instead of answering.
+
+    Returns:
+        type: The handler class.
+    """
+    class ShardRouterHandler(get_api_handler()):
+        def respond(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            headers = {name: self.headers[name] for name in ("Content-Type", "Accept-Encoding") if name in self.headers}
+            # workers only see the router's address, so pass on who the client is for rate limiting
+            headers["X-Client-Id"] = self.client_address[0]
+            self.send(*forward_request(SHARD_ROUTER, self.command, self.path, body, headers))
+
+    return ShardRouterHandler
+
+def start_shard_router(port: int, count: int, host: str = "127.0.0.1", replicas: int = 0):
+    """
+    Starts count worker processes (and any read replicas) and serves the JSON API in front of them
+    on a background thread.
+
+    Args:
+        port (int): The router's port (0 picks a free one).
+        count (int): How many workers to start.
+        host (str): The address to listen on; local only by default.
+        replicas (int): How many read replicas to start.
+    Returns:
+        http.server.ThreadingHTTPServer: The running router (stop_shard_router(SHARD_ROUTER) stops the workers).
+    """
+    global SHARD_ROUTER
+    import http.server
+    if not STATE_DIR:
+        raise ValueError("Sharded mode needs ANALYZER_STATE_DIR, which workers use to hand students over.")
+    SHARD_ROUTER = ShardRouter({}, {}, make_ring([]))
+    os.environ["ANALYZER_ROUTER_SECRET"] = SHARD_ROUTER.secret
+    for _ in range(replicas):
+        process, replica_port = start_worker_process(["--api-replica"])
+        SHARD_ROUTER.replica_processes.append(process)
+        SHARD_ROUTER.replica_ports.append(replica_port)
+    # workers (started now or by a later resize) find the replicas here, and the router's secret above
+    os.environ["ANALYZER_REPLICA_PORTS"] = ",".join(map(str, SHARD_ROUTER.replica_ports))
+    resize_shards(SHARD_ROUTER, count)
+    server = http.server.ThreadingHTTPServer((host, port), get_router_handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="shard_router", daemon=True).start()
+    return server
+
+def stop_shard_router(router: ShardRouter):
+    """
+    Stops the workers, after they hand over what they hold, and the read replicas.
+
+    Args:
+        router (ShardRouter): The router.
+    Returns:
+        None
+    """
+    resize_shards(router, 0)
+    for process in router.replica_processes:
+        process.terminate()
+
+# read replicas
+# reads far outnumber writes, so `--replicas M` adds M read-only processes. Each worker sends them
+# snapshots (encode_state records) of the students changed since its last snapshot, at least every
+# half REPLICA_STALENESS_SECONDS, and a replica that has not heard from every worker within that bound
+# answers 503, so the router asks the student's worker instead.
+REPLICA_STALENESS_SECONDS = float(os.environ.get("ANALYZER_REPLICA_STALENESS", "1.0"))
+# in a worker: the replicas' ports (from the router) and the students changed since the last snapshot
+REPLICA_PORTS = [int(port) for port in os.environ.get("ANALYZER_REPLICA_PORTS", "").split(",") if port]
+UNPUBLISHED: set[str] = set()
+# in a worker: snapshots taken (in order, under API_LOCK) and not yet sent, as (snapshot, final)
+SNAPSHOT_OUTBOX: collections.deque = collections.deque()
+SNAPSHOT_SENDING = threading.Lock()
+# in a replica: the workers the router runs, and when each last sent a snapshot
+REPLICA_MODE = False
+REPLICA_WRITERS: set[str] = set()
+SNAPSHOT_TIMES: dict[str, float] = {}
+
+def make_snapshot(states: list[State]) -> bytes:
+    """
+    Packs student records into one snapshot: each record's encode_state bytes, length first.
+
+    Args:
+        states (list[State]): The records.
+    Returns:
+        bytes: The snapshot.
+    """
+    return b"".join(struct.pack("<I", len(data)) + data for data in map(encode_state, states))
+
+def read_snapshot(data: bytes) -> list[State]:
+    """
+    Unpacks the student records of a snapshot.
+
+    Args:
+        data (bytes): The snapshot.
+    Returns:
+        list[State]: The records.
+    """
+    states = []
+    offset = 0
+    while offset < len(data):
+        (size,) = struct.unpack_from("<I", data, offset)
+        states.append(decode_state(data[offset + 4:offset + 4 + size]))
+        offset += 4 + size
+    return states
+
+def publish_snapshot(final: bool = False):
+    """
+    In a worker, snapshots the students changed since the last snapshot, for send_snapshots to send
+    to every replica (an empty snapshot still tells them the worker is current). Call with API_LOCK
+    held, which keeps snapshots in order.
+
+    Args:
+        final (bool): Whether this worker is going away, so replicas stop waiting for it.
+    Returns:
+        None
+    """
+    if REPLICA_PORTS:
+        SNAPSHOT_OUTBOX.append((make_snapshot([SAVED_STATES[name] for name in UNPUBLISHED if name in SAVED_STATES]), final))
+    UNPUBLISHED.clear()
+
+def send_snapshots():
+    """
+    Sends the snapshots taken so far to every replica, oldest first. Call without API_LOCK held, so
+    requests never wait on the network.
+
+    Returns:
+        None
+    """
+    import http.client
+    with SNAPSHOT_SENDING:
+        while SNAPSHOT_OUTBOX:
+            data, final = SNAPSHOT_OUTBOX.popleft()
+            path = f"/api/snapshots?writer={urllib.parse.quote(SHARD_NAME)}" + ("&final=1" if final else "")
+            for port in REPLICA_PORTS:
+                try:
+                    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=REPLICA_STALENESS_SECONDS)
+                    connection.request("POST", path, body=data, headers={"X-Router-Secret": ROUTER_SECRET})
+                    connection.getresponse().read()
+                    connection.close()
+                except (OSError, http.client.HTTPException):
+                    # that replica falls behind and the router stops reading from it
+                    pass
+
+def run_snapshot_publisher():
+    """
+    Publishes a snapshot every half REPLICA_STALENESS_SECONDS, for as long as the worker runs.
+
+    Returns:
+        None
+    """
+    while True:
+        time.sleep(REPLICA_STALENESS_SECONDS / 2)
+        with API_LOCK:
+            publish_snapshot()
+        send_snapshots()
+
+def receive_snapshot(writer: str, data: bytes, final: bool, now: float) -> int:
+    """
+    In a replica, takes in a worker's snapshot.
+
+    Args:
+        writer (str): The worker's shard name.
+        data (bytes): The snapshot.
+        final (bool): Whether the worker is going away.
+        now (float): The time.monotonic() time it arrived.
+    Returns:
+        int: How many student records it held.
+    """
+    states = read_snapshot(data)
+    for state in states:
+        SAVED_STATES[state.student_name] = state
+    if final:
+        SNAPSHOT_TIMES.pop(writer, None)
+    else:
+        SNAPSHOT_TIMES[writer] = now
+    return len(states)
+
+def is_replica_current(now: float) -> bool:
+    """
+    Checks whether a replica has heard from every worker the router runs within REPLICA_STALENESS_SECONDS.
+
+    Args:
+        now (float): The time.monotonic() time.
+    Returns:
+        bool: True if its reads are fresh enough to serve.
+    """
+    return bool(REPLICA_WRITERS) and all(now - SNAPSHOT_TIMES.get(writer, -math.inf) <= REPLICA_STALENESS_SECONDS
+                                         for writer in REPLICA_WRITERS)
+
+# memory retention
+# a long-running process keeps every student it has seen, so it bounds what each one holds. A course with
+# more than MAX_SCORES_PER_COURSE scores, or from a term older than the ARCHIVE_AFTER_TERMS most recent
+# ones, has its score history appended to the student's archive file and replaced by a sketch (its grade
+# stays exact). 0 turns a policy off.
+MAX_SCORES_PER_COURSE = int(os.environ.get("ANALYZER_MAX_SCORES_PER_COURSE", "0"))
+ARCHIVE_AFTER_TERMS = int(os.environ.get("ANALYZER_ARCHIVE_AFTER_TERMS", "0"))
+ARCHIVE_FILE_SUFFIX = ".archive"
+# the most the students in memory may hold, in bytes; past it the largest are released to STATE_DIR (0 is no ceiling)
+MEMORY_CEILING_BYTES = int(float(os.environ.get("ANALYZER_MEMORY_CEILING_MB", "0")) * 1_000_000)
+MEMORY_CHECK_SECONDS = 60.0
+# a student whose memory grew this many checks in a row without an edit is reported as a suspected leak
+LEAK_CHECKS = 3
+MEMORY_REPORT_LARGEST = 10
+
+@dataclass
+class MemoryRecord:
+    # bytes held by each part of the state, and in all, at the last check
+    parts: dict[str, int]
+    total: int
+    # the student's edit count at the last check
+    edits: int
+    # checks in a row where the state grew without an edit
+    unexplained_growth: int = 0
+
+# the last check of each student in memory, by student name
+MEMORY_RECORDS: dict[str, MemoryRecord] = {}
+# the last check's report, which /debug/memory serves without taking API_LOCK
+MEMORY_REPORTS: collections.deque = collections.deque(maxlen=1)
+
+def get_deep_size(value, seen: set) -> int:
+    """
+    Estimates the memory an object holds, following containers and object fields. Objects already in
+    seen are not counted again.
+
+    Args:
+        value: The object to measure.
+        seen (set): The ids of objects already counted (updated).
+    Returns:
+        int: The size in bytes.
+    """
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(get_deep_size(key, seen) + get_deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, collections.deque)):
+        size += sum(get_deep_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__") and not isinstance(value, type):
+        size += get_deep_size(vars(value), seen)
+    return size
+
+def measure_state(state: State) -> dict[str, int]:
+    """
+    Estimates the memory a student's state holds, by part. Objects shared between parts count toward the first.
+
+    Args:
+        state (State): The student's state.
+    Returns:
+        dict[str, int]: Bytes held by the courses (with their score histories), all_test_scores, the
+        derived caches, and the undo history.
+    """
+    seen: set = set()
+    return {"courses": get_deep_size(state.courses, seen),
+            "scores": get_deep_size(state.all_test_scores, seen),
+            "caches": sum(get_deep_size(cache, seen)
+                          for cache in (state.suggestions, state.term_ledger, state.score_index, state.derived)),
+            "history": get_deep_size(state.history, seen)}
+
+def get_archive_path(student_name: str) -> str:
+    """
+    Finds the file a student's archived scores are appended to.
+
+    Args:
+        student_name (str): The student's name.
+    Returns:
+        str: The file path.
+    """
+    return os.path.join(STATE_DIR, student_name + ARCHIVE_FILE_SUFFIX)
+
+def archive_scores(state: State, course: Course):
+    """
+    Replaces a course's score history with a sketch of it, after appending the history to the
+    student's archive file (as a JSON line) if saving is on. The grade and score count stay exact.
+
+    Args:
+        state (State): The student's state.
+        course (Course): The course to archive.
+    Returns:
+        None
+    """
+    if STATE_DIR:
+        with open(get_archive_path(state.student_name), "a") as file:
+            file.write(json.dumps({"course": course.course_name, "term": course.term,
+                                   "scores": course.test_scores}) + "\n")
+    if course.sketch is None:
+        # (in approximate mode, the sketch already has them) sized to hold about as many scores as the cap
+        course.sketch = ScoreSketch(k=max(MAX_SCORES_PER_COURSE // 3, 8)) if MAX_SCORES_PER_COURSE else ScoreSketch()
+        for score in course.test_scores:
+            add_to_sketch(course.sketch, score)
+    course.test_scores = []
+    if all(other.sketch is not None for other in state.courses if other.course_name == course.course_name):
+        state.all_test_scores.pop(course.course_name, None)
+    state.score_index.ready = False
+    mark_changed(state, "scores")
+
+def forget_score_edits(state: State, course_names: set[str]):
+    """
+    Drops the undo steps that changed the scores, grades, or categories of archived courses, since
+    their archived scores cannot be taken back out. None of those steps added or removed a course, so
+    the positions the other steps recorded still hold and they stay undoable. A batch that also added
+    or deleted courses cannot be taken out on its own, so it is dropped along with every older step.
+
+    Args:
+        state (State): The student's state.
+        course_names (set[str]): The names of the archived courses.
+    Returns:
+        None
     """
-    Retrieves the lowest test score and its corresponding course.
+    kept = []
+    for edit in state.history.done:
+        if edit.route in ("append_score", "change_grade", "append_category"):
+            if edit.arguments[0] not in course_names:
+                kept.append(edit)
+        elif edit.route == "apply_batch":
+            operations = edit.arguments[0]
+            if not any(operation[0] in ("add_score", "change_grade") and operation[1] in course_names
+                       for operation in operations):
+                kept.append(edit)
+            elif any(operation[0] in ("add_course", "delete_course") for operation in operations):
+                kept.clear()
+        else:
+            kept.append(edit)
+    state.history.done = collections.deque(kept, maxlen=state.history.done.maxlen)
+
+def enforce_retention(state: State) -> int:
+    """
+    Archives the score histories the retention policies no longer allow in memory. Called after every change.
 
     Args:
-        state (State): The current state of the application.
+        state (State): The student's state.
     Returns:
-        tuple: A tuple containing the lowest test score as a string with '%' and the course name
+        int: How many courses were archived.
     """
-    if not state.all_test_scores:
-        return (None, None)
-    lowest_score = math.inf
-    course_of_lowest = "N/A" if not state.courses else state.courses[0].course_name
-    for course_name, test_scores in state.all_test_scores.items():
-        for test_score in test_scores:
-            try:
-                if not math.isfinite(test_score):
-                    continue
-            except:
-                continue
-            if test_score < lowest_score:
-                lowest_score = test_score
-                course_of_lowest = course_name
-    if lowest_score == math.inf:
-        return (None, None)
-    return (f'{lowest_score}%', course_of_lowest)
+    if not MAX_SCORES_PER_COURSE and not ARCHIVE_AFTER_TERMS:
+        return 0
+    old_terms = set(state.terms[:-ARCHIVE_AFTER_TERMS]) if ARCHIVE_AFTER_TERMS else set()
+    archived = [course for course in state.courses
+                if course.test_scores and (course.term in old_terms
+                                           or 0 < MAX_SCORES_PER_COURSE < len(course.test_scores))]
+    for course in archived:
+        archive_scores(state, course)
+    if archived:
+        forget_score_edits(state, {course.course_name for course in archived})
+    return len(archived)
 
-# Web-based setup for GitHub Pages / static hosting
-@route
-def setup(state: State) -> Page:
+def get_process_memory() -> int:
     """
-    Setup page to collect student name, current GPA, and target GPA via web form.
+    Reads how much memory the whole process holds (its resident set size).
+
+    Returns:
+        int: The size in bytes, or 0 where the system does not report it.
     """
-    return Page(
-        state,
-        content=[
-            "What's your name?", TextBox(name="students_name", default_value=""),
-            "Current GPA:", TextBox(name="students_GPA", default_value="0.0"),
-            "Target GPA:", TextBox(name="students_target_GPA", default_value="4.0"),
-            Button(text="Start", url="/start_app"),
-        ],
-    )
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
 
+def check_memory() -> dict:
+    """
+    Measures every student in memory, flags students whose memory keeps growing without edits (suspected
+    leaks), and releases the largest to STATE_DIR while the total is over MEMORY_CEILING_BYTES. Released
+    students are read back from their saved files when next used. Call with API_LOCK held.
 
-@route
-def start_app(state: State, students_name: str, students_GPA: str, students_target_GPA: str) -> Page:
+    Returns:
+        dict: The report, which /debug/memory serves until the next check.
     """
-    Handler for the setup form. Validates inputs and initializes the app state.
+    for name, state in SAVED_STATES.items():
+        parts = measure_state(state)
+        total = sum(parts.values())
+        old = MEMORY_RECORDS.get(name)
+        growth = 0
+        if old is not None and total > old.total and state.history.edit_count == old.edits:
+            growth = old.unexplained_growth + 1
+        MEMORY_RECORDS[name] = MemoryRecord(parts, total, state.history.edit_count, growth)
+    for name in [name for name in MEMORY_RECORDS if name not in SAVED_STATES]:
+        del MEMORY_RECORDS[name]
+
+    tracked = sum(record.total for record in MEMORY_RECORDS.values())
+    released: list[str] = []
+    if MEMORY_CEILING_BYTES and STATE_DIR and tracked > MEMORY_CEILING_BYTES:
+        for name in sorted(MEMORY_RECORDS, key=lambda name: MEMORY_RECORDS[name].total, reverse=True):
+            if tracked <= MEMORY_CEILING_BYTES:
+                break
+            # buffered scores are applied (and saved) first
+            flush_writes(name)
+            released.append(name)
+            tracked -= MEMORY_RECORDS[name].total
+        if REPLICA_PORTS:
+            # replicas get their last changes before they leave memory
+            publish_snapshot()
+        for name in released:
+            del SAVED_STATES[name]
+            del MEMORY_RECORDS[name]
+
+    largest = sorted(MEMORY_RECORDS.items(), key=lambda item: item[1].total, reverse=True)[:MEMORY_REPORT_LARGEST]
+    report = {"students": len(SAVED_STATES), "tracked_bytes": tracked, "process_bytes": get_process_memory(),
+              "ceiling_bytes": MEMORY_CEILING_BYTES, "checked_at": time.time(),
+              "largest": [{"student_name": name, "bytes": record.total, "parts": record.parts} for name, record in largest],
+              "suspected_leaks": sorted(name for name, record in MEMORY_RECORDS.items()
+                                        if record.unexplained_growth >= LEAK_CHECKS),
+              "released": released}
+    MEMORY_REPORTS.append(report)
+    return report
+
+def run_memory_accounting():
     """
-    # validate name (allow spaces in names)
-    if not students_name or not students_name.replace(" ", "").isalpha():
-        return Page(
-            state,
-            content=[
-                "Please enter a valid name (letters and spaces only).",
-                Button("Back", "/setup"),
-            ],
-        )
+    Checks memory every MEMORY_CHECK_SECONDS, for as long as the app runs.
 
-    # validate GPAs
-    try:
-        curr = float(students_GPA)
-        targ = float(students_target_GPA)
-        if not (0.0 <= curr <= 4.0 and 0.0 <= targ <= 4.0):
-            raise ValueError()
-    except ValueError:
-        return Page(
-            state,
-            content=[
-                "Please enter valid GPAs between 0.0 and 4.0.",
-                Button("Back", "/setup"),
-            ],
-        )
+    Returns:
+        None
+    """
+    while True:
+        time.sleep(MEMORY_CHECK_SECONDS)
+        with API_LOCK:
+            check_memory()
+        send_snapshots()
 
-    # initialize state and go to index
-    state.student_name = students_name
-    state.current_GPA = curr
-    state.target_GPA = targ
-    state.is_failing = curr < 2.0
-    return index(state)
+@functools.cache
+def start_memory_accounting() -> threading.Thread:
+    """
+    Starts the memory accounting thread (once, however many servers start).
+
+    Returns:
+        threading.Thread: The accounting thread.
+    """
+    thread = threading.Thread(target=run_memory_accounting, name="memory_accounting", daemon=True)
+    thread.start()
+    return thread
+
+# a shard worker (started by the router) serves only the JSON API, for the students the router sends it
+if "--api-worker" in sys.argv:
+    SHARD_NAME, worker_port = sys.argv[sys.argv.index("--api-worker") + 1:sys.argv.index("--api-worker") + 3]
+    start_api_server(int(worker_port))
+    if REPLICA_PORTS:
+        threading.Thread(target=run_snapshot_publisher, name="snapshot_publisher", daemon=True).start()
+    threading.Event().wait()
+
+# a read replica (started by the router) answers API reads from the workers' snapshots
+if "--api-replica" in sys.argv:
+    REPLICA_MODE = True
+    start_api_server(int(sys.argv[sys.argv.index("--api-replica") + 1]))
+    threading.Event().wait()
+
+# production start: `python main.py --production` serves right away, without the self-tests below
+if "--production" in sys.argv:
+    if "--shards" in sys.argv:
+        # the JSON API only, across worker processes; the Drafter UI stays a single process
+        start_shard_router(int(os.environ.get("ANALYZER_API_PORT", "8000")), int(sys.argv[sys.argv.index("--shards") + 1]),
+                           replicas=int(sys.argv[sys.argv.index("--replicas") + 1]) if "--replicas" in sys.argv else 0)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            # on Ctrl-C, workers hand over what they hold and stop
+            stop_shard_router(SHARD_ROUTER)
+        sys.exit()
+    preload_states()
+    if os.environ.get("ANALYZER_API_PORT"):
+        start_api_server(int(os.environ["ANALYZER_API_PORT"]))
+    start_server(State("", 0.0, 4.0, True, [], {}), in_debug_mode=False)
+    sys.exit()
 
 # tests
+# the self-tests never save to the real state directory
+test_saved_state_dir, STATE_DIR = STATE_DIR, ""
 assert_equal(
     index(
         State(
@@ -610,6 +4888,13 @@ assert_equal(
             Button(text='View Courses', url='/view_courses'),
             Button(text='Add Test Score', url='/add_test_score'),
             Button(text='View Progress', url='/view_progress'),
+            Button(text='What If?', url='/what_if'),
+            Button(text='Study Suggestions', url='/view_suggestions'),
+            Button(text='Term History', url='/view_terms'),
+            Button(text='Score Distribution', url='/view_distribution'),
+            Button(text='Batch Edit', url='/batch_edit'),
+            Button(text='Undo', url='/undo'),
+            Button(text='Redo', url='/redo'),
         ],
     ),
 )
@@ -629,6 +4914,8 @@ assert_equal(
               TextBox(name='credits', kind='text', default_value='3'),
               'Current Grade:',
               TextBox(name='current_grade', kind='text', default_value='100.0'),
+              'Term (leave blank for the current term):',
+              TextBox(name='term', kind='text', default_value=''),
               Button(text='Add Course', url='/append_course'),
               Button(text='Cancel', url='/')]))
 
@@ -696,7 +4983,10 @@ assert_equal(
               SelectBox(name='course_for_score', options=['cisc108'], default_value=''),
               'What is the test score?',
               TextBox(name='test_score', kind='text', default_value=''),
+              'Score category (only for courses with categories):',
+              TextBox(name='score_category', kind='text', default_value=''),
               Button(text='Add Test Score', url='/append_score'),
+              Button(text='Add Score Category', url='/add_category'),
               Button(text='Cancel', url='/')]))
 
 assert_equal(
@@ -731,6 +5021,13 @@ assert_equal(
             Button(text='View Courses', url='/view_courses'),
             Button(text='Add Test Score', url='/add_test_score'),
             Button(text='View Progress', url='/view_progress'),
+            Button(text='What If?', url='/what_if'),
+            Button(text='Study Suggestions', url='/view_suggestions'),
+            Button(text='Term History', url='/view_terms'),
+            Button(text='Score Distribution', url='/view_distribution'),
+            Button(text='Batch Edit', url='/batch_edit'),
+            Button(text='Undo', url='/undo'),
+            Button(text='Redo', url='/redo'),
         ],
     ),
 )
@@ -798,6 +5095,13 @@ assert_equal(
             Button(text='View Courses', url='/view_courses'),
             Button(text='Add Test Score', url='/add_test_score'),
             Button(text='View Progress', url='/view_progress'),
+            Button(text='What If?', url='/what_if'),
+            Button(text='Study Suggestions', url='/view_suggestions'),
+            Button(text='Term History', url='/view_terms'),
+            Button(text='Score Distribution', url='/view_distribution'),
+            Button(text='Batch Edit', url='/batch_edit'),
+            Button(text='Undo', url='/undo'),
+            Button(text='Redo', url='/redo'),
         ],
     ),
 )
@@ -1305,6 +5609,1171 @@ assert_equal(
     ),
 )
 
+# what-if views never touch the real state
+test_state_what_if = State(
+    student_name='gina',
+    current_GPA=3.0,
+    target_GPA=4.0,
+    is_failing=False,
+    courses=[
+        Course(course_name='cisc108', credits=3, current_grade=85.0, test_scores=[85.0]),
+        Course(course_name='math241', credits=4, current_grade=72.0, test_scores=[]),
+    ],
+    all_test_scores={'cisc108': [85.0]},
+)
+update_GPA(test_state_what_if)
+test_view = make_what_if(test_state_what_if)
+assert_equal(what_if_GPA(test_view), test_state_what_if.current_GPA)
+what_if_set_grade(test_view, 'cisc108', 95.0)
+assert_equal(what_if_GPA(test_view), 2.86)  # (4.0*3 + 2.0*4) / 7
+assert_equal(test_state_what_if.courses[0].current_grade, 85.0)
+what_if_set_grade(test_view, 'phys207', 100.0, 4)
+assert_equal(what_if_GPA(test_view), 3.27)  # (12 + 8 + 16) / 11
+what_if_drop_course(test_view, 'math241')
+assert_equal(what_if_GPA(test_view), 4.0)
+assert_equal([c.course_name for c in what_if_courses(test_view)], ['cisc108', 'phys207'])
+assert_equal(len(test_state_what_if.courses), 2)
+
+# sweeping grades matches simulating each grade separately
+assert_equal(sweep_what_if_grades(test_state_what_if, 'math241', [95.0, 85.0, 50.0]), [3.57, 3.0, 1.29])
+assert_equal(sweep_what_if_grades(test_state_what_if, 'new_course', [95.0], 3), [2.9])
+
+assert_equal(
+    run_what_if(test_state_what_if, 'cisc108', '95', '3'),
+    Page(
+        state=test_state_what_if,
+        content=[
+            'If you get 95.0 in cisc108, your GPA would be 2.86 (currently 2.43).',
+            'GPA with an A/B/C/D/F in cisc108: [2.86, 2.43, 2.0, 1.57, 1.14]',
+            Button('Try Another', '/what_if'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+assert_equal(
+    run_what_if(test_state_what_if, 'cisc108', 'abc', '3'),
+    Page(
+        state=test_state_what_if,
+        content=[
+            'Invalid what-if input. Please try again.',
+            Button('What If?', '/what_if'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+
+# suggestions come from grade band, trend, credits, and distance to the target GPA
+test_state_suggest = State(
+    student_name='hank',
+    current_GPA=0.0,
+    target_GPA=3.5,
+    is_failing=True,
+    courses=[],
+    all_test_scores={},
+)
+append_course(test_state_suggest, 'chem101', '4', '75.0')
+append_course(test_state_suggest, 'hist101', '3', '95.0')
+assert_equal(get_suggestions(test_state_suggest), [
+    'You are 0.6 points below your target GPA. Focus on your lowest grades first.',
+    'chem101 is worth 4 credits, so raising its grade moves your GPA the most.',
+])
+append_score(test_state_suggest, 'hist101', '95')
+append_score(test_state_suggest, 'hist101', '80')
+assert_equal(get_suggestions(test_state_suggest), [
+    'You are 1.1 points below your target GPA. Focus on your lowest grades first.',
+    'chem101 is worth 4 credits, so raising its grade moves your GPA the most.',
+    'Your test scores in hist101 are trending down. Review recent material before the next test.',
+])
+# only the rules for changed features are re-run: the cached result for chem101 survives untouched
+test_state_suggest.suggestions.course_results[id(test_state_suggest.courses[0])]['heavy_course'] = 'cached'
+append_score(test_state_suggest, 'hist101', '99')
+assert_equal(test_state_suggest.suggestions.course_results[id(test_state_suggest.courses[0])], {'heavy_course': 'cached'})
+assert_equal(test_state_suggest.suggestions.course_results[id(test_state_suggest.courses[1])],
+             {'improving': 'Your test scores in hist101 are improving. Keep up your current study routine!'})
+delete_course(test_state_suggest, 'chem101')
+assert_equal(get_suggestions(test_state_suggest), [
+    'Your test scores in hist101 are improving. Keep up your current study routine!',
+])
+# a full rebuild gives the same answer as the incremental updates
+rebuild_suggestions(test_state_suggest)
+assert_equal(get_suggestions(test_state_suggest), [
+    'Your test scores in hist101 are improving. Keep up your current study routine!',
+])
+# courses that share a name keep their own suggestions
+test_state_suggest_twins = State('ivy', 2.5, 2.5, False, [Course('lab', 1, 65.0, []), Course('lab', 1, 95.0, [])], {})
+update_GPA(test_state_suggest_twins)
+assert_equal(get_suggestions(test_state_suggest_twins), ['You have a D in lab. Visit office hours and review your weakest topics.'])
+change_grade(test_state_suggest_twins, 'lab', '90')
+assert_equal(get_suggestions(test_state_suggest_twins), [])
+
+assert_equal(
+    view_suggestions(test_state_failing),
+    Page(
+        state=test_state_failing,
+        content=[
+            'Study suggestions:',
+            'You are 1.5 points below your target GPA. Focus on your lowest grades first.',
+            'You have a D in hard_class. Visit office hours and review your weakest topics.',
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+
+# browse_courses only renders the requested slice, with shortened score histories
+test_state_browse = State(
+    student_name='ivy',
+    current_GPA=0.0,
+    target_GPA=4.0,
+    is_failing=True,
+    courses=[Course(course_name=f'course{i}', credits=3, current_grade=float(60 + i), test_scores=[])
+             for i in range(30)],
+    all_test_scores={},
+)
+test_state_browse.courses[0].test_scores = [50.0, 60.0, 70.0, 80.0, 90.0, 100.0, 70.0]
+assert_equal(summarize_scores(test_state_browse.courses[0].test_scores),
+             'last 5 of 7 scores [70.0, 80.0, 90.0, 100.0, 70.0] (avg 74.29, min 50.0, max 100.0)')
+assert_equal(summarize_scores([88.0]), 'scores [88.0] (avg 88.0, min 88.0, max 88.0)')
+assert_equal([c.course_name for c in get_course_slice(test_state_browse.courses, 0, 3, 'grade')],
+             ['course29', 'course28', 'course27'])
+assert_equal([c.course_name for c in get_course_slice(test_state_browse.courses, 28, 5, 'added')],
+             ['course28', 'course29'])
+assert_equal([c.course_name for c in get_course_slice(test_state_browse.courses, 1, 2, 'name')],
+             ['course1', 'course10'])
+assert_equal(
+    browse_courses(test_state_browse, '2', '2', 'added'),
+    Page(
+        state=test_state_browse,
+        content=[
+            'Courses 3-4 of 30 (sorted by added):',
+            'course2: D (62.0%), 3 credits, no test scores',
+            'course3: D (63.0%), 3 credits, no test scores',
+            Button('Previous', '/browse_courses', arguments=[Argument('offset', '0'), Argument('page_size', '2'), Argument('sort_by', 'added')]),
+            Button('Next', '/browse_courses', arguments=[Argument('offset', '4'), Argument('page_size', '2'), Argument('sort_by', 'added')]),
+            Button('Sort by name', '/browse_courses', arguments=[Argument('page_size', '2'), Argument('sort_by', 'name')]),
+            Button('Sort by grade', '/browse_courses', arguments=[Argument('page_size', '2'), Argument('sort_by', 'grade')]),
+            Button('Sort by credits', '/browse_courses', arguments=[Argument('page_size', '2'), Argument('sort_by', 'credits')]),
+            Button('Update a Grade', '/update_grade'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+# view_courses switches to the paginated view for long course lists
+assert_equal(view_courses(test_state_browse), browse_courses(test_state_browse))
+# courses with unusable credits (say, from an old save) sort last instead of failing
+test_courses_bad_credits = [Course('a', 2, 80.0, []), Course('b', None, 90.0, []), Course('c', 4, 70.0, [])]
+assert_equal([c.course_name for c in get_course_slice(test_courses_bad_credits, 0, 3, 'credits')], ['c', 'a', 'b'])
+# an offset at or past the end shows the last page
+assert_equal(browse_courses(test_state_browse, '100', '10', 'added'), browse_courses(test_state_browse, '20', '10', 'added'))
+assert_equal(browse_courses(test_state_browse, '30', '4', 'added').content[0], 'Courses 29-30 of 30 (sorted by added):')
+assert_equal(
+    browse_courses(test_state_browse, '-1', '10', 'added'),
+    Page(
+        state=test_state_browse,
+        content=[
+            'Invalid page request. Please try again.',
+            Button('View Courses', '/browse_courses'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+
+# every route records the size of the pages it returns
+PAYLOAD_STATS.clear()
+test_state_payload = State(
+    student_name='jack',
+    current_GPA=3.0,
+    target_GPA=4.0,
+    is_failing=False,
+    courses=[Course(course_name='big', credits=3, current_grade=80.0, test_scores=[80.0] * 500)],
+    all_test_scores={'big': [80.0] * 500},
+)
+test_payload_page = view_courses(test_state_payload)
+assert_equal(PAYLOAD_STATS['view_courses'].requests, 1)
+assert_equal(PAYLOAD_STATS['view_courses'].max_bytes, get_payload_size(test_payload_page))
+assert_equal(get_payload_size(test_payload_page) < 1_000, True)
+assert_equal(test_payload_page.content[3],
+             "Test Scores: ['big scores: last 5 of 500 scores [80.0, 80.0, 80.0, 80.0, 80.0] (avg 80.0, min 80.0, max 80.0)']")
+assert_equal(
+    view_payload_stats(test_state_payload).content[1],
+    'view_courses: 1 requests, avg {} bytes, max {} bytes, 0 over the 16000 byte budget'.format(
+        PAYLOAD_STATS['view_courses'].max_bytes, PAYLOAD_STATS['view_courses'].max_bytes),
+)
+
+# large bodies are compressed, small ones are sent as-is
+test_body = ('{"scores": [' + ', '.join(['80.0'] * 2_000) + ']}').encode('utf-8')
+test_compressed, test_encoding = compress_payload(test_body, 'gzip, deflate')
+assert_equal(test_encoding, 'gzip')
+assert_equal(load_compressors()[0].decompress(test_compressed) == test_body, True)
+assert_equal(len(test_compressed) < len(test_body) // 10, True)
+assert_equal(compress_payload(b'small', 'gzip') == (b'small', None), True)
+assert_equal(compress_payload(test_body, 'identity') == (test_body, None), True)
+
+# shared parsers accept finite numbers only
+assert_equal(parse_grade('85.5'), 85.5)
+assert_equal(parse_grade('nan'), None)
+assert_equal(parse_grade('inf'), None)
+assert_equal(parse_grade('abc'), None)
+assert_equal(parse_whole_number('4'), 4)
+assert_equal(parse_whole_number('4.5'), None)
+
+# courses validate grades and credits once, when they are written
+test_course_valid = Course(course_name='valid', credits='4', current_grade=88, test_scores=[])
+assert_equal(test_course_valid.credits, 4)
+assert_equal(test_course_valid.current_grade, 88.0)
+assert_equal(test_course_valid.valid_grade, True)
+assert_equal(test_course_valid.valid_credits, True)
+test_course_valid.current_grade = float('nan')
+assert_equal(test_course_valid.valid_grade, False)
+assert_equal(get_letter_grade(test_course_valid), 'N/A')
+assert_equal(get_course_contribution(test_course_valid), (0.0, 0))
+test_course_valid.current_grade = 91.0
+assert_equal(get_course_contribution(test_course_valid), (16.0, 4))
+test_course_valid.credits = -1
+assert_equal(get_course_contribution(test_course_valid), (0.0, 0))
+test_course_none = Course(course_name='none', credits=None, current_grade=None, test_scores=[])
+assert_equal(test_course_none.valid_grade or test_course_none.valid_credits, False)
+
+# term GPAs and cumulative GPAs come from per-term totals and prefix sums
+test_state_terms = State(
+    student_name='kim',
+    current_GPA=0.0,
+    target_GPA=4.0,
+    is_failing=True,
+    courses=[],
+    all_test_scores={},
+)
+append_course(test_state_terms, 'cisc108', '3', '95', 'Fall 2024')
+append_course(test_state_terms, 'math241', '4', '75', 'Fall 2024')
+append_course(test_state_terms, 'phys207', '4', '85', 'Spring 2025')
+append_course(test_state_terms, 'engl110', '3', '65')
+assert_equal(get_GPA_timeline(test_state_terms), [
+    ('Fall 2024', 2.86, 2.86, 7),
+    ('Spring 2025', 3.0, 2.91, 4),
+    ('', 1.0, 2.5, 3),
+])
+change_grade(test_state_terms, 'math241', '92')
+assert_equal(get_term_GPA(test_state_terms, 'Fall 2024'), 4.0)
+assert_equal(get_cumulative_GPA(test_state_terms, 'Spring 2025'), 3.64)
+assert_equal(get_cumulative_GPA(test_state_terms, ''), test_state_terms.current_GPA)
+# a new named term goes before the untagged courses of the term in progress
+append_course(test_state_terms, 'chem103', '4', '85', 'Fall 2025')
+assert_equal(test_state_terms.terms, ['Fall 2024', 'Spring 2025', 'Fall 2025'])
+assert_equal(get_cumulative_GPA(test_state_terms, 'Fall 2025'), 3.47)
+assert_equal(get_cumulative_GPA(test_state_terms, ''), 3.06)
+delete_course(test_state_terms, 'phys207')
+assert_equal(get_term_GPA(test_state_terms, 'Spring 2025'), None)
+assert_equal(get_cumulative_GPA(test_state_terms, 'Spring 2025'), 4.0)
+assert_equal(get_cumulative_GPA(test_state_terms, 'Summer 2030'), None)
+# the incremental ledger matches one rebuilt from scratch
+test_timeline = get_GPA_timeline(test_state_terms)
+rebuild_term_ledger(test_state_terms)
+assert_equal(get_GPA_timeline(test_state_terms), test_timeline)
+# terms are kept in date order, whatever order they are added in
+test_state_term_order = State('kai', 0.0, 4.0, False, [], {})
+append_course(test_state_term_order, 'phys207', '4', '70', 'Spring 2025')
+append_course(test_state_term_order, 'engl110', '3', '65')
+assert_equal(get_cumulative_GPA(test_state_term_order, 'Spring 2025'), 2.0)
+append_course(test_state_term_order, 'cisc108', '3', '95', 'Fall 2023')
+append_course(test_state_term_order, 'math241', '4', '85', 'Winter 2025')
+append_course(test_state_term_order, 'art101', '3', '90', 'Fall 2024')
+assert_equal(test_state_term_order.terms, ['Fall 2023', 'Fall 2024', 'Winter 2025', 'Spring 2025'])
+assert_equal([term for term, _, _, _ in get_GPA_timeline(test_state_term_order)],
+             ['Fall 2023', 'Fall 2024', 'Winter 2025', 'Spring 2025', ''])
+assert_equal(get_cumulative_GPA(test_state_term_order, 'Fall 2023'), 4.0)
+assert_equal(get_cumulative_GPA(test_state_term_order, 'Winter 2025'), 3.6)
+test_timeline = get_GPA_timeline(test_state_term_order)
+rebuild_term_ledger(test_state_term_order)
+assert_equal(get_GPA_timeline(test_state_term_order), test_timeline)
+assert_equal(sorted(['Fall 2024', 'Spring 2024', 'Winter 2025', 'Summer 2024', 'Independent Study'], key=get_term_key),
+             ['Spring 2024', 'Summer 2024', 'Fall 2024', 'Winter 2025', 'Independent Study'])
+assert_equal(
+    view_terms(test_state_terms),
+    Page(
+        state=test_state_terms,
+        content=[
+            'GPA by term:',
+            'Fall 2024: term GPA 4.0 (7 credits), cumulative GPA 4.0',
+            'Fall 2025: term GPA 3.0 (4 credits), cumulative GPA 3.64',
+            'Current term: term GPA 1.0 (3 credits), cumulative GPA 3.07',
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+
+# weighted categories keep running totals; the lowest score can be dropped per category
+test_state_weighted = State(
+    student_name='lee',
+    current_GPA=0.0,
+    target_GPA=4.0,
+    is_failing=True,
+    courses=[Course(course_name='cisc220', credits=3, current_grade=100.0, test_scores=[])],
+    all_test_scores={},
+)
+append_category(test_state_weighted, 'cisc220', 'exams', '60', 'no')
+append_category(test_state_weighted, 'cisc220', 'quizzes', '40', 'yes')
+append_score(test_state_weighted, 'cisc220', '80', 'exams')
+assert_equal(test_state_weighted.courses[0].current_grade, 80.0)
+append_score(test_state_weighted, 'cisc220', '50', 'quizzes')
+assert_equal(test_state_weighted.courses[0].current_grade, 68.0)  # 0.6*80 + 0.4*50
+append_score(test_state_weighted, 'cisc220', '90', 'quizzes')
+assert_equal(test_state_weighted.courses[0].current_grade, 84.0)  # the 50 quiz is dropped
+append_score(test_state_weighted, 'cisc220', '70', 'quizzes')
+assert_equal(test_state_weighted.courses[0].current_grade, 80.0)  # quizzes average (90+70)/2
+assert_equal(test_state_weighted.courses[0].categories['quizzes'].lowest[0], 50.0)
+assert_equal(test_state_weighted.courses[0].test_scores, [80.0, 50.0, 90.0, 70.0])
+assert_equal(test_state_weighted.current_GPA, 3.0)
+assert_equal(
+    append_score(test_state_weighted, 'cisc220', '90', 'labs'),
+    Page(
+        state=test_state_weighted,
+        content=[
+            "'labs' is not a score category of cisc220.",
+            Button('Add Test Score', '/add_test_score'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+assert_equal(test_state_weighted.courses[0].test_scores, [80.0, 50.0, 90.0, 70.0])
+assert_equal(
+    append_category(test_state_weighted, 'cisc220', 'labs', '-5', 'no'),
+    Page(
+        state=test_state_weighted,
+        content=[
+            'Invalid category input. Please try again.',
+            Button('Add Score Category', '/add_category'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+assert_equal(
+    append_category(test_state_weighted, 'cisc999', 'labs', '5', 'no'),
+    Page(
+        state=test_state_weighted,
+        content=[
+            'cisc999 is not one of your courses.',
+            Button('Add Score Category', '/add_category'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+# a course whose scores have no category cannot switch to categories, which would drop those scores
+append_course(test_state_weighted, 'cisc181', '3', '90')
+append_score(test_state_weighted, 'cisc181', '70')
+assert_equal(
+    append_category(test_state_weighted, 'cisc181', 'exams', '50', 'no'),
+    Page(
+        state=test_state_weighted,
+        content=[
+            'cisc181 already has test scores without a category. Categories can only be added before a course\'s first test score.',
+            Button('Add Score Category', '/add_category'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+assert_equal((test_state_weighted.courses[1].categories, test_state_weighted.courses[1].current_grade), ({}, 70.0))
+
+# percentile and distribution queries use the sorted score index
+test_state_distribution = State(
+    student_name='max',
+    current_GPA=0.0,
+    target_GPA=4.0,
+    is_failing=True,
+    courses=[
+        Course(course_name='bio101', credits=4, current_grade=75.0, test_scores=[90.0, 60.0]),
+        Course(course_name='art100', credits=3, current_grade=80.0, test_scores=[80.0]),
+    ],
+    all_test_scores={'bio101': [90.0, 60.0], 'art100': [80.0]},
+)
+assert_equal(get_sorted_scores(test_state_distribution), [60.0, 80.0, 90.0])
+append_score(test_state_distribution, 'bio101', '70')
+append_score(test_state_distribution, 'art100', '100')
+assert_equal(get_sorted_scores(test_state_distribution, 'bio101'), [60.0, 70.0, 90.0])
+assert_equal(get_sorted_scores(test_state_distribution), [60.0, 70.0, 80.0, 90.0, 100.0])
+assert_equal(get_percentile(get_sorted_scores(test_state_distribution), 50), 80.0)
+assert_equal(get_percentile(get_sorted_scores(test_state_distribution), 90), 96.0)
+assert_equal(get_percentile(get_sorted_scores(test_state_distribution, 'bio101'), 25), 65.0)
+assert_equal(get_percentile([], 50), None)
+assert_equal(get_score_rank(get_sorted_scores(test_state_distribution), 85.0), 60.0)
+assert_equal(get_score_rank(get_sorted_scores(test_state_distribution), 100.0), 100.0)
+assert_equal(get_histogram(get_sorted_scores(test_state_distribution)), [0, 1, 1, 1, 2])
+# a direct change to all_test_scores is noticed and the index is rebuilt
+test_state_distribution.all_test_scores['art100'].append(50.0)
+assert_equal(get_sorted_scores(test_state_distribution, 'art100'), [50.0, 80.0, 100.0])
+assert_equal(get_sorted_scores(test_state_distribution), [50.0, 60.0, 70.0, 80.0, 90.0, 100.0])
+assert_equal(
+    view_distribution(test_state_distribution, 'bio101'),
+    Page(
+        state=test_state_distribution,
+        content=[
+            'Test scores for bio101 (3 scores):',
+            'Median: 70.0',
+            '25th/75th/90th percentiles: 65.0, 80.0, 86.0',
+            'Histogram: F 0, D 1, C 1, B 0, A 1',
+            'Show another course:',
+            SelectBox(name='distribution_course', options=['', 'bio101', 'art100']),
+            Button('Show', '/view_distribution'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+
+# cohort comparison: other students' GPAs and grades are kept sorted as they change
+enable_cohort()
+test_cohort_states = [State(name, 0.0, 4.0, False, [], {}) for name in ["ana", "ben", "cy"]]
+for test_cohort_state, test_cohort_grade in zip(test_cohort_states, ['95', '85', '75']):
+    append_course(test_cohort_state, 'math', '3', test_cohort_grade)
+assert_equal(COHORT.gpas, [2.0, 3.0, 4.0])
+assert_equal(COHORT.course_grades[get_course_id('math')], [75.0, 85.0, 95.0])
+assert_equal(COHORT.gpa_histogram, [0, 0, 0, 0, 1, 0, 1, 0, 1])
+assert_equal(get_cohort_standing(test_cohort_states[1]),
+             ['Your GPA is at the 66.7 percentile of 3 students.', 'math: 66.7 percentile of 3 students.'])
+# a grade change moves only that student's entries
+change_grade(test_cohort_states[2], 'math', '99')
+assert_equal(COHORT.gpas, [3.0, 4.0, 4.0])
+assert_equal(COHORT.course_grades[get_course_id('math')], [85.0, 95.0, 99.0])
+assert_equal(COHORT.gpa_histogram, [0, 0, 0, 0, 0, 0, 1, 0, 2])
+delete_course(test_cohort_states[0], 'math')
+assert_equal(COHORT.course_grades[get_course_id('math')], [85.0, 99.0])
+assert_equal(COHORT.course_entries[get_course_id('math')].course_name, 'math')
+assert_equal(get_cohort_standing(test_cohort_states[1])[1], 'math: 50.0 percentile of 2 students.')
+COHORT = None
+assert_equal(get_cohort_standing(test_cohort_states[1]), [])
+
+# approximate mode: scores go into per-course sketches with exact count/sum/min/max
+test_state_sketch = State("Sketch", 0.0, 4.0, False, [Course('stats', 3, 0.0, [80.0])], {'stats': [80.0]})
+enable_approximate_scores(test_state_sketch, k=8)
+assert_equal(test_state_sketch.courses[0].sketch.count, 1)
+for test_sketch_score in range(1, 101):
+    append_score(test_state_sketch, 'stats', str(test_sketch_score))
+test_sketch = test_state_sketch.courses[0].sketch
+assert_equal((test_sketch.count, test_sketch.minimum, test_sketch.maximum), (101, 1.0, 100.0))
+assert_equal(test_state_sketch.courses[0].test_scores, [80.0])
+assert_equal(test_state_sketch.courses[0].current_grade, round((5050 + 80)/101, 2))
+assert_equal(sum(len(level) for level in test_sketch.levels) < 40, True)
+assert_equal(sum(get_sketch_histogram(test_sketch)), 101)
+assert_equal(abs(get_sketch_percentile(test_sketch, 50) - 51) <= 10, True)
+assert_equal(abs(get_sketch_rank(test_sketch, 25.0) - 25) <= 10, True)
+# courses added later are sketched too
+append_course(test_state_sketch, 'logic', '3', '90')
+assert_equal((test_state_sketch.courses[1].sketch.count, test_state_sketch.courses[1].sketch.k), (0, 8))
+# lower levels hold fewer items, so the sketch stays about 3k items however many scores it sees
+test_sketch_big = ScoreSketch(k=30)
+for test_sketch_score in range(100_000):
+    add_to_sketch(test_sketch_big, float(test_sketch_score % 1000))
+assert_equal([get_level_capacity(test_sketch_big, height) for height in range(len(test_sketch_big.levels))][-3:], [14, 20, 30])
+assert_equal(sum(len(level) for level in test_sketch_big.levels) <= 3 * 30 + SKETCH_MIN_CAPACITY * len(test_sketch_big.levels), True)
+assert_equal(abs(get_sketch_percentile(test_sketch_big, 50) - 500) <= 60, True)
+# the all-courses distribution includes sketched scores along with exact ones
+assert_equal(view_distribution(test_state_sketch).content[0], 'Test scores for all courses (101 scores, approximate):')
+test_state_sketch_mixed = State("Mix", 0.0, 4.0, False, [Course('stats', 3, 0.0, []), Course('logic', 3, 0.0, [])], {})
+append_score(test_state_sketch_mixed, 'logic', '40')
+test_state_sketch_mixed.courses[0].sketch = ScoreSketch(k=8)
+append_score(test_state_sketch_mixed, 'stats', '95')
+append_score(test_state_sketch_mixed, 'stats', '85')
+assert_equal(view_distribution(test_state_sketch_mixed).content[:2],
+             ['Test scores for all courses (3 scores, approximate):', 'Mean: 73.33 (lowest 40.0, highest 95.0)'])
+# sketches from two shards merge into one sketch of all the scores
+test_sketch_shards = [ScoreSketch(k=16), ScoreSketch(k=16)]
+for test_sketch_score in range(1000):
+    add_to_sketch(test_sketch_shards[test_sketch_score % 2], float(test_sketch_score))
+test_sketch_merged = merge_sketches(test_sketch_shards[0], test_sketch_shards[1])
+assert_equal((test_sketch_merged.count, test_sketch_merged.minimum, test_sketch_merged.maximum), (1000, 0.0, 999.0))
+assert_equal(test_sketch_merged.total, float(sum(range(1000))))
+assert_equal(abs(get_sketch_percentile(test_sketch_merged, 90) - 900) <= 60, True)
+assert_equal(test_sketch_shards[0].count, 500)
+
+# derived fields are recomputed on read, and only after something they depend on changed
+test_state_derived = State('lee', 0.0, 3.5, False, [], {})
+append_course(test_state_derived, 'hist', '3', '88')
+append_course(test_state_derived, 'geo', '3', '72')
+assert_equal(get_derived(test_state_derived, 'course_extremes')[1].course_name, 'geo')
+assert_equal(get_derived(test_state_derived, 'points_to_target'), 1.0)
+assert_equal(test_state_derived.derived.dirty, {'score_extremes', 'course_names'})
+append_score(test_state_derived, 'geo', '95')
+assert_equal(test_state_derived.derived.dirty, {'course_extremes', 'score_extremes', 'points_to_target', 'course_names'})
+assert_equal(get_derived(test_state_derived, 'course_extremes')[0].course_name, 'geo')
+assert_equal(get_derived(test_state_derived, 'score_extremes'), (('95.0%', 'geo'), ('95.0%', 'geo')))
+# a start_app change to the target only dirties what depends on the GPA
+start_app(test_state_derived, 'lee', '3.5', '4.0')
+assert_equal(test_state_derived.derived.dirty, {'points_to_target', 'course_names'})
+assert_equal(get_derived(test_state_derived, 'points_to_target'), 0.5)
+# deleting a course also deletes its scores
+delete_course(test_state_derived, 'geo')
+assert_equal(test_state_derived.all_test_scores, {})
+assert_equal(get_derived(test_state_derived, 'score_extremes'), ((None, None), (None, None)))
+assert_equal(get_sorted_scores(test_state_derived), [])
+# a grade computed from test scores cannot be overwritten
+append_score(test_state_derived, 'hist', '70')
+assert_equal(
+    change_grade(test_state_derived, 'hist', '99'),
+    Page(
+        state=test_state_derived,
+        content=[
+            'The grade for hist is computed from its test scores. Please add a test score instead.',
+            Button('Add Test Score', '/add_test_score'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+assert_equal(test_state_derived.courses[0].current_grade, 70.0)
+
+# undo reverses each change from what it touched, and redo runs the route again
+test_state_undo = State('uma', 0.0, 4.0, False, [], {})
+append_course(test_state_undo, 'bio', '4', '85', 'Fall 2024')
+append_course(test_state_undo, 'chem', '3', '95')
+append_score(test_state_undo, 'bio', '70')
+append_score(test_state_undo, 'bio', '90')
+assert_equal((test_state_undo.courses[0].current_grade, test_state_undo.current_GPA), (80.0, 3.43))
+undo(test_state_undo)
+assert_equal(test_state_undo.courses[0].test_scores, [70.0])
+assert_equal(test_state_undo.all_test_scores, {'bio': [70.0]})
+assert_equal((test_state_undo.courses[0].current_grade, test_state_undo.current_GPA), (70.0, 2.86))
+undo(test_state_undo)
+assert_equal(test_state_undo.all_test_scores, {})
+assert_equal((test_state_undo.courses[0].current_grade, test_state_undo.current_GPA), (85.0, 3.43))
+redo(test_state_undo)
+redo(test_state_undo)
+assert_equal(test_state_undo.courses[0].test_scores, [70.0, 90.0])
+assert_equal(redo(test_state_undo), Page(test_state_undo, content=['Nothing to redo.', Button('Go to Home', '/index')]))
+# deleting a course and undoing it puts the course and its scores back in place
+delete_course(test_state_undo, 'bio')
+undo(test_state_undo)
+assert_equal([course.course_name for course in test_state_undo.courses], ['bio', 'chem'])
+assert_equal(test_state_undo.all_test_scores, {'bio': [70.0, 90.0]})
+assert_equal(get_sorted_scores(test_state_undo, 'bio'), [70.0, 90.0])
+assert_equal(get_GPA_timeline(test_state_undo), [('Fall 2024', 3.0, 3.0, 4), ('', 4.0, 3.43, 3)])
+# a new change clears the redo list
+change_grade(test_state_undo, 'chem', '75')
+undo(test_state_undo)
+assert_equal(test_state_undo.courses[1].current_grade, 95.0)
+append_course(test_state_undo, 'art', '1', '100', 'Spring 2025')
+assert_equal(test_state_undo.history.undone, [])
+undo(test_state_undo)
+assert_equal(test_state_undo.terms, ['Fall 2024'])
+assert_equal(get_GPA_timeline(test_state_undo), [('Fall 2024', 3.0, 3.0, 4), ('', 4.0, 3.43, 3)])
+# categories, and scores in weighted categories, can be undone too
+append_category(test_state_undo, 'chem', 'labs', '1', 'yes')
+append_score(test_state_undo, 'chem', '60', 'labs')
+undo(test_state_undo)
+assert_equal(test_state_undo.courses[1].categories, {'labs': ScoreCategory(1.0, True)})
+undo(test_state_undo)
+assert_equal(test_state_undo.courses[1].categories, {})
+# history keeps at most MAX_UNDO_LEVELS edits, each holding only what it changed
+for test_undo_score in range(MAX_UNDO_LEVELS + 10):
+    append_score(test_state_undo, 'bio', '80')
+assert_equal(len(test_state_undo.history.done), MAX_UNDO_LEVELS)
+assert_equal(test_state_undo.history.done[-1].inverse, {'score': 80.0, 'category': '', 'changed': [(0, 80.0, False, None)]})
+undo(State('', 0.0, 4.0, False, [], {}))
+
+# batch edits are validated together, applied all at once, and undone as one step
+test_state_batch = State('val', 0.0, 4.0, False, [Course('gym', 1, 100.0, [])], {})
+update_GPA(test_state_batch)
+assert_equal(
+    apply_batch_edits(test_state_batch, "add_course, alg, 3, 80\nadd_score, alg, 90\nadd_score, nope, 90"),
+    Page(
+        state=test_state_batch,
+        content=[
+            'Line 3: there is no course named nope. No edits were applied. Please try again.',
+            Button('Batch Edit', '/batch_edit'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+assert_equal(len(test_state_batch.courses), 1)
+assert_equal(check_batch(test_state_batch, [('delete_course', 'gym'), ('change_grade', 'gym', '90')])[1],
+             'Line 2: there is no course named gym.')
+assert_equal(check_batch(test_state_batch, [('add_score', 'gym', '90'), ('change_grade', 'gym', '90')])[1],
+             'Line 2: the grade for gym is computed from its test scores.')
+assert_equal(check_batch(test_state_batch, [('grade', 'gym')])[1],
+             'Line 1: unknown operation. Use one of: add_course, add_score, change_grade, delete_course.')
+# the GPA totals are computed once for the whole batch
+test_batch_updates = []
+test_batch_GPA_totals = get_GPA_totals
+def test_count_GPA_totals(courses: list[Course]) -> tuple:
+    test_batch_updates.append(len(courses))
+    return test_batch_GPA_totals(courses)
+# (counted through a wrapper that is always put back, so later tests see the real function)
+get_GPA_totals = test_count_GPA_totals
+try:
+    assert_equal(apply_batch(test_state_batch, parse_batch(
+        "add_course, alg, 3, 80, Fall 2024\nadd_score, alg, 90\nadd_score, alg, 100\nchange_grade, gym, 50\n"
+        "add_course, art, 2, 70\ndelete_course, art")), "")
+finally:
+    get_GPA_totals = test_batch_GPA_totals
+assert_equal(test_batch_updates, [2])
+assert_equal([(course.course_name, course.current_grade) for course in test_state_batch.courses],
+             [('gym', 50.0), ('alg', 95.0)])
+assert_equal(test_state_batch.current_GPA, 3.0)
+assert_equal(get_GPA_timeline(test_state_batch), [('Fall 2024', 4.0, 4.0, 3), ('', 0.0, 3.0, 1)])
+assert_equal(get_sorted_scores(test_state_batch), [90.0, 100.0])
+# the same result as applying the edits one at a time
+test_state_batch_single = State('val', 0.0, 4.0, False, [Course('gym', 1, 100.0, [])], {})
+append_course(test_state_batch_single, 'alg', '3', '80', 'Fall 2024')
+append_score(test_state_batch_single, 'alg', '90')
+append_score(test_state_batch_single, 'alg', '100')
+change_grade(test_state_batch_single, 'gym', '50')
+assert_equal(test_state_batch, test_state_batch_single)
+assert_equal(get_suggestions(test_state_batch), get_suggestions(test_state_batch_single))
+undo(test_state_batch)
+assert_equal(test_state_batch, State('val', 4.0, 4.0, False, [Course('gym', 1, 100.0, [])], {}))
+assert_equal(get_GPA_timeline(test_state_batch), [('', 4.0, 4.0, 1)])
+redo(test_state_batch)
+assert_equal(test_state_batch, test_state_batch_single)
+test_batch_done = list(test_state_batch.history.done)
+assert_equal(apply_batch(test_state_batch, []), "")
+assert_equal(list(test_state_batch.history.done), test_batch_done)
+
+# states survive a round trip through the binary format
+test_state_encoded = State('zoe', 3.2, 3.8, False, [], {}, [])
+append_course(test_state_encoded, 'stat200', '3', '88', 'Fall 2024')
+append_course(test_state_encoded, 'phil101', '4', '72')
+append_score(test_state_encoded, 'stat200', '91')
+append_score(test_state_encoded, 'stat200', '84.5')
+append_category(test_state_encoded, 'phil101', 'essays', '2', 'yes')
+append_score(test_state_encoded, 'phil101', '65', 'essays')
+test_state_encoded.courses.append(Course('bad', 'x', None, []))
+assert_equal(decode_state(encode_state(test_state_encoded)), test_state_encoded)
+# scores that are not mirrored by course histories, and sketches, are kept too
+enable_approximate_scores(test_state_encoded, k=4)
+for test_encoded_score in range(20):
+    append_score(test_state_encoded, 'stat200', str(test_encoded_score))
+test_state_encoded.all_test_scores['old'] = [50.0]
+test_state_decoded = decode_state(encode_state(test_state_encoded))
+# (== because bakery's float comparison rejects the infinities of the empty sketch)
+assert_equal(test_state_decoded == test_state_encoded, True)
+assert_equal(test_state_decoded.courses[0].sketch.levels, test_state_encoded.courses[0].sketch.levels)
+assert_equal(test_state_decoded.sketch_k, 4)
+assert_equal(get_GPA_timeline(test_state_decoded), get_GPA_timeline(test_state_encoded))
+assert_equal(encode_state(test_state_decoded) == encode_state(test_state_encoded), True)
+assert_equal(encode_state(test_state_encoded)[:6] == STATE_FORMAT_MAGIC + bytes([STATE_FORMAT_VERSION, 0]), True)
+# version 1 states (without the sketch k) still decode
+test_state_v1 = State('vi', 3.0, 3.5, False, [Course('stat200', 3, 88.0, [88.0])], {'stat200': [88.0]})
+assert_equal(decode_state(STATE_FORMAT_MAGIC + bytes([1, 0]) + encode_state(test_state_v1)[6:]), test_state_v1)
+for test_bad_state_data in [b"", b"JUNK" + encode_state(test_state_encoded)[4:], encode_state(test_state_encoded)[:40],
+                            STATE_FORMAT_MAGIC + bytes([99, 0]) + encode_state(test_state_encoded)[6:]]:
+    try:
+        decode_state(test_bad_state_data)
+        assert_equal("decoded", "ValueError")
+    except ValueError:
+        pass
+
+# with a state directory, every change is saved and a returning student gets their record back
+import tempfile
+with tempfile.TemporaryDirectory() as test_state_dir:
+    STATE_DIR = test_state_dir
+    test_state_saved = State('', 0.0, 4.0, True, [], {})
+    start_app(test_state_saved, 'Quinn', '3.0', '3.5')
+    append_course(test_state_saved, 'econ', '3', '91')
+    assert_equal(sorted(os.listdir(test_state_dir)), ['Quinn.state'])
+    SAVED_STATES.clear()
+    assert_equal(load_saved_state('Quinn'), test_state_saved)
+    undo(test_state_saved)
+    SAVED_STATES.clear()
+    preload_states().join()
+    assert_equal(SAVED_STATES, {'Quinn': test_state_saved})
+    assert_equal(start_app(State('', 0.0, 4.0, True, [], {}), 'Quinn', '0.0', '0.0'), index(test_state_saved))
+    assert_equal(load_saved_state('Nobody'), None)
+    # a copy a request loads (and changes) while the preload is decoding the same file is kept
+    SAVED_STATES.clear()
+    test_state_request = State('Quinn', 3.9, 4.0, False, [], {})
+    test_decode_state = decode_state
+    def test_decode_during_request(data: bytes) -> State:
+        SAVED_STATES['Quinn'] = test_state_request
+        return test_decode_state(data)
+    decode_state = test_decode_during_request
+    try:
+        assert_equal(load_saved_state('Quinn') is test_state_request, True)
+    finally:
+        decode_state = test_decode_state
+STATE_DIR = test_saved_state_dir
+SAVED_STATES.clear()
+
+# the JSON API drives the same validated, undoable changes as the forms
+assert_equal(handle_api_request('POST', '/api/students', b'{"student_name": "Ann Lee", "current_GPA": 3, "target_GPA": 3.5}')[0], 201)
+assert_equal(handle_api_request('POST', '/api/students', b'{"student_name": "R2D2", "current_GPA": 3, "target_GPA": 3.5}'),
+             (400, {'error': 'Please enter a valid name (letters and spaces only).'}))
+assert_equal(handle_api_request('POST', '/api/students/Ann%20Lee/courses',
+                                b'{"course_name": "bio", "credits": 4, "current_grade": 85}')[0], 200)
+assert_equal(handle_api_request('POST', '/api/students/Ann%20Lee/scores',
+                                b'{"scores": [{"course_name": "bio", "score": 95}, {"course_name": "bio", "score": 91}]}'),
+             (202, {'accepted': 2, 'buffered_requests': 1}))
+assert_equal(handle_api_request('GET', '/api/students/Ann%20Lee/gpa'), (200, {'GPA': 4.0, 'is_failing': False}))
+assert_equal(handle_api_request('POST', '/api/students/Ann%20Lee/batch',
+                                b'{"operations": [["add_course", "art", 2, 60], ["change_grade", "art", 75]]}')[1]['GPA'], 3.33)
+assert_equal(handle_api_request('PUT', '/api/students/Ann%20Lee/courses/bio', b'{"grade": 50}'),
+             (400, {'error': 'Line 1: the grade for bio is computed from its test scores.'}))
+assert_equal(handle_api_request('GET', '/api/students/Ann%20Lee'), (200, {
+    'student_name': 'Ann Lee', 'GPA': 3.33, 'target_GPA': 3.5, 'is_failing': False, 'points_to_target': 0.2,
+    'highest_course': {'course_name': 'bio', 'grade': 93.0}, 'lowest_course': {'course_name': 'art', 'grade': 75.0},
+    'highest_score': {'course_name': 'bio', 'score': 95.0}, 'lowest_score': {'course_name': 'bio', 'score': 91.0},
+    'course_count': 2}))
+assert_equal(handle_api_request('DELETE', '/api/students/Ann%20Lee/courses/art')[1]['GPA'], 4.0)
+assert_equal(handle_api_request('GET', '/api/students/Ann%20Lee/courses'), (200, {'courses': [
+    {'course_name': 'bio', 'credits': 4, 'grade': 93.0, 'term': '', 'test_scores': [95.0, 91.0]}]}))
+assert_equal(handle_api_request('GET', '/api/students/Nobody/gpa'), (404, {'error': 'There is no student named Nobody.'}))
+# a name from the path is checked before it can name a file, so it cannot reach outside STATE_DIR
+assert_equal(handle_api_request('GET', '/api/students/..%2F..%2Fetc%2Fsecret/gpa'), (400, {'error': 'Student names are letters and spaces only.'}))
+with tempfile.TemporaryDirectory() as test_state_dir:
+    STATE_DIR = os.path.join(test_state_dir, 'states')
+    try:
+        os.mkdir(STATE_DIR)
+        save_state(State('Eve', 3.0, 3.5, False, [], {}))
+        os.rename(get_state_path('Eve'), os.path.join(test_state_dir, 'Eve' + STATE_FILE_SUFFIX))
+        del SAVED_STATES['Eve']
+        assert_equal((load_saved_state('../Eve'), load_saved_state('Eve')), (None, None))
+    finally:
+        STATE_DIR = test_saved_state_dir
+assert_equal(handle_api_request('POST', '/api/students/Ann%20Lee/scores', b'[1, 2]'),
+             (400, {'error': 'The request body must be a JSON object.'}))
+# a student who already exists is returned unchanged
+assert_equal(handle_api_request('POST', '/api/students', b'{"student_name": "Ann Lee", "current_GPA": 1, "target_GPA": 2}'),
+             (200, handle_api_request('GET', '/api/students/Ann%20Lee')[1]))
+assert_equal(SAVED_STATES['Ann Lee'].target_GPA, 3.5)
+# an unexpected error answers 500
+test_get_progress_stats = get_progress_stats
+def test_failing_progress_stats(state: State) -> dict:
+    raise RuntimeError("broken")
+get_progress_stats = test_failing_progress_stats
+import io
+test_stderr = sys.stderr
+sys.stderr = io.StringIO()
+try:
+    assert_equal(handle_api_request('GET', '/api/students/Ann%20Lee'), (500, {'error': 'Internal server error.'}))
+finally:
+    get_progress_stats = test_get_progress_stats
+    sys.stderr = test_stderr
+# UI routes wait for the lock the API holds, so their changes never interleave
+test_ui_thread = threading.Thread(target=append_course, args=(SAVED_STATES['Ann Lee'], 'chem', '3', '80'))
+with API_LOCK:
+    test_ui_thread.start()
+    test_ui_thread.join(0.1)
+    assert_equal((test_ui_thread.is_alive(), len(SAVED_STATES['Ann Lee'].courses)), (True, 1))
+test_ui_thread.join()
+assert_equal(len(SAVED_STATES['Ann Lee'].courses), 2)
+delete_course(SAVED_STATES['Ann Lee'], 'chem')
+SAVED_STATES.clear()
+
+# past its token bucket, a client's scores are queued (checked first), and past the queue they are refused
+test_rate_limits = (RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, INGESTION_QUEUE_LIMIT, ROUTER_SECRET)
+# held as the server would
+with API_LOCK:
+    RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, INGESTION_QUEUE_LIMIT = 1.0, 2.0, 3
+    try:
+        handle_api_request('POST', '/api/students', b'{"student_name": "Bo", "current_GPA": 3, "target_GPA": 3.5}')
+        handle_api_request('POST', '/api/students/Bo/courses', b'{"course_name": "bio", "credits": 3, "current_grade": 80}')
+        test_scores_body = lambda *scores: json.dumps({"scores": [{"course_name": "bio", "score": score} for score in scores]}).encode()
+        assert_equal(handle_api_request('POST', '/api/students/Bo/scores', test_scores_body(90, 80), 'bot', 0.0)[0], 202)
+        assert_equal(handle_api_request('POST', '/api/students/Bo/scores', test_scores_body(70), 'bot', 0.0),
+                     (202, {'queued': 1, 'queue_depth': 1}))
+        assert_equal(handle_api_request('POST', '/api/students/Bo/scores', test_scores_body(60, 60, 60), 'bot', 0.0),
+                     (429, {'error': 'Too many scores are waiting. Please try again later.', 'retry_after': 1}))
+        assert_equal(handle_api_request('POST', '/api/students/Bo/scores', b'{"course_name": "art", "score": 1}', 'bot', 0.0),
+                     (400, {'error': 'Line 1: there is no course named art.'}))
+        # with scores queued, the client's later scores wait behind them even once its bucket refills; others' do not
+        assert_equal(handle_api_request('POST', '/api/students/Bo/scores', test_scores_body(100), 'bot', 1.0),
+                     (202, {'queued': 1, 'queue_depth': 2}))
+        assert_equal(handle_api_request('POST', '/api/students/Bo/scores', test_scores_body(100), 'student', 1.0),
+                     (202, {'accepted': 1, 'buffered_requests': 2}))
+        assert_equal(handle_api_request('GET', '/api/students/Bo/courses')[1]['courses'][0]['test_scores'], [90.0, 80.0, 100.0])
+        assert_equal(handle_api_request('POST', '/api/students/Bo/scores', test_scores_body(50, 50), 'bot', 1.0)[0], 429)
+        assert_equal(handle_api_request('POST', '/api/students/Bo/scores', test_scores_body(50), 'bot', 1.0)[0], 202)
+        assert_equal(handle_api_request('GET', '/api/ingestion'), (200, {'queued': 3, 'limit': 3, 'dropped': 0}))
+        assert_equal(drain_ingestion_queue(), 3)
+        assert_equal(load_saved_state('Bo').courses[0].test_scores, [90.0, 80.0, 100.0, 70.0, 100.0, 50.0])
+        assert_equal((len(load_saved_state('Bo').history.done), INGESTION.clients), (4, {}))
+        # the scores that waited in the queue were not charged, so the token refilled by 1.0 is still there
+        assert_equal(take_tokens('bot', 1, 1.0), 0.0)
+        handle_api_request('POST', '/api/students/Bo/scores', test_scores_body(10, 10, 10), 'bot', 1.0)
+        handle_api_request('DELETE', '/api/students/Bo/courses/bio')
+        assert_equal((drain_ingestion_queue(), INGESTION.dropped), (3, 3))
+        # a bucket idle long enough to refill is dropped; a busy one is kept
+        RATE_LIMITS.clear()
+        take_tokens('bot', 1, 1.0)
+        take_tokens('student', 1, 2.5)
+        assert_equal(list(RATE_LIMITS), ['bot', 'student'])
+        take_tokens('student', 1, 3.0)
+        assert_equal(list(RATE_LIMITS), ['student'])
+        # only the router, which knows the secret, can name the client
+        ROUTER_SECRET = 'secret'
+        assert_equal([get_client({'X-Client-Id': 'bot'}, '10.0.0.1'),
+                      get_client({'X-Client-Id': 'bot', 'X-Router-Secret': 'guess'}, '10.0.0.1'),
+                      get_client({'X-Client-Id': 'bot', 'X-Router-Secret': 'secret'}, '10.0.0.1')], ['10.0.0.1', '10.0.0.1', 'bot'])
+    finally:
+        RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, INGESTION_QUEUE_LIMIT, ROUTER_SECRET = test_rate_limits
+        RATE_LIMITS.clear()
+        INGESTION.dropped = 0
+        SAVED_STATES.clear()
+
+# a batch averages each scored course once, with the same result as one score at a time
+test_state_one_by_one = State('Cy', 3.0, 3.5, False, [Course('bio', 3, 80.0, []), Course('art', 1, 70.0, [])], {})
+test_state_batched = State('Cy', 3.0, 3.5, False, [Course('bio', 3, 80.0, []), Course('art', 1, 70.0, [])], {})
+for test_score in ['91', '77.5', '88', '100']:
+    append_score(test_state_one_by_one, 'bio', test_score)
+    append_score(test_state_one_by_one, 'art', test_score)
+apply_batch(test_state_batched, [(kind, name, score) for score in ['91', '77.5', '88', '100']
+                                 for kind, name in [('add_score', 'bio'), ('add_score', 'art')]])
+assert_equal([(course.current_grade, course.test_scores) for course in test_state_batched.courses],
+             [(course.current_grade, course.test_scores) for course in test_state_one_by_one.courses])
+assert_equal((test_state_batched.current_GPA, test_state_batched.derived.pending_grades), (test_state_one_by_one.current_GPA, {}))
+undo(test_state_batched)
+assert_equal([(course.current_grade, course.test_scores) for course in test_state_batched.courses],
+             [(80.0, []), (70.0, [])])
+# buffered API scores are applied together by the next read or change, as one batch (one undo step)
+with API_LOCK:
+    try:
+        handle_api_request('POST', '/api/students', b'{"student_name": "Di", "current_GPA": 3, "target_GPA": 3.5}')
+        handle_api_request('POST', '/api/students/Di/courses', b'{"course_name": "bio", "credits": 3, "current_grade": 80}')
+        for test_score in [60, 70, 95]:
+            assert_equal(handle_api_request('POST', '/api/students/Di/scores', json.dumps({"course_name": "bio", "score": test_score}).encode())[0], 202)
+        assert_equal((len(WRITE_BUFFERS['Di']), len(load_saved_state('Di').history.done)), (3, 2))
+        assert_equal(handle_api_request('POST', '/api/students/Di/scores', b'{"course_name": "art", "score": 1}'),
+                     (400, {'error': 'Line 1: there is no course named art.'}))
+        assert_equal(handle_api_request('DELETE', '/api/students/Di/courses/bio')[1]['course_count'], 0)
+        assert_equal(load_saved_state('Di').history.done[-2].arguments, ([('add_score', 'bio', '60'), ('add_score', 'bio', '70'), ('add_score', 'bio', '95')],))
+        assert_equal(WRITE_BUFFERS, {})
+        # UI routes apply the buffer first too, so they see (and come after) every accepted score
+        handle_api_request('POST', '/api/students/Di/courses', b'{"course_name": "art", "credits": 3, "current_grade": 80}')
+        handle_api_request('POST', '/api/students/Di/scores', b'{"course_name": "art", "score": 50}')
+        append_score(load_saved_state('Di'), 'art', '90')
+        assert_equal((load_saved_state('Di').courses[0].test_scores, WRITE_BUFFERS), ([50.0, 90.0], {}))
+        # a buffered score whose course went away meanwhile is dropped, not applied elsewhere
+        handle_api_request('POST', '/api/students/Di/scores', b'{"course_name": "art", "score": 50}')
+        remove_courses(load_saved_state('Di'), 'art')
+        flush_writes('Di')
+        assert_equal((INGESTION.dropped, WRITE_BUFFERS), (1, {}))
+    finally:
+        INGESTION.dropped = 0
+        WRITE_BUFFERS.clear()
+        SAVED_STATES.clear()
+
+# consistent hashing: adding or removing one of N shards moves only about 1/N of the students
+test_students = [f"student {number}" for number in range(2000)]
+test_rings = {count: make_ring([f"shard{number}" for number in range(count)]) for count in [3, 4, 5]}
+test_owners = {count: [find_shard(ring, name) for name in test_students] for count, ring in test_rings.items()}
+assert_equal(all(0.15 < test_owners[4].count(shard) / 2000 < 0.35 for shard in ['shard0', 'shard1', 'shard2', 'shard3']), True)
+assert_equal([new for old, new in zip(test_owners[4], test_owners[5]) if old != new] == ['shard4'] * test_owners[5].count('shard4'), True)
+assert_equal([old for old, new in zip(test_owners[4], test_owners[3]) if old != new] == ['shard3'] * test_owners[4].count('shard3'), True)
+assert_equal(0.1 < test_owners[5].count('shard4') / 2000 < 0.3, True)
+assert_equal(find_shard(make_ring(['shard0']), 'anyone'), 'shard0')
+assert_equal([get_student_key('/api/students/Ann%20Lee/gpa', b''), get_student_key('/api/students', b'{"student_name": "Bo"}'),
+              get_student_key('/api/students', b'oops'), get_student_key('/api/ingestion', b'')], ['Ann Lee', 'Bo', '', ''])
+# a worker releases (after saving) the students a resize gives to other workers
+test_shard_globals = (STATE_DIR, SHARD_NAME)
+with API_LOCK, tempfile.TemporaryDirectory() as test_state_dir:
+    STATE_DIR, SHARD_NAME = test_state_dir, 'shard0'
+    try:
+        for test_name in ['Ann', 'Bo', 'Cy', 'Di', 'Ed']:
+            handle_api_request('POST', '/api/students', json.dumps({"student_name": test_name, "current_GPA": 3, "target_GPA": 3.5}).encode())
+            handle_api_request('POST', f'/api/students/{test_name}/courses', b'{"course_name": "bio", "credits": 3, "current_grade": 80}')
+            handle_api_request('POST', f'/api/students/{test_name}/scores', b'{"course_name": "bio", "score": 100}')
+        test_moved = [name for name in ['Ann', 'Bo', 'Cy', 'Di', 'Ed'] if find_shard(test_rings[3], name) != 'shard0']
+        # only the router may release students, and only a stopping router releases all of them
+        assert_equal(handle_api_request('POST', '/api/shards', b'{"shards": ["shard1"]}'),
+                     (403, {'error': 'Only the shard router can release students.'}))
+        assert_equal(handle_api_request('POST', '/api/shards', b'{}', from_router=True),
+                     (400, {'error': 'shards must be a list of shard names.'}))
+        assert_equal(handle_api_request('POST', '/api/shards', b'{"shards": []}', from_router=True),
+                     (400, {'error': 'shards must not be empty unless the router is stopping.'}))
+        assert_equal(len(SAVED_STATES), 5)
+        assert_equal(handle_api_request('POST', '/api/shards', b'{"shards": ["shard0", "shard1", "shard2"]}', from_router=True),
+                     (200, {'released': test_moved}))
+        assert_equal(sorted(list(SAVED_STATES) + test_moved), ['Ann', 'Bo', 'Cy', 'Di', 'Ed'])
+        assert_equal([load_saved_state(name).courses[0].test_scores for name in test_moved], [[100.0]] * len(test_moved))
+        assert_equal(sorted(handle_api_request('POST', '/api/shards', b'{"shards": [], "stopping": true}', from_router=True)[1]['released']),
+                     ['Ann', 'Bo', 'Cy', 'Di', 'Ed'])
+        assert_equal(SAVED_STATES, {})
+    finally:
+        STATE_DIR, SHARD_NAME = test_shard_globals
+        SAVED_STATES.clear()
+assert_equal(forward_request(ShardRouter({}, {}, make_ring([])), 'POST', '/api/shards', b'{"shards": []}', {})[0], 405)
+
+# workers snapshot the students changed since the last snapshot; replicas serve reads only while current
+test_replica_state = State('Ann', 3.0, 3.5, False, [Course('bio', 3, 91.0, [91.0])], {'bio': [91.0]})
+update_GPA(test_replica_state)
+assert_equal(read_snapshot(make_snapshot([test_replica_state, State('Bo', 2.0, 3.0, False, [], {})])),
+             [test_replica_state, State('Bo', 2.0, 3.0, False, [], {})])
+assert_equal(read_snapshot(b''), [])
+test_replica_globals = (REPLICA_PORTS, REPLICA_MODE)
+REPLICA_PORTS = [1]
+try:
+    save_state(test_replica_state)
+    assert_equal(UNPUBLISHED, {'Ann'})
+    # snapshots are taken under the lock and sent after it is released, in order
+    SAVED_STATES['Ann'] = test_replica_state
+    publish_snapshot()
+    publish_snapshot(final=True)
+    assert_equal([(read_snapshot(data), final) for data, final in SNAPSHOT_OUTBOX], [([test_replica_state], False), ([], True)])
+    SNAPSHOT_OUTBOX.clear()
+    SAVED_STATES.clear()
+    REPLICA_PORTS, REPLICA_MODE = [], True
+    assert_equal(handle_api_request('PUT', '/api/writers', b'{"writers": ["shard0"]}'),
+                 (403, {'error': 'Only the shard router can set the workers.'}))
+    assert_equal(handle_api_request('PUT', '/api/writers', b'{"writers": ["shard0", "shard1"]}', from_router=True),
+                 (200, {'writers': ['shard0', 'shard1']}))
+    assert_equal(handle_api_request('GET', '/api/students/Ann/gpa', now=10.0), (503, {'error': 'This replica is behind.'}))
+    assert_equal(handle_api_request('POST', '/api/snapshots?writer=shard0', make_snapshot([test_replica_state]), now=10.0),
+                 (403, {'error': 'Only the shard workers can send snapshots.'}))
+    assert_equal(SNAPSHOT_TIMES, {})
+    assert_equal(handle_api_request('POST', '/api/snapshots?writer=shard0', make_snapshot([test_replica_state]), now=10.0,
+                                    from_router=True), (200, {'students': 1}))
+    # a worker the replica has not heard from yet still holds it back
+    assert_equal(handle_api_request('GET', '/api/students/Ann/gpa', now=10.1)[0], 503)
+    assert_equal(handle_api_request('POST', '/api/snapshots?writer=shard1', b'', now=10.5, from_router=True), (200, {'students': 0}))
+    assert_equal(handle_api_request('GET', '/api/students/Ann/gpa', now=10.9), (200, {'GPA': 4.0, 'is_failing': False}))
+    assert_equal(handle_api_request('POST', '/api/students/Ann/scores', b'{"course_name": "bio", "score": 10}', now=10.9),
+                 (405, {'error': 'This is a read-only replica.'}))
+    assert_equal(handle_api_request('GET', '/api/students/Ann/gpa', now=11.1)[0], 503)
+    handle_api_request('POST', '/api/snapshots?writer=shard0&final=1', b'', now=11.2, from_router=True)
+    handle_api_request('PUT', '/api/writers', b'{"writers": ["shard1"]}', from_router=True)
+    assert_equal((handle_api_request('GET', '/api/students/Ann/gpa', now=11.3)[0], SNAPSHOT_TIMES), (200, {'shard1': 10.5}))
+finally:
+    REPLICA_PORTS, REPLICA_MODE = test_replica_globals
+    SNAPSHOT_OUTBOX.clear()
+    SNAPSHOT_TIMES.clear()
+    REPLICA_WRITERS.clear()
+    SAVED_STATES.clear()
+
+# alerts are raised on transitions only (once per batch), and delivered as JSON lines
+PENDING_ALERTS.clear()
+test_alert_state = State('', 0.0, 4.0, True, [], {})
+start_app(test_alert_state, 'Eve', '3.0', '3.2')
+append_course(test_alert_state, 'bio', '3', '85')
+assert_equal(list(PENDING_ALERTS), [])
+append_course(test_alert_state, 'art', '3', '50')
+change_grade(test_alert_state, 'art', '65')
+change_grade(test_alert_state, 'art', '68')
+change_grade(test_alert_state, 'art', '55')
+assert_equal([(alert.student_name, alert.kind, alert.GPA) for alert in PENDING_ALERTS],
+             [('Eve', 'failing', 1.5), ('Eve', 'drift', 1.5), ('Eve', 'recovered', 2.0), ('Eve', 'failing', 1.5), ('Eve', 'drift', 1.5)])
+apply_batch(test_alert_state, [('change_grade', 'art', '95'), ('change_grade', 'art', '55')])
+assert_equal(len(PENDING_ALERTS), 5)
+with tempfile.TemporaryDirectory() as test_outbox_dir:
+    ALERT_OUTBOX = os.path.join(test_outbox_dir, 'alerts.jsonl')
+    assert_equal((deliver_alerts(), deliver_alerts(), len(PENDING_ALERTS)), (5, 0, 0))
+    with open(ALERT_OUTBOX) as test_outbox:
+        test_delivered = [json.loads(line) for line in test_outbox]
+    assert_equal([(alert['kind'], alert['GPA'], alert['target_GPA']) for alert in test_delivered][:2],
+                 [('failing', 1.5, 3.2), ('drift', 1.5, 3.2)])
+    ALERT_OUTBOX = os.path.join(test_outbox_dir, 'missing', 'alerts.jsonl')
+    change_grade(test_alert_state, 'art', '95')
+    try:
+        deliver_alerts()
+    except OSError:
+        pass
+    assert_equal([alert.kind for alert in PENDING_ALERTS], ['recovered'])
+    # a failed delivery keeps the newest alerts, raised while it wrote, when there is no room for all of them
+    PENDING_ALERTS = collections.deque(PENDING_ALERTS, maxlen=2)
+    test_take_alerts = take_alerts
+    def take_alerts():
+        taken = test_take_alerts()
+        change_grade(test_alert_state, 'art', '55')
+        return taken
+    try:
+        deliver_alerts()
+    except OSError:
+        pass
+    take_alerts = test_take_alerts
+    assert_equal([alert.kind for alert in PENDING_ALERTS], ['failing', 'drift'])
+    PENDING_ALERTS = collections.deque(PENDING_ALERTS, maxlen=MAX_PENDING_ALERTS)
+    assert_equal(handle_api_request('GET', '/api/alerts'), (404, {'error': 'Alerts are delivered to the alert outbox.'}))
+ALERT_OUTBOX = ""
+# without an outbox, the API hands out the pending alerts
+assert_equal([(alert['student_name'], alert['kind']) for alert in handle_api_request('GET', '/api/alerts')[1]['alerts']],
+             [('Eve', 'failing'), ('Eve', 'drift')])
+assert_equal((handle_api_request('GET', '/api/alerts'), len(PENDING_ALERTS)), ((200, {'alerts': []}), 0))
+
+# the feasibility sweep finds the grade points and uniform grade each student needs for each course load
+test_feasibility_states = [State('Ann', 0.0, 3.5, False, [Course('bio', 3, 95.0, []), Course('art', 3, 75.0, [])], {}),
+                           State('Bo', 0.0, 2.0, False, [Course('bio', 4, 85.0, [])], {}),
+                           State('Cy', 3.0, 3.0, False, [], {}),
+                           State('Di', 0.0, 1.0, False, [Course('gym', 4, 100.0, [])], {})]
+test_feasibility = sweep_target_feasibility(test_feasibility_states, [3, 6, 12])
+assert_equal(get_grade_thresholds(), ([0.0, 1.0, 2.0, 3.0, 4.0], [0, 60, 70, 80, 90]))
+assert_equal(test_feasibility.student_names, ['Ann', 'Bo', 'Cy', 'Di'])
+assert_equal([list(needed) for needed in test_feasibility.needed_points],
+             [[4.5, 0.666667, 3.0, 0.0], [4.0, 1.333333, 3.0, 0.0], [3.75, 1.666667, 3.0, 0.0]])
+assert_equal(test_feasibility.minimum_grades, [[None, 60, 80, 0], [90, 70, 80, 0], [90, 70, 80, 0]])
+# Ann reaches her target exactly with 6 more credits at the minimum grade
+assert_equal(sweep_what_if_grades(test_feasibility_states[0], 'new', [90], 6), [3.5])
+assert_equal(sweep_target_feasibility([], [3]), FeasibilitySweep([], [3], [array.array("d")], [[]]))
+
+# retention: long score histories and old terms are archived to disk, and their grades stay exact
+test_retention_globals = (STATE_DIR, MAX_SCORES_PER_COURSE, ARCHIVE_AFTER_TERMS, MEMORY_CEILING_BYTES)
+with API_LOCK, tempfile.TemporaryDirectory() as test_memory_dir:
+    STATE_DIR, MAX_SCORES_PER_COURSE = test_memory_dir, 3
+    try:
+        test_state_memory = State('', 0.0, 4.0, True, [], {})
+        start_app(test_state_memory, 'Mo', '3.0', '3.5')
+        append_course(test_state_memory, 'bio', '3', '80')
+        for test_score in ['80', '90', '100']:
+            append_score(test_state_memory, 'bio', test_score)
+        assert_equal((test_state_memory.courses[0].test_scores, test_state_memory.all_test_scores),
+                     ([80.0, 90.0, 100.0], {'bio': [80.0, 90.0, 100.0]}))
+        test_memory_before = measure_state(test_state_memory)
+        append_score(test_state_memory, 'bio', '70')
+        assert_equal((test_state_memory.courses[0].test_scores, test_state_memory.all_test_scores), ([], {}))
+        assert_equal((test_state_memory.courses[0].sketch.count, test_state_memory.courses[0].current_grade), (4, 85.0))
+        # the scores added before the archive cannot be undone, but the earlier changes still can
+        assert_equal([edit.route for edit in test_state_memory.history.done], ['start_app', 'append_course'])
+        append_score(test_state_memory, 'bio', '100')
+        assert_equal((test_state_memory.courses[0].current_grade, test_state_memory.current_GPA), (88.0, 3.0))
+        # the highest and lowest scores include the archived ones, from the sketch
+        assert_equal(get_derived(test_state_memory, 'score_extremes'), (('100.0%', 'bio'), ('70.0%', 'bio')))
+        with open(get_archive_path('Mo')) as test_archive:
+            assert_equal([json.loads(line) for line in test_archive], [{'course': 'bio', 'term': '', 'scores': [80.0, 90.0, 100.0, 70.0]}])
+        assert_equal(measure_state(test_state_memory)['scores'] < test_memory_before['scores'], True)
+        assert_equal(load_saved_state('Mo'), test_state_memory)
+        # a course whose term falls out of the most recent ARCHIVE_AFTER_TERMS is archived
+        MAX_SCORES_PER_COURSE, ARCHIVE_AFTER_TERMS = 0, 1
+        append_course(test_state_memory, 'alg', '3', '80', 'Fall 2024')
+        append_score(test_state_memory, 'alg', '90')
+        assert_equal(test_state_memory.courses[1].test_scores, [90.0])
+        append_course(test_state_memory, 'chem', '4', '75', 'Spring 2025')
+        assert_equal((test_state_memory.courses[1].test_scores, test_state_memory.courses[1].current_grade), ([], 90.0))
+        assert_equal(test_state_memory.current_GPA, 2.9)
+        assert_equal([edit.route for edit in test_state_memory.history.done][-3:], ['append_score', 'append_course', 'append_course'])
+        undo(test_state_memory)
+        assert_equal((len(test_state_memory.courses), test_state_memory.current_GPA), (2, 3.5))
+        redo(test_state_memory)
+        assert_equal(test_state_memory.current_GPA, 2.9)
+        # terms age by date, not by when they were added: an older term added later is archived
+        test_state_terms = State('', 0.0, 4.0, True, [], {})
+        start_app(test_state_terms, 'Te', '3.0', '3.5')
+        append_course(test_state_terms, 'chem', '4', '75', 'Spring 2025')
+        append_score(test_state_terms, 'chem', '80')
+        append_course(test_state_terms, 'alg', '3', '80', 'Fall 2023')
+        append_score(test_state_terms, 'alg', '90')
+        assert_equal([(course.term, course.test_scores) for course in test_state_terms.courses],
+                     [('Spring 2025', [80.0]), ('Fall 2023', [])])
+        SAVED_STATES.pop('Te', None)
+        ARCHIVE_AFTER_TERMS = 0
+        # a batch that also added or deleted courses cannot be dropped alone, so older steps go with it
+        test_state_edits = State('Fo', 3.0, 3.5, False, [], {})
+        test_state_edits.history.done.extend([
+            Edit('append_course', ('bio', '3', '80', ''), {}),
+            Edit('apply_batch', ([('add_course', 'art', '3', '80'), ('add_score', 'bio', '90')],), {}),
+            Edit('change_grade', ('art', '85'), {}),
+            Edit('apply_batch', ([('add_score', 'bio', '70')],), {}),
+            Edit('append_score', ('art', '90', ''), {})])
+        forget_score_edits(test_state_edits, {'bio'})
+        assert_equal([(edit.route, edit.arguments) for edit in test_state_edits.history.done],
+                     [('change_grade', ('art', '85')), ('append_score', ('art', '90', ''))])
+
+        # the memory check flags a student who keeps growing without edits, and keeps to the ceiling
+        test_state_memory_small = State('', 0.0, 4.0, True, [], {})
+        start_app(test_state_memory_small, 'Lu', '2.0', '3.0')
+        append_course(test_state_memory_small, 'art', '1', '70')
+        MEMORY_RECORDS.clear()
+        for test_check in range(LEAK_CHECKS + 1):
+            test_memory_report = check_memory()
+            test_state_memory.derived.values[test_check] = [0.0] * 100
+        assert_equal((test_memory_report['students'], test_memory_report['suspected_leaks'], test_memory_report['released']),
+                     (2, ['Mo'], []))
+        assert_equal([student['student_name'] for student in test_memory_report['largest']], ['Mo', 'Lu'])
+        # /debug/memory serves the last check as it was, without measuring (or releasing) anything itself
+        assert_equal(handle_api_request('GET', '/debug/memory'), (200, test_memory_report))
+        assert_equal(handle_api_request('GET', '/debug/memory')[1]['suspected_leaks'], ['Mo'])
+        append_score(test_state_memory, 'chem', '75')
+        assert_equal(check_memory()['suspected_leaks'], [])
+        MEMORY_CEILING_BYTES = MEMORY_RECORDS['Lu'].total + 1
+        test_memory_report = check_memory()
+        assert_equal((test_memory_report['released'], list(SAVED_STATES), list(MEMORY_RECORDS)), (['Mo'], ['Lu'], ['Lu']))
+        assert_equal(load_saved_state('Mo'), test_state_memory)
+    finally:
+        STATE_DIR, MAX_SCORES_PER_COURSE, ARCHIVE_AFTER_TERMS, MEMORY_CEILING_BYTES = test_retention_globals
+        MEMORY_RECORDS.clear()
+        MEMORY_REPORTS.clear()
+        SAVED_STATES.clear()
+# undo keeps a copy of a sketch only when the score compacts it, and otherwise its exact statistics
+test_state_sketch_undo = State('Sy', 0.0, 4.0, False, [Course('stats', 3, 0.0, [])], {})
+enable_approximate_scores(test_state_sketch_undo, k=2)
+append_score(test_state_sketch_undo, 'stats', '70')
+test_sketch_before = copy_sketch(test_state_sketch_undo.courses[0].sketch)
+append_score(test_state_sketch_undo, 'stats', '90')
+append_score(test_state_sketch_undo, 'stats', '80')
+assert_equal([type(edit.inverse['changed'][0][3]).__name__ for edit in test_state_sketch_undo.history.done],
+             ['tuple', 'tuple', 'ScoreSketch'])
+undo(test_state_sketch_undo)
+undo(test_state_sketch_undo)
+assert_equal((test_state_sketch_undo.courses[0].sketch, test_state_sketch_undo.courses[0].current_grade),
+             (test_sketch_before, 70.0))
+
+# every course with a name shares the catalog's copy of it
+test_catalog_states = [decode_state(encode_state(State(name, 0.0, 4.0, False, [Course('cisc' + '181', 3, 90.0, []), Course('pottery', 2, 80.0, [])], {})))
+                       for name in ['Al', 'Bea']]
+test_catalog_courses = [course for test_catalog_state in test_catalog_states for course in test_catalog_state.courses]
+assert_equal([course.course_name for course in test_catalog_courses], ['cisc181', 'pottery', 'cisc181', 'pottery'])
+assert_equal(test_catalog_courses[0].course_name is test_catalog_courses[2].course_name is Course('cisc' + '181', 3, 90.0, []).course_name, True)
+assert_equal(test_catalog_courses[0].course_id == test_catalog_courses[2].course_id != test_catalog_courses[1].course_id, True)
+assert_equal(COURSE_CATALOG.by_id[test_catalog_courses[0].course_id].course_name, 'cisc181')
+assert_equal(Course(None, 3, 90.0, []).course_id, None)
+# canonical credits are only what set_catalog_credits sets, never whatever a student entered first
+assert_equal((get_catalog_credits('cisc181'), get_catalog_credits('not a course')), (None, None))
+set_catalog_credits('weaving', 4)
+append_course(test_catalog_states[0], 'weaving', '3', '85')
+append_course(test_catalog_states[1], 'weaving', '2', '85')
+assert_equal((get_catalog_credits('weaving'), test_catalog_states[0].courses[-1].credits), (4, 3))
+try:
+    set_catalog_credits('weaving', MAX_CREDITS + 1)
+except ValueError as test_error:
+    assert_equal(str(test_error), 'Credits must be a whole number from 0 to 100.')
+assert_equal(get_catalog_credits('weaving'), 4)
+# an entry no course holds leaves the catalog, unless it has canonical credits
+test_catalog_course = Course('glassblowing', 3, 90.0, [])
+test_catalog_id = test_catalog_course.course_id
+assert_equal('glassblowing' in COURSE_CATALOG.by_name, True)
+del test_catalog_course
+assert_equal(('glassblowing' in COURSE_CATALOG.by_name, test_catalog_id in COURSE_CATALOG.by_id), (False, False))
+assert_equal(Course('glassblowing', 3, 90.0, []).course_id == test_catalog_id, False)
+set_catalog_credits('lapidary', 2)
+assert_equal((get_catalog_credits('lapidary'), 'lapidary' in COURSE_CATALOG.by_name), (2, True))
+set_catalog_credits('lapidary', None)
+assert_equal(('lapidary' in COURSE_CATALOG.by_name, COURSE_CATALOG.pinned.keys() == {get_course_id('weaving')}), (False, True))
+set_catalog_credits('weaving', None)
+# the course choices are built once per change to the courses, not on every page
+assert_equal(update_grade(test_catalog_states[0]).content[1].options, ['cisc181', 'pottery', 'weaving'])
+test_catalog_options = test_catalog_states[0].derived.values['course_names']
+assert_equal(add_test_score(test_catalog_states[0]).content[1].options, ['cisc181', 'pottery', 'weaving'])
+assert_equal(test_catalog_states[0].derived.values['course_names'] is test_catalog_options, True)
+delete_course(test_catalog_states[0], 'pottery')
+assert_equal(update_grade(test_catalog_states[0]).content[1].options, ['cisc181', 'weaving'])
+undo(test_catalog_states[0])
+apply_batch(test_catalog_states[0], [('add_course', 'bio', '3', '70')])
+assert_equal(add_test_score(test_catalog_states[0]).content[1].options, ['cisc181', 'pottery', 'weaving', 'bio'])
+
+# a student with no credited courses has a 0.0 GPA and is failing
+test_state_no_credits = State('zed', 3.5, 4.0, False, [Course('a', 0, 50.0, [])], {})
+update_GPA(test_state_no_credits)
+assert_equal((test_state_no_credits.current_GPA, test_state_no_credits.is_failing), (0.0, True))
+test_state_no_credits = State('zed', 0.0, 4.0, True, [Course('seminar', 0, 95.0, [])], {})
+append_course(test_state_no_credits, 'bio', '3', '95')
+assert_equal(test_state_no_credits.is_failing, False)
+delete_course(test_state_no_credits, 'bio')
+assert_equal((test_state_no_credits.current_GPA, test_state_no_credits.is_failing), (0.0, True))
+
+# credits are capped when they are validated, so every course can be saved
+test_state_big_credits = State('Cy', 0.0, 4.0, True, [], {})
+assert_equal(
+    append_course(test_state_big_credits, 'big', '99999999999', '90'),
+    Page(
+        state=test_state_big_credits,
+        content=[
+            'Credits must be a whole number from 1 to 100.',
+            Button('Add Course', '/add_course'),
+            Button('Go to Home', '/index'),
+        ],
+    ),
+)
+assert_equal(apply_batch(test_state_big_credits, [('add_course', 'big', '101', '90')]), 'Line 1: invalid course input.')
+assert_equal(test_state_big_credits.courses, [])
+test_state_big_credits.courses.append(Course('typo', 10**12, 90.0, []))
+test_state_big_credits.courses.append(Course('over', 500, 90.0, []))
+assert_equal([course.valid_credits for course in test_state_big_credits.courses], [False, False])
+update_GPA(test_state_big_credits)
+assert_equal(test_state_big_credits.current_GPA, 0.0)
+assert_equal([(course.credits, course.valid_credits) for course in decode_state(encode_state(test_state_big_credits)).courses],
+             [(None, False), (500, False)])
+
 start_server(
     State(
         "",